@@ -146,6 +146,13 @@ def add_ai_cog(bot, cog_properties):
     xai_api_key = check_and_get_property(cog_properties, "ai", "xaiAPIKey")
     ai_system_prompt = check_and_get_property(cog_properties, "ai", "systemPrompt")
     postgres_url = cog_properties.get("postgresDbUrl")
+    # Leave AI_STREAM_RESPONSES in charge unless the config sets it; !ENV values
+    # arrive as strings, so "false" must not read as truthy.
+    options = {}
+    if cog_properties.get("streamResponses") is not None:
+        options["stream_responses"] = (
+            str(cog_properties["streamResponses"]).lower() == "true"
+        )
     bot.add_cog(
         AI(
             bot,
@@ -158,5 +165,6 @@ def add_ai_cog(bot, cog_properties):
             xai_api_key,
             ai_system_prompt,
             postgres_url,
+            **options,
         )
     )
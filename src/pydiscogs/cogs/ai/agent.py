@@ -1,28 +1,279 @@
+import asyncio
+import json
 import logging
+import time
 from typing import Literal
 
 from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately, get_buffer_string
 from langchain_core.runnables import RunnableConfig
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import END, START, MessagesState, StateGraph
+from langgraph.store.base import SearchOp
 
+from .circuit_breaker import ProviderError
+from .hedging import FirstTokenHandler
 from .tools.memory_tool import UpsertMemoryTool
 
 logger = logging.getLogger(__name__)
 
+# Seconds a single tool call may run before it is cancelled
+DEFAULT_TOOL_TIMEOUT = 120.0
+TOOL_TIMEOUTS = {
+    "upsert_memory": 30.0,
+}
 
-def build_agent_graph(llm, tools, system_prompt: str, checkpointer=None, store=None):
+# Threads whose stored messages exceed this many tokens get summarized after a
+# reply, keeping roughly the most recent SUMMARY_KEEP_TOKENS worth of turns.
+SUMMARY_TOKEN_BUDGET = 4000
+SUMMARY_KEEP_TOKENS = 1500
+# Approximate cost of one image; base64 payloads would otherwise dominate counts
+IMAGE_TOKENS = 258
+# Longest slice of a single message passed to the summarizer
+SUMMARY_MAX_MESSAGE_CHARS = 4000
+
+
+class State(MessagesState):
+    summary: str
+    # Whether the latest reply was given with the user's own memories in context
+    personalized: bool
+
+
+async def retrieve_memories(
+    store, query: str, user_id: str, guild_id: str = None, channel_id: str = None
+) -> list[str]:
+    """
+    Searches the user, guild and channel memory scopes in a single store batch,
+    so the query is embedded once and all scopes share one round trip. Results
+    are merged and ordered by similarity score.
+    """
+    scopes = [("User", user_id), ("Guild", guild_id), ("Channel", channel_id)]
+    scopes = [(label, scope_id) for label, scope_id in scopes if scope_id]
+
+    results = await store.abatch(
+        [
+            SearchOp(namespace_prefix=(scope_id, "memories"), query=query, limit=3)
+            for _, scope_id in scopes
+        ]
+    )
+
+    ranked = sorted(
+        (
+            (item.score or 0.0, label, item)
+            for (label, _), items in zip(scopes, results)
+            for item in items
+        ),
+        key=lambda entry: entry[0],
+        reverse=True,
+    )
+    return [
+        f"[{label}] {item.key}: {item.value.get('data')}" for _, label, item in ranked
+    ]
+
+
+def count_message_tokens(messages) -> int:
+    """Approximate token count that charges images a flat rate instead of their bytes."""
+    total = 0
+    for message in messages:
+        if isinstance(message.content, list):
+            blocks = [
+                block
+                for block in message.content
+                if not (isinstance(block, dict) and block.get("type") == "image_url")
+            ]
+            total += IMAGE_TOKENS * (len(message.content) - len(blocks))
+            message = message.model_copy(update={"content": blocks})
+        total += count_tokens_approximately([message])
+    return total
+
+
+def needs_summary(messages, token_budget: int = SUMMARY_TOKEN_BUDGET) -> bool:
+    return count_message_tokens(messages) > token_budget
+
+
+def _summary_split(messages, keep_tokens: int) -> int:
+    """
+    Index of the first message to keep. Starts from roughly keep_tokens of recent
+    history and snaps to a human turn so no tool result loses its tool call.
+    """
+    kept = 0
+    split = len(messages)
+    while split > 0:
+        kept += count_message_tokens([messages[split - 1]])
+        if kept > keep_tokens:
+            break
+        split -= 1
+
+    for index in range(split, len(messages)):
+        if isinstance(messages[index], HumanMessage):
+            return index
+    for index in range(split - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return index
+    return 0
+
+
+def _format_for_summary(messages) -> str:
+    lines = []
+    for message in messages:
+        line = get_buffer_string([message])
+        if len(line) > SUMMARY_MAX_MESSAGE_CHARS:
+            line = line[:SUMMARY_MAX_MESSAGE_CHARS] + " ... [truncated]"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+async def summarize_messages(
+    llm,
+    state,
+    config: RunnableConfig = None,
+    token_budget: int = SUMMARY_TOKEN_BUDGET,
+    keep_tokens: int = SUMMARY_KEEP_TOKENS,
+) -> dict:
+    """
+    Returns a state update that folds older turns into the running summary and
+    removes them, or an empty update if the thread is within its token budget.
+    Only the removed turns are sent to the LLM alongside the existing summary.
+    """
+    summary = state.get("summary", "")
+    messages = state["messages"]
+
+    if not needs_summary(messages, token_budget):
+        return {}
+
+    split = _summary_split(messages, keep_tokens)
+    to_summarize = messages[:split]
+    if not to_summarize:
+        return {}
+
+    prompt = (
+        "Extend the running summary of this conversation with the new lines below. "
+        "Keep important facts, decisions and context, and stay concise.\n\n"
+        f"Current summary: {summary or '(none)'}\n\n"
+        f"New lines:\n{_format_for_summary(to_summarize)}"
+    )
+
+    # We use the same LLM for summarization for simplicity
+    response = await llm.ainvoke([HumanMessage(content=prompt)], config)
+    new_summary = response.content
+
+    # Delete the summarized messages
+    delete_messages = [RemoveMessage(id=m.id) for m in to_summarize]
+
+    return {"summary": new_summary, "messages": delete_messages}
+
+
+def build_system_prompt(system_prompt: str = None) -> str:
+    """Combines the configured system prompt and memory instructions into one message."""
+    full_system_prompt = ""
+
+    if system_prompt:
+        full_system_prompt += f"{system_prompt}\n\n"
+
+    full_system_prompt += (
+        "### MEMORY CAPABILITIES ###\n"
+        "You are equipped with a long-term memory. You have access to the 'upsert_memory' tool to persist information.\n"
+        "WHEN TO USE IT:\n"
+        "1. User explicitly asks you to remember something (e.g., 'Remember that the WiFi password is 1234').\n"
+        "2. User provides a significant fact that should be known later (e.g., 'Our staging server IP is 10.0.0.50').\n"
+        "3. You learn a user preference (e.g., 'I only code in Python').\n\n"
+        "HOW TO USE IT:\n"
+        "- For user-specific facts/preferences: scope='user', key='preference_name', value='preference_value'\n"
+        "- For server/guild-wide facts (e.g. IPs, rules, schedules): scope='guild', key='fact_name', value='fact_value'\n"
+        "- For channel-specific context: scope='channel', key='context_name', value='context_value'\n\n"
+        "IMPORTANT: Do NOT say you cannot remember things. You CAN. Just use the tool."
+    )
+    return full_system_prompt
+
+
+def build_agent_graph(
+    llm,
+    tools,
+    system_prompt: str,
+    checkpointer=None,
+    store=None,
+    tool_timeouts: dict[str, float] = None,
+    prompt_cache=None,
+    health=None,
+    hedge=None,
+):
     """
     Builds a LangGraph state graph with ReAct agent logic, conversation summarization,
-    and cross-thread long-term memory.
+    and cross-thread long-term memory. system_prompt is used as-is; see
+    build_system_prompt. When a prompt_cache is given, the static prompt and tool
+    declarations are served from it instead of being sent with every call.
+    If health is given, each model call reports its latency or failure to it
+    via record_success/record_failure; failed calls raise ProviderError. If hedge
+    is given, the model call answering a new user message goes through
+    hedge(call, fallback_call) so a slow provider can be raced against another;
+    see RequestHedger.race. Calls that follow tool results are not hedged.
     """
+    tool_timeouts = {**TOOL_TIMEOUTS, **(tool_timeouts or {})}
+
+    async def invoke_llm(
+        runnable, messages, config, report_failure=True, tracker=health
+    ):
+        start = time.monotonic()
+        try:
+            response = await runnable.ainvoke(messages, config)
+        except Exception as e:
+            if tracker and report_failure:
+                tracker.record_failure(e)
+            # Lets the handler tell provider failures apart from bugs
+            raise ProviderError(f"{e!r}") from e
+        if tracker:
+            tracker.record_success(time.monotonic() - start)
+        return response
+
+    def bind_tools(model, run_tools):
+        try:
+            return model.bind_tools(run_tools)
+        except Exception as e:
+            # Fallback if LLM doesn't support binding (e.g. some Ollama models?)
+            logger.warning(f"Tool binding FAILED: {e}")
+            return model
+
+    async def invoke_first(
+        runnable,
+        messages,
+        config,
+        inline_messages,
+        run_tools,
+        report_failure=True,
+        hedged=True,
+    ):
+        if not hedge or not hedged:
+            return await invoke_llm(runnable, messages, config, report_failure)
+
+        async def call(on_token):
+            return await invoke_llm(
+                runnable.with_config(callbacks=[FirstTokenHandler(on_token)]),
+                messages,
+                config,
+                report_failure,
+            )
 
-    # Define the State
-    class State(MessagesState):
-        summary: str
+        async def fallback_call(fallback_llm, fallback_health):
+            # Only the primary streams to the user, so a losing hedge can't
+            # interleave its tokens with the reply
+            return await invoke_llm(
+                bind_tools(fallback_llm, run_tools).with_config(tags=[TAG_NOSTREAM]),
+                inline_messages,
+                config,
+                tracker=fallback_health,
+            )
+
+        return await hedge(call, fallback_call)
 
     # Define Nodes
     async def call_model(state: State, config: RunnableConfig):
         messages = state["messages"]
+        # Only the call answering a new message is hedged. Calls after tool
+        # results would have a second provider redo the turn's work.
+        first_call = isinstance(messages[-1], HumanMessage)
+        # Per-turn context (summary, memories) that changes between calls
+        context = []
+        personalized = False
 
         # Cross-Thread Memory Retrieval
         # Cross-Thread Semantic Memory Retrieval
@@ -49,67 +300,21 @@ def build_agent_graph(llm, tools, system_prompt: str, checkpointer=None, store=N
                     break
 
             if user_id and query:
-                memories = []
-                # User Scope
-                user_mems = await store.asearch(
-                    (user_id, "memories"), query=query, limit=3
+                memories = await retrieve_memories(
+                    store, query, user_id, guild_id, channel_id
                 )
-                for m in user_mems:
-                    memories.append(f"[User] {m.key}: {m.value.get('data')}")
-
-                # Guild Scope
-                if guild_id:
-                    guild_mems = await store.asearch(
-                        (guild_id, "memories"), query=query, limit=3
-                    )
-                    for m in guild_mems:
-                        memories.append(f"[Guild] {m.key}: {m.value.get('data')}")
-
-                # Channel Scope
-                if channel_id:
-                    channel_mems = await store.asearch(
-                        (channel_id, "memories"), query=query, limit=3
-                    )
-                    for m in channel_mems:
-                        memories.append(f"[Channel] {m.key}: {m.value.get('data')}")
 
                 if memories:
+                    personalized = any(m.startswith("[User]") for m in memories)
                     memory_content = "\n".join(memories)
-                    memory_system_msg = f"Relevant memories:\n{memory_content}"
-                    messages = [SystemMessage(content=memory_system_msg)] + messages
+                    context.append(f"Relevant memories:\n{memory_content}")
 
-        # If there is a summary, prepend it to the messages
+        # If there is a summary, put it ahead of the memories
         summary = state.get("summary", "")
         if summary:
-            # Add summary as system message context
-            system_message = f"Summary of conversation earlier: {summary}"
-            messages = [SystemMessage(content=system_message)] + messages
-
-        # Combine System Prompt and Memory Instruction into one cohesive message
-        full_system_prompt = ""
-
-        if system_prompt:
-            full_system_prompt += f"{system_prompt}\n\n"
-
-        full_system_prompt += (
-            "### MEMORY CAPABILITIES ###\n"
-            "You are equipped with a long-term memory. You have access to the 'upsert_memory' tool to persist information.\n"
-            "WHEN TO USE IT:\n"
-            "1. User explicitly asks you to remember something (e.g., 'Remember that the WiFi password is 1234').\n"
-            "2. User provides a significant fact that should be known later (e.g., 'Our staging server IP is 10.0.0.50').\n"
-            "3. You learn a user preference (e.g., 'I only code in Python').\n\n"
-            "HOW TO USE IT:\n"
-            "- For user-specific facts/preferences: scope='user', key='preference_name', value='preference_value'\n"
-            "- For server/guild-wide facts (e.g. IPs, rules, schedules): scope='guild', key='fact_name', value='fact_value'\n"
-            "- For channel-specific context: scope='channel', key='context_name', value='context_value'\n\n"
-            "IMPORTANT: Do NOT say you cannot remember things. You CAN. Just use the tool."
-        )
-
-        # Inject the unified system message
-        messages = [SystemMessage(content=full_system_prompt)] + messages
+            context.insert(0, f"Summary of conversation earlier: {summary}")
 
         # Bind tools including UpsertMemory if store is available
-        bound_llm = llm
 
         # active_tools = list(tools)
         if store:
@@ -157,54 +362,66 @@ def build_agent_graph(llm, tools, system_prompt: str, checkpointer=None, store=N
                 mem_tool = UpsertMemoryTool(store, user_id, guild_id, channel_id)
                 run_tools.append(mem_tool)
 
-        try:
-            bound_llm = llm.bind_tools(run_tools)
-        except Exception as e:
-            # Fallback if LLM doesn't support binding (e.g. some Ollama models?)
-            logger.warning(f"Tool binding FAILED: {e}")
-            bound_llm = llm
-
-        response = await bound_llm.ainvoke(messages, config)
-        return {"messages": [response]}
+        # Inject the static system prompt ahead of the per-turn context
+        inline_messages = [
+            SystemMessage(content=text) for text in [system_prompt, *context] if text
+        ] + messages
+
+        cache_name = await prompt_cache.get(run_tools) if prompt_cache else None
+        if cache_name:
+            # The cache holds the system prompt and tool declarations, and Gemini
+            # rejects system instructions next to cached content, so per-turn
+            # context travels as a leading user message instead
+            cached_messages = messages
+            if context:
+                cached_messages = [
+                    HumanMessage(content="\n\n".join(context))
+                ] + messages
+            try:
+                # A rejected cache is retried inline, so it isn't held against
+                # the provider's health
+                response = await invoke_first(
+                    llm.bind(cached_content=cache_name),
+                    cached_messages,
+                    config,
+                    inline_messages,
+                    run_tools,
+                    report_failure=False,
+                    hedged=first_call,
+                )
+                return {"messages": [response], "personalized": personalized}
+            except Exception as e:
+                logger.warning(f"Cached prompt call failed, sending inline: {e}")
+                prompt_cache.invalidate(cache_name)
+
+            # Not hedged; the hedge already had its chance on the cached call
+            response = await invoke_llm(
+                bind_tools(llm, run_tools), inline_messages, config
+            )
+            return {"messages": [response], "personalized": personalized}
+
+        response = await invoke_first(
+            bind_tools(llm, run_tools),
+            inline_messages,
+            config,
+            inline_messages,
+            run_tools,
+            hedged=first_call,
+        )
+        return {"messages": [response], "personalized": personalized}
 
     async def summarize_conversation(state: State, config: RunnableConfig):
-        # Logic to summarize the conversation
-        summary = state.get("summary", "")
-        messages = state["messages"]
-
-        # We'll keep the last 2 messages and summarize the rest
-        if len(messages) > 6:
-            to_summarize = messages[:-2]
-
-            # Create a prompt for the summarization
-            prompt = f"Distill the following conversation into a concise summary. Include important facts and context.\n\nCurrent summary: {summary}\n\nNew lines: {to_summarize}"
-
-            # Call LLM to generate summary
-            # We use the same LLM for summarization for simplicity
-            response = await llm.ainvoke([HumanMessage(content=prompt)], config)
-            new_summary = response.content
-
-            # Delete the summarized messages
-            delete_messages = [RemoveMessage(id=m.id) for m in to_summarize]
-
-            return {"summary": new_summary, "messages": delete_messages}
-        return {}
+        return await summarize_messages(llm, state, config)
 
     def should_continue(
         state: State,
-    ) -> Literal["tools", "summarize_conversation", END]:
-        messages = state["messages"]
-        last_message = messages[-1]
+    ) -> Literal["tools", END]:
+        last_message = state["messages"][-1]
 
         if last_message.tool_calls:
             return "tools"
 
-        # Check if we should summarize (e.g., if message count > 6)
-        # Note: The 'summarize_conversation' node logic handles the splitting,
-        # but we trigger it here.
-        if len(messages) > 6:
-            return "summarize_conversation"
-
+        # Summarization runs after the reply is sent, see AIHandler
         return END
 
     # Build Graph
@@ -226,50 +443,59 @@ def build_agent_graph(llm, tools, system_prompt: str, checkpointer=None, store=N
     # Handle "upsert_memory" tool call MANUALLY in a separate node?
     # OR: use a custom function for the "tools" node.
 
+    # Base tools map
+    tool_map = {t.name: t for t in tools}
+
+    async def run_tool_call(tool_call, config: RunnableConfig):
+        tool_name = tool_call["name"]
+        # Handle namespacing if present (e.g. default_api:upsert_memory)
+        if ":" in tool_name:
+            tool_name = tool_name.split(":")[-1]
+
+        args = tool_call["args"]
+        result = {
+            "tool_call_id": tool_call["id"],
+            "role": "tool",
+            "name": tool_name,
+        }
+
+        if tool_name == "upsert_memory" and store:
+            # Handle memory tool specifically to inject user_id/guild_id/channel_id
+            configurable = config.get("configurable", {})
+            user_id = configurable.get("user_id")
+            guild_id = configurable.get("guild_id")
+            channel_id = configurable.get("channel_id")
+
+            if not user_id:
+                return {**result, "content": "Error: No user_id found in config."}
+            tool = UpsertMemoryTool(store, user_id, guild_id, channel_id)
+        elif tool_name in tool_map:
+            tool = tool_map[tool_name]
+        else:
+            return {**result, "content": f"Error: Tool {tool_name} not found."}
+
+        timeout = tool_timeouts.get(tool_name, DEFAULT_TOOL_TIMEOUT)
+        try:
+            output = await asyncio.wait_for(tool.ainvoke(args, config), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool {tool_name} timed out after {timeout}s")
+            error = {"error": "timeout", "tool": tool_name, "timeout_seconds": timeout}
+            return {**result, "content": json.dumps(error), "status": "error"}
+        except Exception as e:
+            logger.error(f"Tool {tool_name} failed: {e}", exc_info=True)
+            error = {"error": type(e).__name__, "tool": tool_name, "message": str(e)}
+            return {**result, "content": json.dumps(error), "status": "error"}
+
+        return {**result, "content": str(output)}
+
     async def run_tools(state: State, config: RunnableConfig):
+        # Tool calls from one model turn are independent, so run them together.
+        # gather preserves tool_call order in the results.
         tool_calls = state["messages"][-1].tool_calls
-        results = []
-
-        # Base tools map
-        tool_map = {t.name: t for t in tools}
-
-        for tool_call in tool_calls:
-            tool_name = tool_call["name"]
-            # Handle namespacing if present (e.g. default_api:upsert_memory)
-            if ":" in tool_name:
-                tool_name = tool_name.split(":")[-1]
-
-            args = tool_call["args"]
-            tool_call_id = tool_call["id"]
-
-            output = None
-            if tool_name == "upsert_memory" and store:
-                # Handle memory tool specifically to inject user_id/guild_id/channel_id
-                configurable = config.get("configurable", {})
-                user_id = configurable.get("user_id")
-                guild_id = configurable.get("guild_id")
-                channel_id = configurable.get("channel_id")
-
-                if user_id:
-                    mem_tool = UpsertMemoryTool(store, user_id, guild_id, channel_id)
-                    output = await mem_tool.ainvoke(args)
-                else:
-                    output = "Error: No user_id found in config."
-            elif tool_name in tool_map:
-                # Run standard tool
-                output = await tool_map[tool_name].ainvoke(args)
-            else:
-                output = f"Error: Tool {tool_name} not found."
-
-            results.append(
-                {
-                    "tool_call_id": tool_call_id,
-                    "role": "tool",
-                    "name": tool_name,
-                    "content": str(output),
-                }
-            )
-        return {"messages": results}
+        results = await asyncio.gather(
+            *(run_tool_call(tool_call, config) for tool_call in tool_calls)
+        )
+        return {"messages": list(results)}
 
     workflow.add_node("tools", run_tools)
     workflow.add_node("summarize_conversation", summarize_conversation)
@@ -282,6 +508,8 @@ def build_agent_graph(llm, tools, system_prompt: str, checkpointer=None, store=N
     )
 
     workflow.add_edge("tools", "agent")
+    # Not reachable from START; background summaries are written to the checkpoint
+    # with aupdate_state(..., as_node="summarize_conversation")
     workflow.add_edge("summarize_conversation", END)
 
     return workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,113 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    Semantic cache of final answers. A question whose embedding is at least
+    `threshold` cosine-similar to one answered in the same scope (guild and
+    channel) within `ttl` seconds gets the earlier answer without running the
+    agent. Each scope keeps its `max_entries` most recently used answers. Stats
+    are logged at info level every `stats_interval` lookups.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        threshold: float = 0.95,
+        ttl: float = 3600,
+        max_entries: int = 200,
+        stats_interval: int = 100,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats_interval = stats_interval
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._scopes = {}
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    async def lookup(self, question: str, scope) -> tuple[str | None, list | None]:
+        """
+        Returns the cached answer, or None, along with the question's embedding
+        so put() can reuse it. Both are None if the question couldn't be embedded.
+        """
+        try:
+            vector = await self.embeddings.aembed_query(self.normalize(question))
+        except Exception as e:
+            logger.warning(f"Answer cache: embedding failed, skipping cache: {e}")
+            self.errors += 1
+            return None, None
+        vector = self._unit(vector)
+
+        entries = self._scopes.get(scope)
+        best_key, best_score = None, self.threshold
+        now = time.monotonic()
+        for key, (expires_at, cached_vector, _) in list((entries or {}).items()):
+            if expires_at <= now:
+                del entries[key]
+                continue
+            score = sum(a * b for a, b in zip(vector, cached_vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        if best_key is None:
+            self.misses += 1
+            self._log_stats()
+            return None, vector
+        self.hits += 1
+        entries.move_to_end(best_key)
+        logger.info(f"Answer cache: hit for {question!r} (similarity {best_score:.3f})")
+        self._log_stats()
+        return entries[best_key][2], vector
+
+    def put(self, scope, question: str, vector: list, answer: str):
+        """Caches an answer under the embedding lookup() returned for the question."""
+        key = self.normalize(question)
+        entries = self._scopes.setdefault(scope, OrderedDict())
+        entries[key] = (time.monotonic() + self.ttl, vector, answer)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def evict(self, scope=None) -> int:
+        """Drops the answers cached for one scope, or for all scopes. Returns the count."""
+        if scope is None:
+            count = sum(len(entries) for entries in self._scopes.values())
+            self._scopes.clear()
+        else:
+            count = len(self._scopes.pop(scope, {}))
+        if count:
+            logger.info(f"Answer cache: evicted {count} answers")
+        return count
+
+    def _log_stats(self):
+        lookups = self.hits + self.misses
+        log = logger.info if lookups % self.stats_interval == 0 else logger.debug
+        log(f"Answer cache stats: {self.stats()}")
+
+    @staticmethod
+    def _unit(vector) -> list:
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "scopes": len(self._scopes),
+            "entries": sum(len(entries) for entries in self._scopes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
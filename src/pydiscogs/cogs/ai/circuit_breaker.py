@@ -0,0 +1,165 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """A model call failed at the provider or on the way to it."""
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one LLM provider from its recent calls. The breaker opens
+    when too many of the last `window` calls failed or ran slower than
+    slow_call_seconds, stays open for open_seconds, then lets a single probe
+    through (half-open) and closes again if the probe succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 4,
+        open_seconds: float = 30.0,
+        slow_call_seconds: float = 20.0,
+        latency_alpha: float = 0.2,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.latency_alpha = latency_alpha
+        self.latency_ewma = None
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_started_at = None
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.open_seconds
+        ):
+            self._state = self.HALF_OPEN
+            self._probe_started_at = None
+        return self._state
+
+    @property
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @property
+    def degraded(self) -> bool:
+        """True when the provider is still usable but trending towards opening."""
+        return self.failure_rate >= self.failure_rate_threshold / 2 or (
+            self.latency_ewma is not None
+            and self.latency_ewma > self.slow_call_seconds / 2
+        )
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        # Half-open: one probe at a time, re-armed if a probe never reports back
+        now = time.monotonic()
+        if self._probe_started_at is None or (
+            now - self._probe_started_at >= self.open_seconds
+        ):
+            self._probe_started_at = now
+            return True
+        return False
+
+    def record_success(self, latency: float):
+        self.latency_ewma = (
+            latency
+            if self.latency_ewma is None
+            else self.latency_alpha * latency
+            + (1 - self.latency_alpha) * self.latency_ewma
+        )
+        if latency > self.slow_call_seconds:
+            logger.info(f"{self.name}: slow call ({latency:.1f}s)")
+            self._record(False)
+        else:
+            self._record(True)
+
+    def record_failure(self, error: Exception = None):
+        logger.info(f"{self.name}: call failed: {error!r}")
+        self._record(False)
+
+    def _record(self, ok: bool):
+        state = self.state
+        if state == self.HALF_OPEN:
+            self._probe_started_at = None
+            if ok:
+                logger.info(f"{self.name}: probe succeeded, closing circuit")
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                self._outcomes.append(True)
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(ok)
+        if (
+            state == self.CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and self.failure_rate >= self.failure_rate_threshold
+        ):
+            self._open()
+
+    def _open(self):
+        logger.warning(
+            f"{self.name}: opening circuit for {self.open_seconds}s "
+            f"(failure rate {self.failure_rate:.0%})"
+        )
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate, 3),
+            "latency_ewma": (
+                round(self.latency_ewma, 3) if self.latency_ewma is not None else None
+            ),
+            "calls": len(self._outcomes),
+        }
+
+
+def rank_providers(breakers: dict[str, CircuitBreaker]) -> list[str]:
+    """
+    Orders providers for the next request. Open circuits are left out. Healthy
+    and half-open providers come first in configured order, so a recovering
+    provider gets its probe instead of waiting behind the others, then degraded
+    ones by failure rate and latency. If every circuit is open, all providers
+    are returned in configured order as a last resort.
+    """
+    order = list(breakers)
+
+    def health(name):
+        breaker = breakers[name]
+        if breaker.state == CircuitBreaker.HALF_OPEN or not breaker.degraded:
+            return (0, 0.0, 0.0, order.index(name))
+        return (
+            1,
+            breaker.failure_rate,
+            breaker.latency_ewma or 0.0,
+            order.index(name),
+        )
+
+    candidates = [name for name in order if breakers[name].state != breakers[name].OPEN]
+    ranked = sorted(candidates, key=health)
+    return ranked or order
@@ -1,45 +1,121 @@
+import asyncio
 import base64
 import contextlib
+import functools
 import io
 import logging
 import os
 import textwrap
+import time
+from typing import Any
 
 import discord
 from discord.ext import commands
-from httpx import ConnectError
-from langchain_core.messages import HumanMessage
+from httpx import TransportError
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_groq import ChatGroq
 from langchain_ollama import ChatOllama
 from langgraph.store.base import IndexConfig
 
-from .agent import build_agent_graph
+from .agent import (
+    SUMMARY_KEEP_TOKENS,
+    SUMMARY_TOKEN_BUDGET,
+    build_agent_graph,
+    build_system_prompt,
+    needs_summary,
+    summarize_messages,
+)
+from .answer_cache import AnswerCache
+from .circuit_breaker import CircuitBreaker, ProviderError, rank_providers
+from .embedding_cache import EmbeddingCache
+from .hedging import RequestHedger
+from .images import ImagePipeline
+from .prompt_cache import GeminiPromptCache
+from .reply_index import ReplyRootIndex
+from .scheduler import AIQueueFullError, AIRequestScheduler
 
 # from .tools.computer_control import ComputerControlTool
+from .tools.result_cache import ToolResultCache
 from .tools.url_context import UrlContextTool
 from .tools.web_research import WebResearchTool
 from .tools.xai_research import XResearchTool
 
 logger = logging.getLogger(__name__)
 
+BUSY_MESSAGE = "I'm handling too many requests right now, please try again shortly."
+
+
+def queue_notifier(send_response_fn, destination):
+    """Builds an on_queued callback that tells the user their place in line."""
+
+    async def notify(position: int):
+        await send_response_fn(
+            destination, f"You're #{position} in line, I'll get to you shortly."
+        )
+
+    return notify
+
 
 class GoogleGenerativeAIEmbeddingsWithDims(GoogleGenerativeAIEmbeddings):
+    # Force dims to 768 to avoid HNSW limit (2000)
+    output_dims: int = 768
+    # Optional EmbeddingCache; the sync methods only use its in-process tier
+    cache: Any = None
+
     def embed_documents(self, texts, **kwargs):
-        # Force dims to 768 to avoid HNSW limit (2000)
-        return super().embed_documents(texts, output_dimensionality=768)
+        return self._embed_cached(texts, "document", super().embed_documents)
 
     def embed_query(self, text, **kwargs):
-        # Force dims to 768 to avoid HNSW limit (2000)
-        return super().embed_query(text, output_dimensionality=768)
+        embed = super().embed_query
+        return self._embed_cached(
+            [text], "query", lambda texts, **kw: [embed(texts[0], **kw)]
+        )[0]
 
     async def aembed_documents(self, texts, **kwargs):
-        # Force dims to 768 to avoid HNSW limit (2000)
-        return await super().aembed_documents(texts, output_dimensionality=768)
+        return await self._aembed_cached(texts, "document", super().aembed_documents)
 
     async def aembed_query(self, text, **kwargs):
-        # Force dims to 768 to avoid HNSW limit (2000)
-        return await super().aembed_query(text, output_dimensionality=768)
+        embed = super().aembed_query
+
+        async def embed_one(texts, **kw):
+            return [await embed(texts[0], **kw)]
+
+        return (await self._aembed_cached([text], "query", embed_one))[0]
+
+    # Store batches embed every query text together, and the memory search sends
+    # the same query once per scope, so identical texts are only embedded once.
+    def _embed_cached(self, texts, task, embed):
+        unique = list(dict.fromkeys(texts))
+        keys = self._cache_keys(unique, task)
+        found = self.cache.get_many(list(keys.values())) if self.cache else {}
+        missing = [text for text in unique if keys[text] not in found]
+        if missing:
+            vectors = embed(missing, output_dimensionality=self.output_dims)
+            new = {keys[text]: vector for text, vector in zip(missing, vectors)}
+            if self.cache:
+                self.cache.put_many(new)
+            found.update(new)
+        return [found[keys[text]] for text in texts]
+
+    async def _aembed_cached(self, texts, task, embed):
+        unique = list(dict.fromkeys(texts))
+        keys = self._cache_keys(unique, task)
+        found = await self.cache.aget_many(list(keys.values())) if self.cache else {}
+        missing = [text for text in unique if keys[text] not in found]
+        if missing:
+            vectors = await embed(missing, output_dimensionality=self.output_dims)
+            new = {keys[text]: vector for text, vector in zip(missing, vectors)}
+            if self.cache:
+                await self.cache.aput_many(new)
+            found.update(new)
+        return [found[keys[text]] for text in texts]
+
+    def _cache_keys(self, texts, task):
+        return {
+            text: EmbeddingCache.make_key(self.model, self.output_dims, task, text)
+            for text in texts
+        }
 
 
 class AI(commands.Cog):
@@ -55,6 +131,7 @@ class AI(commands.Cog):
         xai_api_key: str = os.getenv("XAI_API_KEY"),
         ai_system_prompt: str = os.getenv("AI_SYSTEM_PROMPT"),
         postgres_url: str = os.getenv("POSTGRES_DB_URL"),
+        stream_responses: bool = os.getenv("AI_STREAM_RESPONSES") == "true",
     ):
         self.ai_handler = AIHandler(
             ollama_endpoint,
@@ -67,17 +144,30 @@ class AI(commands.Cog):
             ai_system_prompt,
             postgres_url,
         )
+        self.stream_responses = stream_responses
+        self.image_pipeline = ImagePipeline()
+        self.reply_index = ReplyRootIndex(
+            max_entries=int(os.getenv("AI_REPLY_INDEX_SIZE", "10000"))
+        )
         self.bot = bot
 
+    def cog_unload(self):
+        self.bot.loop.create_task(self.ai_handler.close())
+
     @staticmethod
-    async def send_response(destination, response: str):
+    def chunk_response(response: str) -> list[str]:
+        """Split a response into chunks that fit in a single Discord message."""
         wrapper = textwrap.TextWrapper(
             width=2000,
             break_long_words=True,
             replace_whitespace=False,
             break_on_hyphens=False,
         )
-        chunks = wrapper.wrap(response)
+        return wrapper.wrap(response)
+
+    @staticmethod
+    async def send_response(destination, response: str):
+        chunks = AI.chunk_response(response)
 
         if not chunks:
             return
@@ -105,6 +195,33 @@ class AI(commands.Cog):
         else:
             raise TypeError(f"Unsupported destination type: {type(destination)}")
 
+    @staticmethod
+    async def send_streaming_response(
+        destination, stream, edit_interval: float = 1.0
+    ) -> str:
+        """
+        Renders an AIHandler.call_stream generator into Discord. A placeholder is
+        posted straight away and then edited as text arrives.
+        """
+        reply = StreamingReply(destination, edit_interval=edit_interval)
+        await reply.start()
+        text = ""
+        async for text in stream:
+            await reply.update(text)
+        await reply.finish(text)
+        return text
+
+    async def _respond(self, destination, input: str, **call_kwargs):
+        """Runs the AI handler and delivers its answer to the destination."""
+        call_kwargs["on_queued"] = queue_notifier(self.send_response, destination)
+        if self.stream_responses:
+            await self.send_streaming_response(
+                destination, self.ai_handler.call_stream(input, **call_kwargs)
+            )
+        else:
+            response = await self.ai_handler.call(input, **call_kwargs)
+            await self.send_response(destination, response)
+
     @commands.slash_command()
     async def ask_ai(
         self,
@@ -113,14 +230,9 @@ class AI(commands.Cog):
         attachment: discord.Attachment = None,
     ):
         await ctx.defer()
-        images = []
-        if (
-            attachment
-            and attachment.content_type
-            and attachment.content_type.startswith("image/")
-        ):
-            images.append((await attachment.read(), attachment.content_type))
-        response = await self.ai_handler.call(
+        images = await self.image_pipeline.read([attachment] if attachment else [])
+        await self._respond(
+            ctx.followup,
             input,
             images=images,
             thread_id=str(ctx.interaction.id),
@@ -129,7 +241,30 @@ class AI(commands.Cog):
             channel_id=str(ctx.channel_id) if ctx.channel_id else None,
         )
 
-        await self.send_response(ctx.followup, response)
+    @commands.slash_command()
+    @discord.default_permissions(manage_messages=True)
+    async def ai_answer_cache(
+        self, ctx: discord.ApplicationContext, clear: bool = False
+    ):
+        """Shows the AI answer cache's hit rate; clear drops this channel's answers."""
+        stats = self.ai_handler.answer_cache_stats()
+        if stats is None:
+            await ctx.respond("The answer cache is off.", ephemeral=True)
+            return
+        lines = []
+        if clear:
+            count = self.ai_handler.clear_cached_answers(
+                guild_id=str(ctx.guild_id) if ctx.guild_id else None,
+                channel_id=str(ctx.channel_id) if ctx.channel_id else None,
+            )
+            lines.append(f"Cleared {count} cached answers in this channel.")
+            stats = self.ai_handler.answer_cache_stats()
+        lines.append(
+            f"Hit rate {stats['hit_rate']:.1%} ({stats['hits']} hits, "
+            f"{stats['misses']} misses, {stats['errors']} errors); "
+            f"{stats['entries']} answers cached in {stats['scopes']} channels."
+        )
+        await ctx.respond("\n".join(lines), ephemeral=True)
 
     @commands.message_command(name="AI Reply")
     async def ai_reply(self, ctx, message: discord.Message):
@@ -141,6 +276,9 @@ class AI(commands.Cog):
             images=images,
             send_response_fn=self.send_response,
             get_root_message_fn=self._get_root_message,
+            stream_response_fn=(
+                self.send_streaming_response if self.stream_responses else None
+            ),
         )
         await ctx.send_modal(modal)
 
@@ -148,7 +286,8 @@ class AI(commands.Cog):
     async def ai(self, ctx, *, input: str):
         images = await self._get_images_from_message(ctx.message)
         thread_id = await self._get_root_message(ctx.message)
-        response = await self.ai_handler.call(
+        await self._respond(
+            ctx,
             input,
             images=images,
             thread_id=thread_id,
@@ -156,15 +295,24 @@ class AI(commands.Cog):
             guild_id=str(ctx.guild.id) if ctx.guild else None,
             channel_id=str(ctx.channel.id) if ctx.channel else None,
         )
-        await self.send_response(ctx, response)
 
     async def _get_root_message(self, message: discord.Message) -> str:
         if not message.reference:
-            return str(message.id)
-
-        # Traverse up the chain
+            root_id = str(message.id)
+            # Indexed so that replies to this message, including our own, resolve
+            # without fetching it
+            await self.reply_index.put_many({root_id: root_id})
+            return root_id
+
+        # Traverse up the chain, stopping at the first ancestor the index knows
+        visited = [str(message.id)]
         current_msg = message
+        root_id = None
         while current_msg.reference:
+            parent_id = str(current_msg.reference.message_id)
+            root_id = await self.reply_index.get(parent_id)
+            if root_id:
+                break
             try:
                 if current_msg.reference.cached_message:
                     current_msg = current_msg.reference.cached_message
@@ -178,55 +326,61 @@ class AI(commands.Cog):
                         # Fallback if channel not found, return current message id as best effort root?
                         # Or maybe the reference ID itself if we can't fetch it?
                         # Reference object has message_id.
-                        return str(current_msg.reference.message_id)
+                        # Not indexed, so a later walk can still reach the real root
+                        return parent_id
             except (discord.NotFound, discord.HTTPException):
-                # If we can't find the parent, break and use current or reference ID.
-                # Using the reference message_id is safer as "the oldest known ancestor"
-                return str(current_msg.reference.message_id)
+                # If we can't find the parent, use the reference ID as "the oldest
+                # known ancestor". Not indexed: a transient error must not pin the
+                # chain to it
+                return parent_id
+            visited.append(str(current_msg.id))
+        else:
+            root_id = str(current_msg.id)
 
-        return str(current_msg.id)
+        await self.reply_index.put_many({message_id: root_id for message_id in visited})
+        return root_id
 
     async def _get_images_from_message(
-        self, message: discord.Message
+        self, message: discord.Message, *more_messages: discord.Message
     ) -> list[tuple[bytes, str]]:
-        images = []
-        for attachment in message.attachments:
-            if attachment.content_type and attachment.content_type.startswith("image/"):
-                images.append((await attachment.read(), attachment.content_type))
-        return images
+        """Reads, downscales and dedupes the image attachments of the messages."""
+        attachments = [
+            attachment
+            for msg in (message, *more_messages)
+            for attachment in msg.attachments
+        ]
+        return await self.image_pipeline.read(attachments)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        # Index replies whose chain is already known, including the bot's own
+        # replies, so follow-ups resolve their thread without API calls
+        self.reply_index.record(message)
+
         # Ignore messages sent by the bot itself
         if message.author.id == self.bot.user.id:
             return
 
         # Check if the bot was mentioned in the message
         if self.bot.user in message.mentions:
-            images = await self._get_images_from_message(message)
-            # If the referenced message has images, we might want to include them?
-            # The new memory system will handle text history.
-            # For images in history, LangGraph *can* keep them in state if configured,
-            # but for now let's assume we just want current message images + maybe simple current-reply context if we were keeping "replied_to" logic.
-            # User instruction: "Remove the manual 'replied_to_message' injection"
-            # So we rely on memory for text context. Images from previous turns should theoretically be in memory if we persist them.
-            # But currently `get_images_from_message` was also looking at the replied-to message.
-            # I'll keep the image extension logic just in case the user wants "images from the guy I'm replying to" to be visible immediately as input for THIS turn.
-
+            # Images from the message being replied to are included as input for
+            # this turn; the pipeline dedupes anything that appears in both.
+            replied_to = []
             if message.reference:
                 try:
-                    replied_to_message = await message.channel.fetch_message(
-                        message.reference.message_id
-                    )
-                    images.extend(
-                        await self._get_images_from_message(replied_to_message)
+                    replied_to.append(
+                        await message.channel.fetch_message(
+                            message.reference.message_id
+                        )
                     )
                 except Exception:
                     pass
+            images = await self._get_images_from_message(message, *replied_to)
 
             thread_id = await self._get_root_message(message)
 
-            response = await self.ai_handler.call(
+            await self._respond(
+                message,
                 message.content,
                 images=images,
                 thread_id=thread_id,
@@ -234,13 +388,15 @@ class AI(commands.Cog):
                 guild_id=str(message.guild.id) if message.guild else None,
                 channel_id=str(message.channel.id) if message.channel else None,
             )
-            await self.send_response(message, response)
 
     @commands.Cog.listener()
     async def on_ready(self):
         """Called when the bot is ready. Initializes the AI handler."""
         logger.info("AI cog: bot is ready, initializing AI handler...")
         await self.ai_handler.initialize()
+        if self.ai_handler.pool:
+            self.reply_index.pool = self.ai_handler.pool
+            await self.reply_index.setup()
 
     # Allow other listeners and commands to process the message
     # await self.bot.process_commands(message)
@@ -255,6 +411,7 @@ class AIReplyModal(discord.ui.Modal):
         images=None,
         send_response_fn,
         get_root_message_fn,
+        stream_response_fn=None,
         **kwargs,
     ) -> None:
         super().__init__(*args, **kwargs)
@@ -263,6 +420,7 @@ class AIReplyModal(discord.ui.Modal):
         self.images = images
         self.send_response = send_response_fn
         self.get_root_message = get_root_message_fn
+        self.stream_response = stream_response_fn
         self.add_item(
             discord.ui.InputText(label="Prompt", style=discord.InputTextStyle.long)
         )
@@ -272,17 +430,84 @@ class AIReplyModal(discord.ui.Modal):
 
         thread_id = await self.get_root_message(self.original_message)
 
-        response = await self.ai_handler.call(
-            self.children[0].value,
+        call_kwargs = dict(
             images=self.images,
             thread_id=thread_id,
             user_id=str(interaction.user.id),
             guild_id=str(interaction.guild_id) if interaction.guild_id else None,
             channel_id=str(interaction.channel_id) if interaction.channel_id else None,
+            on_queued=queue_notifier(self.send_response, interaction.followup),
         )
+        if self.stream_response:
+            await self.stream_response(
+                interaction.followup,
+                self.ai_handler.call_stream(self.children[0].value, **call_kwargs),
+            )
+            return
+
+        response = await self.ai_handler.call(self.children[0].value, **call_kwargs)
         await self.send_response(interaction.followup, response)
 
 
+class StreamingReply:
+    """
+    Progressively renders a growing reply into Discord. Edits are rate limited and
+    text past the 2000 character limit rolls over into follow-up messages.
+    """
+
+    PLACEHOLDER = "\u2026"
+
+    def __init__(self, destination, edit_interval: float = 1.0):
+        self.destination = destination
+        self.edit_interval = edit_interval
+        self.messages = []
+        self._rendered = []
+        self._last_edit = 0.0
+
+    async def start(self):
+        """Posts the placeholder message."""
+        self.messages.append(await self._send(self.PLACEHOLDER, first=True))
+        self._rendered.append(self.PLACEHOLDER)
+        self._last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        """Renders the latest snapshot if the edit interval has elapsed."""
+        if time.monotonic() - self._last_edit < self.edit_interval:
+            return
+        await self._render(text)
+
+    async def finish(self, text: str):
+        """Renders the final text regardless of the edit interval."""
+        await self._render(text or "Sorry, I couldn't parse the response.")
+
+    async def _render(self, text: str):
+        chunks = AI.chunk_response(text)
+        if not chunks:
+            return
+        for i, chunk in enumerate(chunks):
+            if i < len(self.messages):
+                if self._rendered[i] != chunk:
+                    await self.messages[i].edit(content=chunk)
+                    self._rendered[i] = chunk
+            else:
+                self.messages.append(await self._send(chunk, first=False))
+                self._rendered.append(chunk)
+        self._last_edit = time.monotonic()
+
+    async def _send(self, content: str, first: bool):
+        destination = self.destination
+        if isinstance(destination, discord.Message):
+            if first:
+                return await destination.reply(content)
+            return await destination.channel.send(content)
+        elif isinstance(destination, commands.Context):
+            return await destination.send(content)
+        elif isinstance(destination, discord.Webhook):
+            # wait=True so the webhook returns a message we can edit later
+            return await destination.send(content, wait=True)
+        raise TypeError(f"Unsupported destination type: {type(destination)}")
+
+
 class AIHandler:
     def __init__(
         self,
@@ -295,6 +520,8 @@ class AIHandler:
         xai_api_key: str = None,
         ai_system_prompt: str = None,
         postgres_url: str = None,
+        max_concurrency: int = None,
+        max_queue_depth: int = None,
     ):
         self.ollama_endpoint = ollama_endpoint or os.getenv("OLLAMA_ENDPOINT")
         self.ollama_llm_model = ollama_llm_model or os.getenv("OLLAMA_LLM_MODEL")
@@ -315,6 +542,29 @@ class AIHandler:
         self.checkpointer = None
         self.store = None
         self.pool = None
+        self.embedding_cache = None
+        self.tool_cache = ToolResultCache(
+            max_entries=int(os.getenv("AI_TOOL_CACHE_SIZE", "256"))
+        )
+
+        self.scheduler = AIRequestScheduler(
+            max_concurrency=max_concurrency
+            or int(os.getenv("AI_MAX_CONCURRENCY", "4")),
+            max_queue_depth=max_queue_depth
+            or int(os.getenv("AI_MAX_QUEUE_DEPTH", "20")),
+        )
+
+        # Conversation summaries are built in the background after the reply is
+        # sent. Turns that arrive within summary_delay share one summarization.
+        self.summary_delay = float(os.getenv("AI_SUMMARY_DELAY", "5"))
+        self.summary_token_budget = int(
+            os.getenv("AI_SUMMARY_TOKEN_BUDGET", str(SUMMARY_TOKEN_BUDGET))
+        )
+        self.summary_keep_tokens = int(
+            os.getenv("AI_SUMMARY_KEEP_TOKENS", str(SUMMARY_KEEP_TOKENS))
+        )
+        self.summary_tasks = {}
+        self.summary_pending = set()
 
         if not any([self.ollama_endpoint, self.groq_api_key, self.google_api_key]):
             raise ValueError(
@@ -323,6 +573,43 @@ class AIHandler:
 
         self.tools = self.__get_tools()
 
+        # The static system prompt is assembled once. Gemini serves it, and the
+        # tool declarations, from a context cache; other providers get it inline.
+        self.system_prompt = build_system_prompt(self.ai_system_prompt)
+        self.prompt_cache = None
+        prompt_cache_ttl = int(os.getenv("AI_PROMPT_CACHE_TTL", "3600"))
+        if self.google_api_key and self.google_llm_model and prompt_cache_ttl > 0:
+            self.prompt_cache = GeminiPromptCache(
+                api_key=self.google_api_key,
+                model=self.google_llm_model,
+                system_prompt=self.system_prompt,
+                ttl=prompt_cache_ttl,
+            )
+
+        # Opt-in: a model call that misses its provider's p95 first-token latency
+        # is duplicated to the healthiest other provider and the first answer wins
+        self.hedger = None
+        if os.getenv("AI_HEDGE_REQUESTS") == "true":
+            self.hedger = RequestHedger(
+                self.__hedge_fallback,
+                percentile=float(os.getenv("AI_HEDGE_PERCENTILE", "0.95")),
+                default_delay=float(os.getenv("AI_HEDGE_DELAY", "8")),
+            )
+
+        # Opt-in: answers to near-identical questions asked in the same channel
+        # are served from a semantic cache instead of running the agent again
+        self.answer_cache = None
+        if os.getenv("AI_ANSWER_CACHE") == "true" and self.google_api_key:
+            self.answer_cache = AnswerCache(
+                GoogleGenerativeAIEmbeddingsWithDims(
+                    model="models/gemini-embedding-001",
+                    google_api_key=self.google_api_key,
+                ),
+                threshold=float(os.getenv("AI_ANSWER_CACHE_THRESHOLD", "0.95")),
+                ttl=float(os.getenv("AI_ANSWER_CACHE_TTL", "3600")),
+                max_entries=int(os.getenv("AI_ANSWER_CACHE_SIZE", "200")),
+            )
+
         self.__setupLLMs()
 
     async def initialize(self):
@@ -355,10 +642,21 @@ class AIHandler:
             self.checkpointer = AsyncPostgresSaver(self.pool)
             await self.checkpointer.setup()
 
+            # Cache embeddings in memory and in Postgres across restarts
+            self.embedding_cache = EmbeddingCache(
+                max_entries=int(os.getenv("AI_EMBEDDING_CACHE_SIZE", "2048")),
+                pool=self.pool,
+                max_age_days=int(os.getenv("AI_EMBEDDING_CACHE_DAYS", "30")),
+            )
+            await self.embedding_cache.setup()
+            if self.answer_cache:
+                self.answer_cache.embeddings.cache = self.embedding_cache
+
             # Initialize embeddings for semantic search
             embeddings = GoogleGenerativeAIEmbeddingsWithDims(
                 model="models/gemini-embedding-001",
                 google_api_key=self.google_api_key,
+                cache=self.embedding_cache,
             )
 
             # Configure store with vector index
@@ -370,8 +668,8 @@ class AIHandler:
                 "AIHandler: AsyncPostgresStore with Vector Index initialized successfully."
             )
 
-            # Re-initialize agent with checkpointer and store
-            self.__setupLLMs()
+            # Recompile the agent graphs with checkpointer and store
+            self.__compile_agents()
         except Exception as e:
             logger.error(
                 f"AIHandler: Failed to initialize Postgres: {e}", exc_info=True
@@ -382,6 +680,37 @@ class AIHandler:
                 await self.pool.close()
                 self.pool = None
 
+    async def close(self):
+        """Cancels background summaries and releases tool clients and the pool."""
+        for task in list(self.summary_tasks.values()):
+            task.cancel()
+        for tool in self.tools:
+            if hasattr(tool, "aclose"):
+                try:
+                    await tool.aclose()
+                except Exception as e:
+                    logger.warning(f"AIHandler: failed to close tool {tool.name}: {e}")
+        if self.prompt_cache:
+            try:
+                await self.prompt_cache.aclose()
+            except Exception as e:
+                logger.warning(f"AIHandler: failed to close prompt cache: {e}")
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            self.checkpointer = None
+            self.store = None
+
+    def answer_cache_stats(self) -> dict | None:
+        """The answer cache's stats, or None if the cache is off."""
+        return self.answer_cache.stats() if self.answer_cache else None
+
+    def clear_cached_answers(self, guild_id: str = None, channel_id: str = None) -> int:
+        """Drops the answers cached for a channel. Returns how many were dropped."""
+        if not self.answer_cache:
+            return 0
+        return self.answer_cache.evict((guild_id, channel_id))
+
     async def call(
         self,
         input: str,
@@ -390,6 +719,7 @@ class AIHandler:
         user_id: str = "default_user",
         guild_id: str = None,
         channel_id: str = None,
+        on_queued=None,
     ):
         logger.debug(
             f"AIHandler.call invoked. Store is not None: {self.store is not None}"
@@ -397,6 +727,283 @@ class AIHandler:
         if self.postgres_url and not self.checkpointer:
             await self.initialize()
 
+        messages, config = self.__build_request(
+            input, images, thread_id, user_id, guild_id, channel_id
+        )
+
+        cache_scope = await self.__answer_cache_scope(images, config)
+        vector = None
+        if cache_scope:
+            answer, vector = await self.answer_cache.lookup(input, cache_scope)
+            if answer is not None:
+                await self.__record_cached_answer(messages, answer, config)
+                return answer
+
+        outcome = {}
+        try:
+            async with self.scheduler.slot(thread_id, on_queued):
+                response = await self.__call_agent(messages, config, outcome)
+        except AIQueueFullError as e:
+            logger.warning(f"{e}. Rejecting request for thread {thread_id}.")
+            return BUSY_MESSAGE
+
+        self.__cache_answer(cache_scope, input, vector, response, outcome)
+        if outcome.get("state"):
+            # A failed run left nothing new in the thread worth summarizing
+            self.__schedule_summary(config)
+        return response
+
+    async def __call_agent(self, messages, config, outcome=None):
+        request = messages
+        for provider in self.__route():
+            agent = self.__get_agent(provider)
+            try:
+                state = await self.__run_agent(agent, request, config)
+                response = state["messages"][-1]
+            except (ProviderError, TransportError) as e:
+                logger.debug("Exception caught in agent run", exc_info=True)
+                logger.error(
+                    f"{provider} failed: {e!r}. Breaker: "
+                    f"{self.breakers[provider].stats()}. Trying the next provider."
+                )
+                try:
+                    request = await self.__retry_input(agent, messages, config)
+                except Exception as e:
+                    logger.error(f"Could not read the checkpoint to retry from: {e}")
+                    return "AI Error"
+                continue
+            except Exception as e:
+                logger.debug("Exception caught in agent run", exc_info=True)
+                logger.error(f"Unexpected error caught. Error message: {str(e)}")
+                return "AI Error"
+            self.__use_provider(provider)
+            if outcome is not None:
+                outcome["state"] = state
+            logger.info(f"response: {self.__sanitize_message(response)}")
+            return self.__get_response_text(response)
+        return "AI Error"
+
+    async def __retry_input(self, agent, messages, config):
+        """
+        The input for retrying a failed run on the next provider. Once the
+        checkpointer has saved the input, the retry resumes from the last
+        checkpoint (input None); re-sending the input would add the message twice
+        and run finished tool calls again.
+        """
+        if not self.checkpointer:
+            return messages
+        snapshot = await agent.aget_state(config)
+        return None if snapshot.next else messages
+
+    async def call_stream(
+        self,
+        input: str,
+        images: list[tuple[bytes, str]] = None,
+        thread_id: str = "default",
+        user_id: str = "default_user",
+        guild_id: str = None,
+        channel_id: str = None,
+        on_queued=None,
+    ):
+        """
+        Streaming variant of call. Yields the reply generated so far each time new
+        tokens arrive, finishing with the complete final answer. Each value is a
+        full snapshot rather than a delta so a fallback retry can simply restart.
+        """
+        if self.postgres_url and not self.checkpointer:
+            await self.initialize()
+
+        messages, config = self.__build_request(
+            input, images, thread_id, user_id, guild_id, channel_id
+        )
+
+        cache_scope = await self.__answer_cache_scope(images, config)
+        vector = None
+        if cache_scope:
+            answer, vector = await self.answer_cache.lookup(input, cache_scope)
+            if answer is not None:
+                await self.__record_cached_answer(messages, answer, config)
+                yield answer
+                return
+
+        outcome = {}
+        text = None
+        try:
+            async with self.scheduler.slot(thread_id, on_queued):
+                async for text in self.__call_agent_stream(messages, config, outcome):
+                    yield text
+        except AIQueueFullError as e:
+            logger.warning(f"{e}. Rejecting request for thread {thread_id}.")
+            yield BUSY_MESSAGE
+            return
+
+        self.__cache_answer(cache_scope, input, vector, text, outcome)
+        if outcome.get("state"):
+            self.__schedule_summary(config)
+
+    async def __answer_cache_scope(self, images, config):
+        """
+        The guild and channel to share cached answers within, or None if this
+        request can't use the answer cache. Image questions and threads with
+        history are skipped because the answer depends on more than the text.
+        """
+        if not self.answer_cache or images:
+            return None
+        if self.checkpointer:
+            snapshot = await self.current_agent.aget_state(config)
+            if snapshot.values.get("messages"):
+                return None
+        configurable = config["configurable"]
+        return (configurable["guild_id"], configurable["channel_id"])
+
+    def __cache_answer(self, scope, input, vector, response, outcome):
+        """Caches a fresh answer unless it came from tools or personal memories."""
+        state = outcome.get("state")
+        if not scope or vector is None or state is None:
+            return
+        turn = self.__current_turn(state["messages"])
+        tool_names = {
+            tool_call["name"].split(":")[-1]
+            for message in turn
+            for tool_call in getattr(message, "tool_calls", None) or []
+        }
+        if "upsert_memory" in tool_names:
+            # Stored facts changed, so earlier answers in this scope may be stale
+            self.answer_cache.evict(scope)
+            return
+        # Tool results are live data, and personal memories are one user's alone
+        if tool_names or state.get("personalized"):
+            return
+        self.answer_cache.put(scope, input, vector, response)
+
+    @staticmethod
+    def __current_turn(messages):
+        """The messages produced after the latest human message."""
+        for index in range(len(messages), 0, -1):
+            if isinstance(messages[index - 1], HumanMessage):
+                return messages[index:]
+        return messages
+
+    async def __record_cached_answer(self, messages, answer, config):
+        """Adds a cached answer to the thread so follow-up replies have context."""
+        if not self.checkpointer:
+            return
+        update = {"messages": [*messages["messages"], AIMessage(content=answer)]}
+        try:
+            async with self.scheduler.thread_lock(config["configurable"]["thread_id"]):
+                await self.current_agent.aupdate_state(config, update, as_node="agent")
+        except Exception as e:
+            logger.warning(f"Failed to record cached answer in thread: {e}")
+
+    def __schedule_summary(self, config):
+        """Starts a background summarization for the thread, or joins a pending one."""
+        if not self.checkpointer:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        if thread_id in self.summary_tasks:
+            self.summary_pending.add(thread_id)
+            return
+        self.summary_tasks[thread_id] = asyncio.create_task(
+            self.__summarize_thread(thread_id, config)
+        )
+
+    async def __summarize_thread(self, thread_id, config):
+        try:
+            while True:
+                await asyncio.sleep(self.summary_delay)
+                # Turns that arrived while we waited are covered by this pass
+                self.summary_pending.discard(thread_id)
+                await self.__summarize(thread_id, config)
+                # Run again only if a turn landed while we were summarizing
+                if thread_id not in self.summary_pending:
+                    break
+        except Exception as e:
+            logger.error(
+                f"Background summarization failed for thread {thread_id}: {e}",
+                exc_info=True,
+            )
+        finally:
+            self.summary_tasks.pop(thread_id, None)
+            self.summary_pending.discard(thread_id)
+
+    async def __summarize(self, thread_id, config):
+        agent = self.current_agent
+        snapshot = await agent.aget_state(config)
+        messages = snapshot.values.get("messages", [])
+        if not needs_summary(messages, self.summary_token_budget):
+            return
+
+        update = await summarize_messages(
+            self.current_llm,
+            snapshot.values,
+            token_budget=self.summary_token_budget,
+            keep_tokens=self.summary_keep_tokens,
+        )
+        if not update:
+            return
+
+        # Removals are by message id, so turns added while the summary was being
+        # written survive; the lock keeps the write from racing an active run.
+        async with self.scheduler.thread_lock(thread_id):
+            await agent.aupdate_state(config, update, as_node="summarize_conversation")
+        logger.info(f"Summarized conversation for thread {thread_id}")
+
+    async def __call_agent_stream(self, messages, config, outcome=None):
+        request = messages
+        for provider in self.__route():
+            agent = self.__get_agent(provider)
+            try:
+                async for text in self.__stream_agent(agent, request, config, outcome):
+                    yield text
+            except (ProviderError, TransportError) as e:
+                logger.debug("Exception caught in agent stream", exc_info=True)
+                logger.error(
+                    f"{provider} failed: {e!r}. Breaker: "
+                    f"{self.breakers[provider].stats()}. Trying the next provider."
+                )
+                try:
+                    request = await self.__retry_input(agent, messages, config)
+                except Exception as e:
+                    logger.error(f"Could not read the checkpoint to retry from: {e}")
+                    break
+                continue
+            except Exception as e:
+                logger.debug("Exception caught in agent stream", exc_info=True)
+                logger.error(f"Unexpected error caught. Error message: {str(e)}")
+                break
+            self.__use_provider(provider)
+            return
+        yield "AI Error"
+
+    def __route(self):
+        """
+        Yields providers in the order they should be tried, healthiest first.
+        Circuits are consulted lazily so a half-open probe is only claimed by the
+        provider that is actually tried.
+        """
+        ranked = rank_providers(self.breakers)
+        attempted = False
+        for provider in ranked:
+            if self.breakers[provider].allow_request():
+                attempted = True
+                yield provider
+        if not attempted:
+            logger.warning("All LLM circuits are open; trying the first provider")
+            yield ranked[0]
+
+    def __hedge_fallback(self, provider):
+        """The healthiest other provider with a closed circuit, for a hedged call."""
+        for name in rank_providers(self.breakers):
+            if name != provider and self.breakers[name].state == CircuitBreaker.CLOSED:
+                return name, self.llms[name], self.breakers[name]
+        return None
+
+    def __use_provider(self, provider):
+        """Records the provider that last answered; background work follows it."""
+        self.current_llm = self.llms[provider]
+        self.current_agent = self.__get_agent(provider)
+
+    def __build_request(self, input, images, thread_id, user_id, guild_id, channel_id):
         content = []
         content.append({"type": "text", "text": input})
 
@@ -419,59 +1026,76 @@ class AIHandler:
                 "channel_id": channel_id,
             }
         }
-
-        try:
-            async for step in self.current_agent.astream(
-                messages,
-                config=config,
-                stream_mode="values",
-            ):
-                response = step["messages"][-1]
-                logger.debug(
-                    "\n"
-                    + self.__get_pretty_print_response_string(
-                        self.__sanitize_message(response)
-                    )
+        return messages, config
+
+    async def __run_agent(self, agent, messages, config):
+        """Runs the agent to completion and returns its final state."""
+        async for step in agent.astream(
+            messages,
+            config=config,
+            stream_mode="values",
+        ):
+            response = step["messages"][-1]
+            logger.debug(
+                "\n"
+                + self.__get_pretty_print_response_string(
+                    self.__sanitize_message(response)
                 )
+            )
+        return step
+
+    async def __stream_agent(self, agent, messages, config, outcome=None):
+        text = ""
+        message_id = None
+        response = None
+        state = None
+        async for mode, payload in agent.astream(
+            messages,
+            config=config,
+            stream_mode=["messages", "values"],
+        ):
+            if mode == "values":
+                state = payload
+                response = payload["messages"][-1]
+                continue
+
+            chunk, metadata = payload
+            # Only the agent node talks to the user; summarization tokens are internal
+            if metadata.get("langgraph_node") != "agent" or not isinstance(
+                chunk, AIMessageChunk
+            ):
+                continue
+            # A new message id means the model started a fresh turn after tool calls
+            if chunk.id != message_id:
+                message_id = chunk.id
+                text = ""
+            delta = self.__get_content_text(chunk.content)
+            if delta:
+                text += delta
+                yield text
+
+        if response is not None:
             logger.info(f"response: {self.__sanitize_message(response)}")
-            final_content = response.content
-            if isinstance(final_content, list):
-                return final_content[0].get(
-                    "text", "Sorry, I couldn't parse the response."
-                )
-            return final_content
-        except ConnectError as e:
-            logger.error(f"Error caught: {e}.\nUsing fallback LLM.")
-            try:
-                self.__llm_cycle()
-                # response = await self.current_agent.ainvoke(messages)
-                logger.debug("AI response after fallback: ")
-                async for step in self.current_agent.astream(
-                    messages,
-                    config=config,
-                    stream_mode="values",
-                ):
-                    response = step["messages"][-1]
-                    logger.debug(
-                        "\n"
-                        + self.__get_pretty_print_response_string(
-                            self.__sanitize_message(response)
-                        )
-                    )
-                final_content = response.content
-                if isinstance(final_content, list):
-                    return final_content[0].get(
-                        "text", "Sorry, I couldn't parse the response."
-                    )
-                return final_content
-            except Exception as e:
-                logger.debug("Exception caught in fallback", exc_info=True)
-                logger.error(f"Unexpected error caught. Error message: {str(e)}")
-                return "AI Error"
-        except Exception as e:
-            logger.debug("Exception caught in fallback", exc_info=True)
-            logger.error(f"Unexpected error caught. Error message: {str(e)}")
-            return "AI Error"
+            if outcome is not None:
+                outcome["state"] = state
+            yield self.__get_response_text(response)
+
+    @staticmethod
+    def __get_content_text(content) -> str:
+        if isinstance(content, str):
+            return content
+        return "".join(
+            block.get("text", "")
+            for block in content
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+
+    @staticmethod
+    def __get_response_text(response) -> str:
+        final_content = response.content
+        if isinstance(final_content, list):
+            return final_content[0].get("text", "Sorry, I couldn't parse the response.")
+        return final_content
 
     def __setupLLMs(self):
         if self.ollama_endpoint:
@@ -491,18 +1115,56 @@ class AIHandler:
         else:
             self.google_llm = None
 
-        llms = [self.google_llm, self.ollama_llm, self.groq_llm]
-        self.current_llm = next((llm for llm in llms if llm), None)
-        self.fallback_llms = [
-            llm for llm in llms if llm != self.current_llm and llm is not None
-        ]
+        # Provider name -> chat model, in order of preference
+        self.llms = {
+            name: llm
+            for name, llm in (
+                ("google", self.google_llm),
+                ("ollama", self.ollama_llm),
+                ("groq", self.groq_llm),
+            )
+            if llm is not None
+        }
+        self.current_llm = next(iter(self.llms.values()), None)
+
+        # One circuit breaker per provider; requests go to the healthiest one
+        self.breakers = {
+            name: CircuitBreaker(
+                name,
+                open_seconds=float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30")),
+                slow_call_seconds=float(os.getenv("AI_SLOW_CALL_SECONDS", "20")),
+            )
+            for name in self.llms
+        }
 
-        self.current_agent = build_agent_graph(
-            self.current_llm,
+        self.__compile_agents()
+
+    def __compile_agents(self):
+        """
+        Compiles one agent graph per provider up front so that failing over is a
+        dictionary lookup rather than a graph rebuild.
+        """
+        self.agents = {name: self.__build_agent(name) for name in self.llms}
+        self.current_agent = self.agents.get(next(iter(self.llms), None))
+
+    def __get_agent(self, provider):
+        """Returns the cached agent graph for a provider, compiling it if needed."""
+        if provider not in self.agents:
+            self.agents[provider] = self.__build_agent(provider)
+        return self.agents[provider]
+
+    def __build_agent(self, provider):
+        return build_agent_graph(
+            self.llms[provider],
             self.tools,
-            system_prompt=self.ai_system_prompt,
+            system_prompt=self.system_prompt,
             checkpointer=self.checkpointer,
             store=self.store,
+            prompt_cache=self.prompt_cache if provider == "google" else None,
+            health=self.breakers[provider],
+            hedge=(
+                functools.partial(self.hedger.race, provider) if self.hedger else None
+            ),
         )
 
     def __setupGroqLLM(self, groq_llm_model: str):
@@ -528,18 +1190,6 @@ class AIHandler:
             max_retries=2,
         )
 
-    def __llm_cycle(self):
-        # Cycle through fallback_llms list, rotating the first element to the end.
-        self.current_llm = self.fallback_llms[0]
-        self.fallback_llms = self.fallback_llms[1:] + [self.fallback_llms[0]]
-        self.current_agent = build_agent_graph(
-            self.current_llm,
-            self.tools,
-            system_prompt=self.ai_system_prompt,
-            checkpointer=self.checkpointer,
-            store=self.store,
-        )
-
     def __get_tools(self):
         tools = []
         if self.google_api_key and self.google_llm_model:
@@ -548,10 +1198,12 @@ class AIHandler:
                     WebResearchTool(
                         google_api_key=self.google_api_key,
                         google_llm_model=self.google_llm_model,
+                        result_cache=self.tool_cache,
                     ),
                     UrlContextTool(
                         google_api_key=self.google_api_key,
                         google_llm_model=self.google_llm_model,
+                        result_cache=self.tool_cache,
                     ),
                 ]
             )
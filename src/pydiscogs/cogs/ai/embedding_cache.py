@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import time
+
+from .tiered_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache(TieredCache):
+    """
+    Content-hash keyed cache of embedding vectors. An in-process LRU sits in front
+    of an optional Postgres table so vectors survive restarts and are shared by
+    every bot process pointed at the same database.
+
+    Rows record when they were last read or written. Rows unused for max_age_days
+    are pruned on setup and then at most once per prune_interval seconds, on the
+    next write.
+    """
+
+    label = "Embedding cache"
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            key TEXT PRIMARY KEY,
+            embedding DOUBLE PRECISION[] NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """,
+        # Tables created before pruning existed lack the column
+        """
+        ALTER TABLE embedding_cache
+        ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS embedding_cache_last_used_at_idx
+        ON embedding_cache (last_used_at)
+        """,
+    )
+    # Reading a row counts as using it
+    select_sql = (
+        "UPDATE embedding_cache SET last_used_at = NOW() "
+        "WHERE key = ANY(%s) RETURNING key, embedding"
+    )
+    upsert_sql = (
+        "INSERT INTO embedding_cache (key, embedding) VALUES (%s, %s) "
+        "ON CONFLICT (key) DO UPDATE SET last_used_at = NOW()"
+    )
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        pool=None,
+        max_age_days: int = 30,
+        prune_interval: float = 6 * 60 * 60,
+    ):
+        super().__init__(max_entries, pool)
+        self.max_age_days = max_age_days
+        self.prune_interval = prune_interval
+        self.pruned = 0
+        self._last_prune = None
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, dims: int, task: str, text: str) -> str:
+        """Keys include model, dimensionality and task so vectors never mix."""
+        return hashlib.sha256(f"{model}|{dims}|{task}|{text}".encode()).hexdigest()
+
+    async def setup(self):
+        await super().setup()
+        await self.prune()
+
+    async def prune(self):
+        """Deletes Postgres rows that have not been used for max_age_days."""
+        if not self.pool:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            async with self.pool.connection() as conn:
+                cursor = await conn.execute(
+                    "DELETE FROM embedding_cache "
+                    "WHERE last_used_at < NOW() - make_interval(days => %s)",
+                    (self.max_age_days,),
+                )
+                deleted = cursor.rowcount
+        except Exception as e:
+            logger.warning(f"Embedding cache: Postgres prune failed: {e}")
+            return
+        if deleted and deleted > 0:
+            self.pruned += deleted
+            logger.info(f"Embedding cache: pruned {deleted} unused rows")
+
+    def _prune_due(self) -> bool:
+        return (
+            self._last_prune is None
+            or time.monotonic() - self._last_prune >= self.prune_interval
+        )
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Looks keys up in the in-process tier only."""
+        found = self._recall(keys)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, vectors: dict[str, list[float]]):
+        self._remember(vectors)
+
+    async def aget_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Looks keys up in memory first, then in Postgres."""
+        found = self._recall(keys)
+        self.hits += len(found)
+
+        from_db = await self._fetch([key for key in keys if key not in found])
+        found.update(from_db)
+        self.db_hits += len(from_db)
+
+        self.misses += len(keys) - len(found)
+        logger.debug(f"Embedding cache stats: {self.stats()}")
+        return found
+
+    async def aput_many(self, vectors: dict[str, list[float]]):
+        self._remember(vectors)
+        if not vectors or not self.pool:
+            return
+        await self._store(vectors)
+        if self._prune_due():
+            await self.prune()
+
+    @staticmethod
+    def _encode(vector):
+        return list(vector)
+
+    @staticmethod
+    def _decode(vector):
+        return list(vector)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.db_hits + self.misses
+        return (self.hits + self.db_hits) / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "pruned": self.pruned,
+            "hit_rate": round(self.hit_rate, 3),
+        }
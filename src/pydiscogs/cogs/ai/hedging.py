@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+
+class FirstTokenHandler(AsyncCallbackHandler):
+    """Calls on_token when a streaming model call yields a token."""
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+
+    async def on_llm_new_token(self, token, **kwargs):
+        self.on_token()
+
+
+class RequestHedger:
+    """
+    Races slow model calls against another provider. If a call hasn't produced
+    its first token within the provider's recent p95 latency, the same request
+    goes to the provider pick_fallback(provider) returns as (name, llm, health),
+    or not at all if it returns None. The first answer wins and the other call
+    is cancelled.
+
+    Without streaming a call's first token is its whole response, so latency is
+    measured to whichever comes first. Until min_samples calls have been seen
+    for a provider, hedges fire after default_delay.
+    """
+
+    def __init__(
+        self,
+        pick_fallback,
+        percentile: float = 0.95,
+        default_delay: float = 8.0,
+        min_delay: float = 1.0,
+        window: int = 100,
+        min_samples: int = 20,
+    ):
+        self.pick_fallback = pick_fallback
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = {}
+
+    def delay(self, provider: str) -> float:
+        """Seconds to wait for the first token before hedging."""
+        samples = self._latencies.get(provider)
+        if not samples or len(samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    def record(self, provider: str, seconds: float):
+        if provider not in self._latencies:
+            self._latencies[provider] = deque(maxlen=self.window)
+        self._latencies[provider].append(seconds)
+
+    async def race(self, provider: str, call, fallback_call):
+        """
+        Runs call(on_token) and, if it's slow, fallback_call(llm, health) for the
+        fallback provider. Returns the first successful response; if both calls
+        fail the primary's error is raised.
+        """
+        self.calls += 1
+        start = time.monotonic()
+        first_token_at = None
+        first_token = asyncio.Event()
+
+        def on_token():
+            nonlocal first_token_at
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+                first_token.set()
+
+        primary = asyncio.create_task(call(on_token))
+        token = asyncio.create_task(first_token.wait())
+        hedge = None
+        try:
+            await asyncio.wait(
+                {primary, token},
+                timeout=self.delay(provider),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            token.cancel()
+
+            fallback = None
+            if not (primary.done() or first_token.is_set()):
+                fallback = self.pick_fallback(provider)
+            if fallback is None:
+                response = await primary
+                self.record(provider, (first_token_at or time.monotonic()) - start)
+                return response
+
+            name, llm, health = fallback
+            self.hedged += 1
+            logger.info(
+                f"Hedging {provider} with {name} after {time.monotonic() - start:.1f}s"
+            )
+            hedge_start = time.monotonic()
+            hedge = asyncio.create_task(fallback_call(llm, health))
+            winner = await self._first_success(primary, hedge)
+            if winner is hedge:
+                self.hedge_wins += 1
+                self.record(name, time.monotonic() - hedge_start)
+                # The primary's real latency is unknown but at least this long;
+                # dropping the sample would drag its p95 down
+                self.record(provider, time.monotonic() - start)
+                logger.info(f"Hedge to {name} won. Hedging: {self.stats()}")
+                return hedge.result()
+            response = primary.result()
+            self.record(provider, (first_token_at or time.monotonic()) - start)
+            return response
+        except BaseException:
+            for task in (primary, token, hedge):
+                if task and not task.done():
+                    task.cancel()
+            raise
+
+    @staticmethod
+    async def _first_success(primary, hedge):
+        """The first task to succeed, cancelling the other; primary if both fail."""
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task
+        return primary
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+            "hedge_win_rate": (
+                round(self.hedge_wins / self.hedged, 3) if self.hedged else 0.0
+            ),
+            "delays": {
+                provider: round(self.delay(provider), 3) for provider in self._latencies
+            },
+        }
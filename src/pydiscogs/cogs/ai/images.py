@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Attachments larger than this are skipped without being downloaded
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_IMAGES = 8
+# Longest edge sent to the model; larger images are tiled or resized server-side
+MAX_DIMENSION = 1536
+# Images already this small and within MAX_DIMENSION are passed through untouched
+PASSTHROUGH_BYTES = 512 * 1024
+JPEG_QUALITY = 85
+
+
+def prepare_image(data: bytes, content_type: str) -> tuple[bytes, str]:
+    """
+    Downscales an image to MAX_DIMENSION, upright per its EXIF orientation, and
+    recompresses it. Returns the input unchanged if the image can't be decoded or
+    it's animated.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, "is_animated", False):
+                return data, content_type
+            if max(image.size) <= MAX_DIMENSION and len(data) <= PASSTHROUGH_BYTES:
+                return data, content_type
+
+            # Re-encoding drops EXIF, so apply its orientation to the pixels first
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+            output = io.BytesIO()
+            has_alpha = image.mode in ("RGBA", "LA") or (
+                image.mode == "P" and "transparency" in image.info
+            )
+            if has_alpha:
+                image.save(output, format="PNG", optimize=True)
+                prepared = (output.getvalue(), "image/png")
+            else:
+                image.convert("RGB").save(
+                    output, format="JPEG", quality=JPEG_QUALITY, optimize=True
+                )
+                prepared = (output.getvalue(), "image/jpeg")
+    except Exception as e:
+        logger.warning(f"Could not process {content_type} image, sending as-is: {e}")
+        return data, content_type
+
+    # Recompressing an already efficient image can make it bigger
+    if len(prepared[0]) >= len(data):
+        return data, content_type
+    return prepared
+
+
+class ImagePipeline:
+    """
+    Turns Discord attachments into model-ready images. Attachments are downloaded
+    concurrently, oversized files are skipped, duplicates are dropped by content
+    hash, and processing runs in a worker thread. Processed results are cached
+    by hash so an image that keeps reappearing in a reply chain is only
+    processed once.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_IMAGE_BYTES,
+        max_images: int = MAX_IMAGES,
+        cache_size: int = 64,
+    ):
+        self.max_bytes = max_bytes
+        self.max_images = max_images
+        self.cache_size = cache_size
+        self._processed = OrderedDict()
+
+    async def read(self, attachments) -> list[tuple[bytes, str]]:
+        candidates = []
+        seen_ids = set()
+        for attachment in attachments:
+            if not (
+                attachment.content_type and attachment.content_type.startswith("image/")
+            ):
+                continue
+            if attachment.id in seen_ids:
+                continue
+            seen_ids.add(attachment.id)
+            if attachment.size > self.max_bytes:
+                logger.info(
+                    f"Skipping image {attachment.filename}: {attachment.size} bytes "
+                    f"exceeds the {self.max_bytes} byte limit"
+                )
+                continue
+            candidates.append(attachment)
+
+        downloads = await asyncio.gather(
+            *(attachment.read() for attachment in candidates), return_exceptions=True
+        )
+
+        unique = {}
+        for attachment, data in zip(candidates, downloads):
+            if isinstance(data, Exception):
+                logger.warning(f"Failed to read image {attachment.filename}: {data}")
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in unique:
+                unique[digest] = (data, attachment.content_type)
+        if len(unique) > self.max_images:
+            logger.info(f"Dropping {len(unique) - self.max_images} extra images")
+        selected = list(unique.items())[: self.max_images]
+
+        return await asyncio.gather(
+            *(self._prepare(digest, data, ct) for digest, (data, ct) in selected)
+        )
+
+    async def _prepare(self, digest: str, data: bytes, content_type: str):
+        if digest in self._processed:
+            self._processed.move_to_end(digest)
+            return self._processed[digest]
+
+        prepared = await asyncio.to_thread(prepare_image, data, content_type)
+        self._processed[digest] = prepared
+        while len(self._processed) > self.cache_size:
+            self._processed.popitem(last=False)
+        return prepared
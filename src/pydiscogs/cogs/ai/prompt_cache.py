@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import math
+import time
+
+from google.genai import Client, errors, types
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiPromptCache:
+    """
+    Keeps the static system prompt and tool declarations in a Gemini context cache,
+    one cache per distinct tool set. get() returns the cache name to send as
+    cached_content, or None when caching is unavailable and the prompt should be
+    sent inline instead. A tool set whose prompt is below Gemini's minimum cache
+    size is not tried again.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        system_prompt: str,
+        ttl: int = 3600,
+        refresh_margin: int = 300,
+        retry_after: int = 600,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.system_prompt = system_prompt
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.client = None
+        self._entries = {}
+        self._failed_until = {}
+        self._lock = asyncio.Lock()
+
+    def _get_client(self):
+        if self.client is None:
+            self.client = Client(api_key=self.api_key)
+        return self.client
+
+    async def get(self, tools) -> str | None:
+        key = tuple(sorted(tool.name for tool in tools))
+        name = self._fresh(key)
+        if name or self._failed_until.get(key, 0) > time.monotonic():
+            return name
+
+        async with self._lock:
+            # Another caller may have created or refreshed it while we waited
+            name = self._fresh(key)
+            if name or self._failed_until.get(key, 0) > time.monotonic():
+                return name
+
+            entry = self._entries.get(key)
+            try:
+                name = None
+                if entry:
+                    name = await self._refresh(entry[0])
+                if not name:
+                    name = await self._create(tools)
+            except Exception as e:
+                self._entries.pop(key, None)
+                if self._too_small(e):
+                    # The prompt and tools for a key never change, so it never fits
+                    logger.info(f"Prompt cache: prompt too small to cache: {e}")
+                    self._failed_until[key] = math.inf
+                    return None
+                logger.warning(
+                    f"Prompt cache: falling back to inline system prompt: {e}"
+                )
+                self._failed_until[key] = time.monotonic() + self.retry_after
+                return None
+
+            self._entries[key] = (name, time.monotonic() + self.ttl)
+            return name
+
+    def invalidate(self, name: str):
+        """Forgets a cache the API rejected so the next call recreates it."""
+        for key, entry in list(self._entries.items()):
+            if entry[0] == name:
+                del self._entries[key]
+
+    async def aclose(self):
+        """Deletes the caches so they stop accruing storage, then closes the client."""
+        if self.client is None:
+            return
+        for name, _ in list(self._entries.values()):
+            try:
+                await self.client.aio.caches.delete(name=name)
+            except Exception as e:
+                logger.warning(f"Prompt cache: failed to delete {name}: {e}")
+        self._entries.clear()
+        await self.client.aio.aclose()
+        self.client.close()
+        self.client = None
+
+    def _fresh(self, key) -> str | None:
+        entry = self._entries.get(key)
+        if entry and entry[1] - self.refresh_margin > time.monotonic():
+            return entry[0]
+        return None
+
+    async def _create(self, tools) -> str:
+        cache = await self._get_client().aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                display_name="pydiscogs-system-prompt",
+                system_instruction=self.system_prompt,
+                tools=self._tool_declarations(tools),
+                ttl=f"{self.ttl}s",
+            ),
+        )
+        logger.info(f"Prompt cache: created {cache.name}")
+        return cache.name
+
+    async def _refresh(self, name: str) -> str | None:
+        try:
+            await self._get_client().aio.caches.update(
+                name=name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s")
+            )
+        except Exception as e:
+            logger.info(f"Prompt cache: could not extend {name}, recreating: {e}")
+            return None
+        return name
+
+    @staticmethod
+    def _too_small(error: Exception) -> bool:
+        """Whether error is the INVALID_ARGUMENT for content under the minimum size."""
+        return (
+            isinstance(error, errors.ClientError)
+            and error.code == 400
+            and "min_total_token_count" in str(error)
+        )
+
+    @staticmethod
+    def _tool_declarations(tools) -> list[types.Tool]:
+        if not tools:
+            return []
+        functions = [convert_to_openai_tool(tool)["function"] for tool in tools]
+        return [
+            types.Tool(
+                function_declarations=[
+                    types.FunctionDeclaration(
+                        name=function["name"],
+                        description=function.get("description"),
+                        parameters_json_schema=function.get("parameters"),
+                    )
+                    for function in functions
+                ]
+            )
+        ]
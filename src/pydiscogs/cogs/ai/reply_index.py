@@ -0,0 +1,68 @@
+import asyncio
+
+from .tiered_cache import TieredCache
+
+
+class ReplyRootIndex(TieredCache):
+    """
+    Maps Discord message ids to the id of the message that started their reply
+    chain. An in-process LRU sits in front of an optional Postgres table so
+    lookups skip the hop-by-hop fetch walk and survive restarts.
+    """
+
+    label = "Reply index"
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS reply_roots (
+            message_id TEXT PRIMARY KEY,
+            root_id TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """,
+    )
+    select_sql = (
+        "SELECT message_id, root_id FROM reply_roots WHERE message_id = ANY(%s)"
+    )
+    upsert_sql = (
+        "INSERT INTO reply_roots (message_id, root_id) VALUES (%s, %s) "
+        "ON CONFLICT (message_id) DO UPDATE SET root_id = EXCLUDED.root_id"
+    )
+
+    def __init__(self, max_entries: int = 10000, pool=None):
+        super().__init__(max_entries, pool)
+        self._writes = set()
+
+    def peek(self, message_id: str) -> str | None:
+        """Looks a message up in the in-process tier only."""
+        return self._recall([message_id]).get(message_id)
+
+    async def get(self, message_id: str) -> str | None:
+        """Looks a message up in memory first, then in Postgres."""
+        root_id = self.peek(message_id)
+        if root_id is not None:
+            return root_id
+        return (await self._fetch([message_id])).get(message_id)
+
+    async def put_many(self, roots: dict[str, str]):
+        self._remember(roots)
+        await self._store(roots)
+
+    def record(self, message):
+        """
+        Indexes a message the bot has seen or sent if the message it replies to
+        is already in memory. The Postgres write runs in the background, so it's
+        cheap enough to call for every message.
+        """
+        reference = message.reference
+        if not reference or not reference.message_id:
+            return
+        root_id = self.peek(str(reference.message_id))
+        if root_id is None:
+            return
+        roots = {str(message.id): root_id}
+        self._remember(roots)
+        if self.pool:
+            task = asyncio.create_task(self._store(roots))
+            # Held so the write isn't garbage collected before it finishes
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
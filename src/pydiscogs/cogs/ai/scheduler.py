@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AIQueueFullError(Exception):
+    """Raised when the AI work queue has no room for another request."""
+
+
+class AIRequestScheduler:
+    """
+    Sits in front of AIHandler.call. Requests for the same thread run one at a time
+    in arrival order, at most max_concurrency requests run at once across all
+    threads, and new requests are turned away once max_queue_depth are waiting.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue_depth: int = 20):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.waiting = 0
+        self.running = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._thread_locks = {}
+        self._thread_refs = {}
+
+    @contextlib.asynccontextmanager
+    async def thread_lock(self, thread_id: str):
+        """Serializes work on a single thread without taking a global slot."""
+        lock = self._thread_locks.setdefault(thread_id, asyncio.Lock())
+        self._thread_refs[thread_id] = self._thread_refs.get(thread_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._thread_refs[thread_id] -= 1
+            if not self._thread_refs[thread_id]:
+                del self._thread_refs[thread_id]
+                del self._thread_locks[thread_id]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, thread_id: str, on_queued=None):
+        """
+        Waits for this thread's turn and a free global slot. If the request cannot
+        start immediately, on_queued is awaited with its 1-based place in line.
+        """
+        if self.waiting >= self.max_queue_depth:
+            raise AIQueueFullError(
+                f"AI queue is full ({self.waiting} requests waiting)"
+            )
+
+        must_wait = self._semaphore.locked() or (
+            thread_id in self._thread_locks and self._thread_locks[thread_id].locked()
+        )
+        self.waiting += 1
+        queued = True
+        try:
+            if must_wait:
+                logger.info(
+                    f"AI request for thread {thread_id} queued at position {self.waiting}"
+                )
+                if on_queued:
+                    try:
+                        await on_queued(self.waiting)
+                    except Exception as e:
+                        logger.warning(f"Failed to send queue notification: {e}")
+
+            async with self.thread_lock(thread_id):
+                async with self._semaphore:
+                    self.waiting -= 1
+                    queued = False
+                    self.running += 1
+                    try:
+                        yield
+                    finally:
+                        self.running -= 1
+        finally:
+            if queued:
+                self.waiting -= 1
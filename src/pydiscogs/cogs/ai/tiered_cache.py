@@ -0,0 +1,91 @@
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """
+    An in-process LRU in front of an optional Postgres table of (key, value) rows.
+    Subclasses supply the table's DDL and its lookup and upsert statements, and
+    build their public get/put methods from the helpers here.
+    """
+
+    # Prefix for log messages
+    label = "Cache"
+    # Statements run by setup() to create the table
+    schema: tuple[str, ...] = ()
+    # Takes a list of keys; returns (key, value) rows
+    select_sql = ""
+    # Takes one (key, value) pair
+    upsert_sql = ""
+
+    def __init__(self, max_entries: int, pool=None):
+        self.max_entries = max_entries
+        self.pool = pool
+        self._entries = OrderedDict()
+
+    async def setup(self):
+        """Creates the Postgres table, disabling the tier if that fails."""
+        if not self.pool:
+            return
+        try:
+            async with self.pool.connection() as conn:
+                for statement in self.schema:
+                    await conn.execute(statement)
+        except Exception as e:
+            logger.warning(f"{self.label}: Postgres tier disabled: {e}")
+            self.pool = None
+
+    def _recall(self, keys) -> dict:
+        """Looks keys up in the in-process tier, marking hits as recently used."""
+        found = {}
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+        return found
+
+    def _remember(self, items: dict):
+        for key, value in items.items():
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, keys: list) -> dict:
+        """Reads keys from Postgres into memory. A failed read finds nothing."""
+        if not keys or not self.pool:
+            return {}
+        try:
+            async with self.pool.connection() as conn:
+                cursor = await conn.execute(self.select_sql, (keys,))
+                rows = await cursor.fetchall()
+        except Exception as e:
+            logger.warning(f"{self.label}: Postgres lookup failed: {e}")
+            return {}
+        found = {row[0]: self._decode(row[1]) for row in rows}
+        self._remember(found)
+        return found
+
+    async def _store(self, items: dict):
+        """Upserts items into Postgres; failures are logged and dropped."""
+        if not items or not self.pool:
+            return
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(
+                        self.upsert_sql,
+                        [(key, self._encode(value)) for key, value in items.items()],
+                    )
+        except Exception as e:
+            logger.warning(f"{self.label}: Postgres write failed: {e}")
+
+    @staticmethod
+    def _encode(value):
+        return value
+
+    @staticmethod
+    def _decode(value):
+        return value
@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import inspect
+import logging
+import time
+
+from playwright.async_api import async_playwright
+from xvfbwrapper import Xvfb
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+BROWSER_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--disable-gpu",
+]
+
+
+class BrowserPool:
+    """
+    Warm Chromium browser contexts for computer use tasks. One browser runs on a
+    persistent virtual display and hands out contexts with lease(). A returned
+    context is reset and kept for the next task. At most max_size contexts
+    exist at once and further leases wait their turn. Contexts left unused for
+    idle_seconds are closed, and on_close(context) is called for every context
+    the pool closes so callers can drop what they keep per context. on_close may
+    be a coroutine function; the pool awaits it before closing the context.
+
+    The pool belongs to the event loop that first starts it.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 2,
+        warm_size: int = 1,
+        idle_seconds: float = 300.0,
+        screen_size: tuple[int, int] = (1280, 936),
+        virtual_display: bool = True,
+        on_close=None,
+    ):
+        self.max_size = max_size
+        self.warm_size = min(warm_size, max_size)
+        self.idle_seconds = idle_seconds
+        self.screen_size = screen_size
+        self.virtual_display = virtual_display
+        self.on_close = on_close
+        self.leases = 0
+        self.reuses = 0
+        self.waits = 0
+        self.launches = 0
+        self._display = None
+        self._playwright = None
+        self._browser = None
+        self._idle = []
+        self._size = 0
+        self._condition = asyncio.Condition()
+        self._start_lock = asyncio.Lock()
+        self._reaper = None
+
+    async def start(self):
+        """Starts the display and browser, or restarts a browser that has died."""
+        async with self._start_lock:
+            if self._browser and self._browser.is_connected():
+                return
+            if self._browser:
+                logger.warning("Browser pool: browser disconnected, relaunching")
+                await self._shutdown_browser()
+
+            if self.virtual_display and self._display is None:
+                display = Xvfb(width=self.screen_size[0], height=self.screen_size[1])
+                # Xvfb.start blocks while it waits for the display to come up
+                await asyncio.to_thread(display.start)
+                self._display = display
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(
+                args=BROWSER_ARGS, headless=False
+            )
+            self.launches += 1
+            logger.info("Browser pool: browser launched")
+
+            for _ in range(self.warm_size - self._size):
+                self._size += 1
+                try:
+                    self._idle.append((await self._new_context(), time.monotonic()))
+                except Exception:
+                    self._size -= 1
+                    raise
+            if self._reaper is None:
+                self._reaper = asyncio.create_task(self._reap())
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """Leases a browser context, waiting if all max_size are in use."""
+        context = await self._acquire()
+        try:
+            yield context
+        finally:
+            await self._release(context)
+
+    async def _acquire(self):
+        await self.start()
+        async with self._condition:
+            waited = False
+            while True:
+                await self._evict_idle()
+                if self._idle:
+                    context, _ = self._idle.pop()
+                    self.leases += 1
+                    self.reuses += 1
+                    return context
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                    logger.info("Browser pool: all contexts busy, waiting")
+                await self._condition.wait()
+
+        try:
+            context = await self._new_context()
+        except BaseException:
+            async with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        self.leases += 1
+        return context
+
+    async def _release(self, context):
+        try:
+            await self._reset(context)
+            reusable = True
+        except Exception as e:
+            logger.warning(
+                f"Browser pool: discarding context that failed to reset: {e}"
+            )
+            reusable = False
+            await self._close_context(context)
+
+        async with self._condition:
+            if reusable:
+                self._idle.append((context, time.monotonic()))
+            else:
+                self._size -= 1
+            self._condition.notify()
+
+    async def _new_context(self):
+        context = await self._browser.new_context(
+            user_agent=USER_AGENT,
+            viewport={"width": self.screen_size[0], "height": self.screen_size[1]},
+        )
+        await context.new_page()
+        return context
+
+    @staticmethod
+    async def _reset(context):
+        """Clears what one task could leak into the next one."""
+        pages = context.pages
+        for page in pages[1:]:
+            await page.close()
+        await context.clear_cookies()
+        await context.clear_permissions()
+        if pages:
+            await pages[0].goto("about:blank")
+        else:
+            await context.new_page()
+
+    async def _evict_idle(self):
+        """Closes contexts idle for longer than idle_seconds; needs the condition."""
+        cutoff = time.monotonic() - self.idle_seconds
+        expired = [context for context, since in self._idle if since <= cutoff]
+        if not expired:
+            return
+        self._idle = [
+            (context, since) for context, since in self._idle if since > cutoff
+        ]
+        self._size -= len(expired)
+        logger.info(f"Browser pool: closing {len(expired)} idle contexts")
+        for context in expired:
+            await self._close_context(context)
+        self._condition.notify(len(expired))
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.idle_seconds / 2)
+            async with self._condition:
+                await self._evict_idle()
+
+    async def _close_context(self, context):
+        if self.on_close:
+            try:
+                result = self.on_close(context)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Browser pool: on_close failed: {e}")
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug(f"Browser pool: error closing context: {e}")
+
+    async def _shutdown_browser(self):
+        for context, _ in self._idle:
+            await self._close_context(context)
+        self._size -= len(self._idle)
+        self._idle = []
+        try:
+            await self._browser.close()
+        except Exception as e:
+            logger.debug(f"Browser pool: error closing browser: {e}")
+        await self._playwright.stop()
+        self._browser = None
+        self._playwright = None
+
+    async def close(self):
+        """Closes every idle context, the browser and the virtual display."""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        async with self._start_lock:
+            if self._browser:
+                await self._shutdown_browser()
+            if self._display:
+                await asyncio.to_thread(self._display.stop)
+                self._display = None
+
+    def stats(self) -> dict:
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "leases": self.leases,
+            "reuses": self.reuses,
+            "waits": self.waits,
+            "launches": self.launches,
+        }
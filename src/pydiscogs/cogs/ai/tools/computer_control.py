@@ -1,23 +1,49 @@
-import asyncio
 import json
 import logging
+import re
 import uuid
-from typing import Type, Union
+from collections import OrderedDict
+from typing import Any, Literal, Optional, Type, Union
 
 from google.adk import Agent
-from google.adk.runners import InMemoryRunner
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
 from google.adk.tools.computer_use.computer_use_toolset import ComputerUseToolset
 from google.genai import types
 from google.genai.errors import ClientError
-from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
-from xvfbwrapper import Xvfb
 
-from .playwright_computer import PlaywrightComputer
+from .browser_pool import BrowserPool
+from .playwright_computer import TEXT_MAX_CHARS, PlaywrightComputer
 
 logger = logging.getLogger(__name__)
 
+APP_NAME = "agents"
+USER_ID = "pydiscogs"
+SCREEN_SIZE = (1280, 936)
+# Longer queries are truncated to avoid token limit errors
+MAX_QUERY_LENGTH = 20000
+URL_PATTERN = re.compile(r"https?://[^\s<>\"']+")
+# Words that suggest a task has to act on a page or look at it, not just read it
+VISION_HINTS = re.compile(
+    r"\b(click|press|type|fill|enter|submit|select|log ?in|sign ?in|sign ?up|"
+    r"buy|book|order|download|upload|drag|play|watch|screenshot|image|picture|"
+    r"photo|chart|graph|map|look|looks|see|color|colour|layout|design)\b",
+    re.IGNORECASE,
+)
+# Pages read in one text-mode task
+MAX_TEXT_PAGES = 3
+# Starts every follow-up task in a thread's session. The pool resets a browser
+# between tasks, and the next task may get a different one.
+BROWSER_RESET_NOTE = (
+    "Note: the browser was reset since the previous task in this conversation. "
+    "Cookies, logins and open tabs are gone and it starts on a fresh page, so "
+    "don't rely on the earlier browser state; open pages and sign in again if "
+    "needed."
+)
+
 
 class ComputerControlInput(BaseModel):
     query: Union[str, dict] = Field(
@@ -39,6 +65,23 @@ class ComputerControlTool(BaseTool):
         """
     args_schema: Type[BaseModel] = ComputerControlInput
     # google_api_key: str
+    # Tasks lease warm browsers from this pool; created on first use
+    browser_pool: Optional[Any] = None
+    max_browsers: int = 2
+    # (computer, ADK runner) per pooled browser context, dropped with the context
+    runners: dict = Field(default_factory=dict)
+    # ADK sessions shared by all runners, one per conversation thread so follow-up
+    # tasks see what was done before
+    session_service: Optional[Any] = None
+    max_sessions: int = 20
+    sessions: Any = Field(default_factory=OrderedDict)
+    busy_sessions: set = Field(default_factory=set)
+    # Passed to PlaywrightComputer, e.g. screenshot_scale, target_screenshot_bytes
+    # or allowed_domains
+    screenshot_options: dict = Field(default_factory=dict)
+    # "auto" reads pages as text when a task names URLs and only needs to read
+    # them; "vision" always runs the computer use model
+    observation: Literal["auto", "vision", "text"] = "auto"
 
     def _clean_query_payload(self, data):
         """Recursively remove image data from the query payload."""
@@ -52,63 +95,93 @@ class ComputerControlTool(BaseTool):
                 self._clean_query_payload(item)
         return data
 
-    def _run(self, query: str, tool_call_id: str = None, **kwargs):
-        """Use the tool."""
+    def _needs_vision(self, query: str, urls: list[str]) -> bool:
+        """Whether a task needs the computer use model rather than page text."""
+        if self.observation == "vision" or not urls:
+            return True
+        if self.observation == "text":
+            return False
+        return bool(VISION_HINTS.search(URL_PATTERN.sub(" ", query)))
+
+    def _prepare_query(self, query: Union[str, dict]) -> str:
+        """Strips image data from JSON payloads and truncates long queries."""
         # Handle case where LLM passes a nested dictionary (e.g. {'query': '...'})
         if isinstance(query, dict):
-            query = query.get("query", str(query))
-        logger.info(
-            f"ComputerControlTool._run called with query type: {type(query)}, value: {query}"
-        )
-        with Xvfb():
+            query = query.get("query", query)
+        if isinstance(query, str) and query.lstrip()[:1] in ("{", "["):
             try:
-                return asyncio.run(self.arun(query, tool_call_id=tool_call_id))
-            except Exception as e:
-                logger.debug("Exception caught in fallback", exc_info=True)
-                logger.error(f"Error running ADK: {e}")
-                return "Error controlling the computer."
-
-    async def arun(self, query: str, tool_call_id: str = None, **kwargs):
-        """Run the agent asynchronously."""
-        # Handle case where LLM passes a nested dictionary (e.g. {'query': '...'})
-        if isinstance(query, dict):
-            query = query.get("query", str(query))
+                query = json.loads(query)
+            except json.JSONDecodeError as e:
+                logger.debug(f"Could not parse query as JSON for cleaning: {e}")
+        if not isinstance(query, str):
+            query = json.dumps(self._clean_query_payload(query))
 
-        # Try to parse query as JSON and clean it
-        try:
-            query_json = json.loads(query)
-            query_json = self._clean_query_payload(query_json)
-            query = json.dumps(query_json)
-            logger.debug("Successfully cleaned query payload.")
-        except (json.JSONDecodeError, TypeError) as e:
-            # Not a JSON string or structure we can parse, proceed as is
-            logger.debug(f"Could not parse query as JSON for cleaning: {e}")
-            pass
-
-        logger.info(f"ComputerControlTool.arun called with query length: {len(query)}")
-        logger.debug(f"Query content (first 500 chars): {query[:500]}")
-        # os.environ["GOOGLE_API_KEY"] = self.google_api_key
-        agent = self.__get_agent()
-        # Instantiate the InMemoryRunner
-        runner = InMemoryRunner(app_name="agents", agent=agent)
-        replies = []
-        # Truncate query if it's too long to avoid token limit errors
-        MAX_QUERY_LENGTH = 20000
         if len(query) > MAX_QUERY_LENGTH:
             logger.warning(
                 f"Query too long ({len(query)} chars). Truncating to {MAX_QUERY_LENGTH} chars."
             )
             query = query[:MAX_QUERY_LENGTH] + "... [TRUNCATED]"
+        return query
 
-        content = types.Content(role="user", parts=[types.Part(text=query)])
-        session_id = str(uuid.uuid4())
+    def _run(self, query: str, **kwargs):
+        raise NotImplementedError(
+            "ComputerControlTool only runs asynchronously; use ainvoke."
+        )
 
+    async def _arun(
+        self, query: Union[str, dict], config: RunnableConfig = None, **kwargs
+    ):
+        """
+        Runs a task in a pooled browser. Tasks from the same conversation thread
+        (config["configurable"]["thread_id"]) continue one ADK session.
+        """
+        query = self._prepare_query(query)
+        logger.info(f"ComputerControlTool called with query length: {len(query)}")
+        logger.debug(f"Query content (first 500 chars): {query[:500]}")
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+
+        urls = [url.rstrip(".,;:!?)]}") for url in URL_PATTERN.findall(query)]
         try:
-            await runner.session_service.create_session(
-                app_name="agents", user_id="pydiscogs", session_id=session_id
+            async with self._get_pool().lease() as context:
+                computer, runner = self.__get_runner(context)
+                # Stats are logged per task
+                computer.reset_stats()
+                if self._needs_vision(query, urls):
+                    return await self.__run_agent(runner, computer, query, thread_id)
+                logger.info(f"ComputerControlTool: reading {urls} as text")
+                return await self.__read_pages(computer, urls[:MAX_TEXT_PAGES])
+        except Exception as e:
+            logger.error(
+                f"Browser pool error in ComputerControlTool: {e}", exc_info=True
             )
+            return f"Error: Could not start a browser. Details: {e}"
+
+    async def __read_pages(self, computer, urls):
+        """Answers a read-only task with the text of its pages, without a model."""
+        try:
+            await computer.attach()
+            pages = [
+                await computer.read_url(url, TEXT_MAX_CHARS // len(urls))
+                for url in urls
+            ]
+        except Exception as e:
+            logger.error(f"Error reading pages in ComputerControlTool: {e}")
+            return f"Error: Could not read the page. Details: {e}"
+        finally:
+            logger.info(f"ComputerControlTool observations: {computer.stats()}")
+        return "\n\n".join(pages)
+
+    async def __run_agent(self, runner, computer, query, thread_id=None):
+        session_id, follow_up = await self.__open_session(thread_id)
+        if follow_up:
+            query = f"{BROWSER_RESET_NOTE}\n\n{query}"
+        content = types.Content(role="user", parts=[types.Part(text=query)])
+        replies = []
+
+        try:
+            await computer.initialize()
             async for event in runner.run_async(
-                new_message=content, session_id=session_id, user_id="pydiscogs"
+                new_message=content, session_id=session_id, user_id=USER_ID
             ):
                 if (
                     event.content
@@ -122,13 +195,110 @@ class ComputerControlTool(BaseTool):
         except Exception as e:
             logger.error(f"Unexpected error in ComputerControlTool: {e}", exc_info=True)
             return f"Error: An unexpected error occurred. Details: {e}"
+        finally:
+            await self.__close_session(session_id, thread_id)
+            logger.info(f"ComputerControlTool screenshots: {computer.stats()}")
+
+        return "\n".join(replies)
+
+    async def __open_session(self, thread_id) -> tuple[str, bool]:
+        """
+        The session for a thread, created on its first task, and whether it
+        continues an earlier task. Untracked tasks, and a task started while its
+        thread's session is busy, get a new session.
+        """
+        service = self._get_session_service()
+        key = str(thread_id) if thread_id is not None else None
+        if key is None or key in self.busy_sessions:
+            session_id = str(uuid.uuid4())
+            await service.create_session(
+                app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+            )
+            return session_id, False
+
+        follow_up = key in self.sessions
+        if follow_up:
+            self.sessions.move_to_end(key)
+        else:
+            await service.create_session(
+                app_name=APP_NAME, user_id=USER_ID, session_id=key
+            )
+            self.sessions[key] = True
+            idle = [k for k in self.sessions if k not in self.busy_sessions]
+            for old in idle[: max(0, len(self.sessions) - self.max_sessions)]:
+                del self.sessions[old]
+                await service.delete_session(
+                    app_name=APP_NAME, user_id=USER_ID, session_id=old
+                )
+        self.busy_sessions.add(key)
+        return key, follow_up
+
+    async def __close_session(self, session_id, thread_id):
+        if thread_id is not None and session_id == str(thread_id):
+            self.busy_sessions.discard(session_id)
+            return
+        await self._get_session_service().delete_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+        )
+
+    def __get_runner(self, context):
+        """The computer and runner for a pooled context, built on its first lease."""
+        if context not in self.runners:
+            computer = PlaywrightComputer(
+                screen_size=SCREEN_SIZE, context=context, **self.screenshot_options
+            )
+            runner = Runner(
+                app_name=APP_NAME,
+                agent=self.__get_agent(computer),
+                session_service=self._get_session_service(),
+            )
+            self.runners[context] = (computer, runner)
+        return self.runners[context]
+
+    async def _forget_context(self, context):
+        """Closes the runner kept for a context the pool has closed."""
+        entry = self.runners.pop(context, None)
+        if entry is None:
+            return
+        _, runner = entry
+        try:
+            await runner.close()
+        except Exception as e:
+            logger.warning(f"ComputerControlTool: failed to close runner: {e}")
+
+    def _get_session_service(self):
+        if self.session_service is None:
+            self.session_service = InMemorySessionService()
+        return self.session_service
+
+    def _get_pool(self) -> BrowserPool:
+        if self.browser_pool is None:
+            self.browser_pool = BrowserPool(
+                max_size=self.max_browsers,
+                screen_size=SCREEN_SIZE,
+                on_close=self._forget_context,
+            )
+        return self.browser_pool
+
+    async def aclose(self):
+        """Shuts down the runners and the browser pool."""
+        runners = list(self.runners.values())
+        self.runners.clear()
+        for _, runner in runners:
+            await runner.close()
+        if self.browser_pool is not None:
+            await self.browser_pool.close()
+            self.browser_pool = None
 
-        result = "\n".join(replies)
-        if tool_call_id:
-            return ToolMessage(content=result, tool_call_id=tool_call_id)
-        return result
+    def __get_agent(self, computer):
+        async def read_page() -> str:
+            """
+            Returns the text and links on the current page, with the position of
+            each element on the same 1000x1000 grid as your screen coordinates.
+            Cheaper than a screenshot when you only need to read.
+            """
+            return await computer.page_text()
 
-    def __get_agent(self):
         return Agent(
             model="gemini-2.5-computer-use-preview-10-2025",
             name="computer_agent",
@@ -137,7 +307,5 @@ class ComputerControlTool(BaseTool):
                 " tasks."
             ),
             instruction="You are a computer use agent.",
-            tools=[
-                ComputerUseToolset(computer=PlaywrightComputer(screen_size=(1280, 936)))
-            ],
+            tools=[ComputerUseToolset(computer=computer), read_page],
         )
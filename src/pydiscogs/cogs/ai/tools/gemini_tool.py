@@ -0,0 +1,25 @@
+from typing import Any, Optional
+
+from google.genai import Client
+from langchain_core.tools import BaseTool
+
+
+class GeminiTool(BaseTool):
+    """Base for tools that answer with Gemini through one shared genai client."""
+
+    google_api_key: str
+    google_llm_model: str
+    # Created on first use and reused so every call shares one connection pool
+    genai_client: Optional[Any] = None
+
+    def _get_client(self):
+        if self.genai_client is None:
+            self.genai_client = Client(api_key=self.google_api_key)
+        return self.genai_client
+
+    async def aclose(self):
+        """Closes the shared client's connection pools."""
+        if self.genai_client is not None:
+            await self.genai_client.aio.aclose()
+            self.genai_client.close()
+            self.genai_client = None
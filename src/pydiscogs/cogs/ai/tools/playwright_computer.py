@@ -12,7 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import base64
+import logging
 import time
+from collections import OrderedDict
 from typing import Literal, Optional
 
 import termcolor
@@ -21,9 +24,14 @@ from google.adk.tools.computer_use.base_computer import (
     ComputerEnvironment,
     ComputerState,
 )
+from playwright.async_api import Error as PlaywrightError
 from playwright.async_api import async_playwright
 from typing_extensions import override
 
+from .request_filter import RequestFilter
+
+logger = logging.getLogger(__name__)
+
 # Define a mapping from the user-friendly key names to Playwright's expected key names.
 # Playwright is generally good with case-insensitivity for these, but it's best to be canonical.
 # See: https://playwright.dev/docs/api/class-keyboard#keyboard-press
@@ -71,9 +79,160 @@ PLAYWRIGHT_KEY_MAP = {
     "command": "Meta",  # 'Meta' is Command on macOS, Windows key on Windows
 }
 
+# Longest a page may take to settle after an action before it's captured anyway
+SETTLE_TIMEOUT_MS = 3000
+# The DOM counts as settled once it has gone this long without mutating
+DOM_QUIET_MS = 200
+
+# Quality change per step when adapting screenshots to target_screenshot_bytes
+QUALITY_STEP = 10
+# Size bound for a text observation of one page
+TEXT_MAX_CHARS = 20000
+# Text observations kept, keyed by URL and DOM hash, across all computers
+TEXT_CACHE_SIZE = 32
+
+# Resolves once the DOM has been quiet for quietMs with no finite animations
+# running, or after capMs regardless.
+DOM_SETTLE_SCRIPT = """
+([quietMs, capMs]) => new Promise((resolve) => {
+    const start = performance.now();
+    let lastMutation = start;
+    const observer = new MutationObserver(() => { lastMutation = performance.now(); });
+    observer.observe(document, {
+        subtree: true, childList: true, attributes: true, characterData: true,
+    });
+    const check = () => {
+        const now = performance.now();
+        const animating = document.getAnimations().some(
+            (a) => a.playState === "running"
+                && a.effect && a.effect.getTiming().iterations !== Infinity
+        );
+        if ((now - lastMutation >= quietMs && !animating) || now - start >= capMs) {
+            observer.disconnect();
+            resolve();
+        } else {
+            setTimeout(check, 50);
+        }
+    };
+    setTimeout(check, Math.min(quietMs, capMs));
+})
+"""
+
+# Hash of the document and form values, for caching text observations
+DOM_HASH_SCRIPT = """
+() => {
+    const fields = Array.from(
+        document.querySelectorAll("input, textarea, select"), (e) => e.value
+    ).join("\u0000");
+    const text = document.documentElement.outerHTML + "\u0001" + fields;
+    let hash = 0;
+    for (let i = 0; i < text.length; i++) {
+        hash = (hash * 31 + text.charCodeAt(i)) | 0;
+    }
+    return text.length + ":" + hash;
+}
+"""
+
+# Readable text and interactive elements in document order, each with the
+# centre of its box on a 1000x1000 grid over the viewport (the model's
+# coordinate space). Points outside 0-999 need a scroll first.
+PAGE_TEXT_SCRIPT = """
+(maxItems) => {
+    const lines = [];
+    const seen = new Set();
+    const interactive = "a[href], button, input, textarea, select, "
+        + "[role=button], [role=link], [role=checkbox], [role=tab]";
+    const position = (element) => {
+        const rect = element.getBoundingClientRect();
+        if (!rect.width || !rect.height) return null;
+        const x = Math.round((rect.left + rect.width / 2) * 1000 / innerWidth);
+        const y = Math.round((rect.top + rect.height / 2) * 1000 / innerHeight);
+        return `(${x}, ${y})`;
+    };
+    const clean = (text) => (text || "").replace(/\\s+/g, " ").trim();
+    const walker = document.createTreeWalker(
+        document.body, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT
+    );
+    for (let node = walker.nextNode(); node && lines.length < maxItems;
+            node = walker.nextNode()) {
+        const element = node.nodeType === Node.TEXT_NODE ? node.parentElement : node;
+        if (!element || seen.has(element)
+                || element.closest("script, style, noscript, template")
+                || !element.checkVisibility()) {
+            continue;
+        }
+        if (node.nodeType === Node.ELEMENT_NODE) {
+            if (!element.matches(interactive)) continue;
+            seen.add(element);
+            for (const child of element.querySelectorAll("*")) seen.add(child);
+            const where = position(element);
+            if (!where) continue;
+            const tag = element.getAttribute("role") || element.tagName.toLowerCase();
+            const label = clean(element.innerText || element.value
+                || element.getAttribute("aria-label") || element.placeholder);
+            const href = element.tagName === "A" ? ` -> ${element.href}` : "";
+            lines.push(`[${tag}] ${label}${href} ${where}`);
+            continue;
+        }
+        const text = clean(node.textContent);
+        if (!text) continue;
+        const where = position(element);
+        if (where) lines.push(`${text} ${where}`);
+    }
+    return {title: document.title, lines};
+}
+"""
+# Upper bound on lines the page text script collects
+TEXT_MAX_ITEMS = 2000
+
+# Cheap fingerprint of what the viewport shows. Pages whose pixels can change
+# without the DOM changing (video, canvas, running animations) return null.
+FRAME_FINGERPRINT_SCRIPT = """
+() => {
+    if (document.querySelector("video, canvas")
+            || document.getAnimations().some((a) => a.playState === "running")) {
+        return null;
+    }
+    const fields = Array.from(
+        document.querySelectorAll("input, textarea, select"), (e) => e.value
+    ).join("\u0000");
+    const active = document.activeElement ? document.activeElement.tagName : "";
+    const text = [document.documentElement.outerHTML, fields, scrollX, scrollY, active]
+        .join("\u0001");
+    let hash = 0;
+    for (let i = 0; i < text.length; i++) {
+        hash = (hash * 31 + text.charCodeAt(i)) | 0;
+    }
+    return text.length + ":" + hash;
+}
+"""
+
 
 class PlaywrightComputer(BaseComputer):
-    """Computer that controls Chromium via Playwright."""
+    """
+    Computer that controls Chromium via Playwright. Given a browser context, e.g.
+    one leased from a BrowserPool, it drives that context and leaves closing it
+    to the owner; otherwise it launches and closes its own browser.
+
+    Screenshots can be made cheaper for the model:
+    - screenshot_scale downscales them. Coordinates are unaffected, since the
+      model works in a normalized space.
+    - target_screenshot_bytes steps JPEG quality down towards
+      min_screenshot_quality while captures exceed the target, and back up
+      when they're well under it.
+    - roi_size crops the capture after a pointer action to that region around
+      the pointer. The model's next coordinates are mapped back through the
+      crop. Off by default because the model loses sight of the rest of the
+      page until a non-pointer action brings back the full frame.
+
+    page_text() and read_url() observe a page as text instead, which is much
+    cheaper when a task only needs to read.
+
+    Unless block_requests is False, a RequestFilter keeps ads, trackers, media
+    and web fonts from loading; allowed_domains are exempt from it.
+    """
+
+    _text_cache = OrderedDict()
 
     def __init__(
         self,
@@ -82,15 +241,95 @@ class PlaywrightComputer(BaseComputer):
         search_engine_url: str = "https://www.google.com",
         highlight_mouse: bool = False,
         user_data_dir: Optional[str] = None,
+        context=None,
+        screenshot_scale: float = 1.0,
+        screenshot_quality: int = 50,
+        min_screenshot_quality: int = 20,
+        target_screenshot_bytes: Optional[int] = None,
+        roi_size: Optional[tuple[int, int]] = None,
+        block_requests: bool = True,
+        allowed_domains: tuple[str, ...] = (),
     ):
         self._initial_url = initial_url
         self._screen_size = screen_size
         self._search_engine_url = search_engine_url
         self._highlight_mouse = highlight_mouse
         self._user_data_dir = user_data_dir
+        self._leased_context = context
+        self._screenshot_scale = screenshot_scale
+        self._max_quality = screenshot_quality
+        self._min_quality = min(min_screenshot_quality, screenshot_quality)
+        self._quality = screenshot_quality
+        self._target_bytes = target_screenshot_bytes
+        self._roi_size = roi_size
+        self.request_filter = (
+            RequestFilter(allowed_domains=allowed_domains) if block_requests else None
+        )
+        self._filtered_context = None
+        self._cdp = None
+        self._mouse = None
+        self._roi_url = None
+        self._last_clip = None
+        self._last_fingerprint = None
+        self._last_screenshot = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Starts the counters stats() reports over, e.g. for a new task."""
+        self.screenshots_taken = 0
+        self.screenshots_reused = 0
+        self.bytes_sent = 0
+        self.settle_seconds = 0.0
+        # Screenshots and text observations both settle the page first
+        self.settles = 0
+        self.text_observations = 0
+        self.text_cache_hits = 0
+        if self.request_filter:
+            self.request_filter.reset()
+
+    async def _filter_requests(self):
+        if self.request_filter and self._filtered_context is not self._context:
+            await self.request_filter.install(self._context)
+            self._filtered_context = self._context
+
+    async def attach(self):
+        """Takes over the first page of the leased context for a new task."""
+        # Nothing a previous task saw or captured applies to this one
+        if self._cdp is not None:
+            try:
+                await self._cdp.detach()
+            except PlaywrightError as e:
+                logger.debug(f"Could not detach DevTools session: {e}")
+        self._cdp = None
+        self._mouse = None
+        self._roi_url = None
+        self._last_clip = None
+        self._last_fingerprint = None
+        self._last_screenshot = None
+        self._context = self._leased_context
+        await self._filter_requests()
+        self._page = (
+            self._context.pages[0]
+            if self._context.pages
+            else await self._context.new_page()
+        )
+        await self._page.set_viewport_size(
+            {
+                "width": self._screen_size[0],
+                "height": self._screen_size[1],
+            }
+        )
 
     @override
     async def initialize(self):
+        if self._leased_context:
+            # A leased computer is initialized again for every task, and the
+            # pool leaves a returned context on a blank page
+            await self.attach()
+            if self._page.url == "about:blank":
+                await self._page.goto(self._initial_url)
+            return
+
         print("Creating session...")
         self._playwright = await async_playwright().start()
         # Define common arguments for both launch types
@@ -128,6 +367,7 @@ class PlaywrightComputer(BaseComputer):
                 user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
             )
 
+        await self._filter_requests()
         if not self._context.pages:
             self._page = await self._context.new_page()
             await self._page.goto(self._initial_url)
@@ -151,7 +391,9 @@ class PlaywrightComputer(BaseComputer):
         return ComputerEnvironment.ENVIRONMENT_BROWSER
 
     @override
-    async def close(self, exc_type, exc_val, exc_tb):
+    async def close(self, exc_type=None, exc_val=None, exc_tb=None):
+        if self._leased_context:
+            return
         if self._context:
             await self._context.close()
         try:
@@ -170,14 +412,18 @@ class PlaywrightComputer(BaseComputer):
         return await self.current_state()
 
     async def click_at(self, x: int, y: int):
+        x, y = self._to_page(x, y)
         await self.highlight_mouse(x, y)
         await self._page.mouse.click(x, y)
+        self._track_pointer(x, y)
         await self._page.wait_for_load_state()
         return await self.current_state()
 
     async def hover_at(self, x: int, y: int):
+        x, y = self._to_page(x, y)
         await self.highlight_mouse(x, y)
         await self._page.mouse.move(x, y)
+        self._track_pointer(x, y)
         await self._page.wait_for_load_state()
         return await self.current_state()
 
@@ -189,8 +435,10 @@ class PlaywrightComputer(BaseComputer):
         press_enter: bool = True,
         clear_before_typing: bool = True,
     ) -> ComputerState:
+        x, y = self._to_page(x, y)
         await self.highlight_mouse(x, y)
         await self._page.mouse.click(x, y)
+        self._track_pointer(x, y)
         await self._page.wait_for_load_state()
         if clear_before_typing:
             await self.key_combination(["Control", "A"])
@@ -236,8 +484,10 @@ class PlaywrightComputer(BaseComputer):
         direction: Literal["up", "down", "left", "right"],
         magnitude: int,
     ) -> ComputerState:
+        x, y = self._to_page(x, y)
         await self.highlight_mouse(x, y)
         await self._page.mouse.move(x, y)
+        self._track_pointer(x, y)
         await self._page.wait_for_load_state()
         dx = 0
         dy = 0
@@ -292,6 +542,8 @@ class PlaywrightComputer(BaseComputer):
     async def drag_and_drop(
         self, x: int, y: int, destination_x: int, destination_y: int
     ) -> ComputerState:
+        x, y = self._to_page(x, y)
+        destination_x, destination_y = self._to_page(destination_x, destination_y)
         await self.highlight_mouse(x, y)
         await self._page.mouse.move(x, y)
         await self._page.wait_for_load_state()
@@ -299,20 +551,199 @@ class PlaywrightComputer(BaseComputer):
         await self._page.wait_for_load_state()
         await self.highlight_mouse(destination_x, destination_y)
         await self._page.mouse.move(destination_x, destination_y)
+        self._track_pointer(destination_x, destination_y)
         await self._page.wait_for_load_state()
         await self._page.mouse.up()
         return await self.current_state()
 
     async def current_state(self) -> ComputerState:
-        await self._page.wait_for_load_state()
-        # Even if Playwright reports the page as loaded, it may not be so.
-        # Add a manual sleep to make sure the page has finished rendering.
-        time.sleep(0.5)
-        screenshot_bytes = await self._page.screenshot(
-            type="jpeg", quality=50, full_page=False
-        )
+        await self._settle()
+        clip = self._capture_clip()
+        # An action that changed nothing on screen doesn't need a new screenshot
+        fingerprint = await self._frame_fingerprint()
+        if fingerprint is not None:
+            fingerprint = (*fingerprint, clip)
+        if fingerprint is not None and fingerprint == self._last_fingerprint:
+            self.screenshots_reused += 1
+            screenshot_bytes = self._last_screenshot
+        else:
+            screenshot_bytes = await self._capture(clip)
+            self.screenshots_taken += 1
+            self._last_fingerprint = fingerprint
+            self._last_screenshot = screenshot_bytes
+        self._last_clip = clip
+        self.bytes_sent += len(screenshot_bytes)
         return ComputerState(screenshot=screenshot_bytes, url=self._page.url)
 
+    def _track_pointer(self, x: int, y: int):
+        self._mouse = (x, y)
+        self._roi_url = self._page.url
+
+    def _to_page(self, x: int, y: int) -> tuple[int, int]:
+        """Maps coordinates the model picked on the last screenshot to the page."""
+        if not self._last_clip:
+            return x, y
+        clip_x, clip_y, width, height = self._last_clip
+        return (
+            clip_x + round(x * width / self._screen_size[0]),
+            clip_y + round(y * height / self._screen_size[1]),
+        )
+
+    def _capture_clip(self):
+        """The region to capture: around the pointer after a pointer action."""
+        pending, self._roi_url = self._roi_url, None
+        if not (self._roi_size and pending and pending == self._page.url):
+            return None
+        screen_width, screen_height = self._screen_size
+        width = min(self._roi_size[0], screen_width)
+        height = min(self._roi_size[1], screen_height)
+        x = min(max(self._mouse[0] - width // 2, 0), screen_width - width)
+        y = min(max(self._mouse[1] - height // 2, 0), screen_height - height)
+        return (x, y, width, height)
+
+    async def _capture(self, clip) -> bytes:
+        """Takes a screenshot, stepping quality down while it's over budget."""
+        while True:
+            data = await self._screenshot(clip, self._quality)
+            if (
+                not self._target_bytes
+                or len(data) <= self._target_bytes
+                or self._quality <= self._min_quality
+            ):
+                break
+            self._quality = max(self._min_quality, self._quality - QUALITY_STEP)
+        if self._target_bytes and len(data) < self._target_bytes / 2:
+            self._quality = min(self._max_quality, self._quality + QUALITY_STEP)
+        return data
+
+    async def _screenshot(self, clip, quality: int) -> bytes:
+        if self._screenshot_scale >= 1:
+            region = None
+            if clip:
+                region = dict(zip(("x", "y", "width", "height"), clip))
+            return await self._page.screenshot(
+                type="jpeg", quality=quality, full_page=False, clip=region
+            )
+
+        # Playwright can't scale captures, but Chromium's DevTools protocol can
+        if self._cdp is None:
+            self._cdp = await self._context.new_cdp_session(self._page)
+        x, y, width, height = clip or (0, 0, *self._screen_size)
+        # DevTools clips are relative to the document, not the viewport
+        left, top = await self._page.evaluate(
+            "() => [visualViewport.pageLeft, visualViewport.pageTop]"
+        )
+        result = await self._cdp.send(
+            "Page.captureScreenshot",
+            {
+                "format": "jpeg",
+                "quality": quality,
+                "clip": {
+                    "x": x + left,
+                    "y": y + top,
+                    "width": width,
+                    "height": height,
+                    "scale": self._screenshot_scale,
+                },
+            },
+        )
+        return base64.b64decode(result["data"])
+
+    async def _settle(self):
+        """
+        Waits, up to SETTLE_TIMEOUT_MS in total, for the network to go quiet and
+        then for the DOM to stop changing. Playwright reporting the page as
+        loaded doesn't mean it has finished rendering.
+        """
+        start = time.monotonic()
+        try:
+            await self._page.wait_for_load_state(
+                "networkidle", timeout=SETTLE_TIMEOUT_MS
+            )
+        except PlaywrightError:
+            pass  # Pages that keep polling never go idle
+
+        remaining = SETTLE_TIMEOUT_MS - (time.monotonic() - start) * 1000
+        if remaining > 0:
+            try:
+                await self._page.evaluate(
+                    DOM_SETTLE_SCRIPT, [DOM_QUIET_MS, int(remaining)]
+                )
+            except PlaywrightError as e:
+                # Usually a navigation replacing the document mid-check
+                logger.debug(f"DOM settle check interrupted: {e}")
+                await self._page.wait_for_load_state()
+        self.settle_seconds += time.monotonic() - start
+        self.settles += 1
+
+    async def _frame_fingerprint(self):
+        try:
+            dom_hash = await self._page.evaluate(FRAME_FINGERPRINT_SCRIPT)
+        except PlaywrightError as e:
+            logger.debug(f"Could not fingerprint frame: {e}")
+            return None
+        if dom_hash is None:
+            return None
+        return (self._page.url, self._mouse, dom_hash)
+
+    async def read_url(self, url: str, max_chars: int = TEXT_MAX_CHARS) -> str:
+        """Opens url and returns its text observation without a screenshot."""
+        await self._page.goto(url)
+        return await self.page_text(max_chars)
+
+    async def page_text(self, max_chars: int = TEXT_MAX_CHARS) -> str:
+        """
+        The page's readable text and interactive elements with their positions,
+        cut to max_chars. Cached while the URL and DOM are unchanged.
+        """
+        await self._settle()
+        url = self._page.url
+        try:
+            dom_hash = await self._page.evaluate(DOM_HASH_SCRIPT)
+        except PlaywrightError as e:
+            logger.debug(f"Could not hash DOM: {e}")
+            dom_hash = None
+        key = (url, dom_hash, max_chars)
+        if dom_hash is not None and key in self._text_cache:
+            self._text_cache.move_to_end(key)
+            self.text_cache_hits += 1
+            return self._text_cache[key]
+
+        page = await self._page.evaluate(PAGE_TEXT_SCRIPT, TEXT_MAX_ITEMS)
+        text = "\n".join(
+            [
+                f"URL: {url}",
+                f"Title: {page['title']}",
+                "Positions are (x, y) on a 1000x1000 grid over the visible screen.",
+                *page["lines"],
+            ]
+        )
+        if len(text) > max_chars:
+            text = text[:max_chars] + f"\n... [truncated {len(text) - max_chars} chars]"
+        self.text_observations += 1
+
+        if dom_hash is not None:
+            self._text_cache[key] = text
+            while len(self._text_cache) > TEXT_CACHE_SIZE:
+                self._text_cache.popitem(last=False)
+        return text
+
+    def stats(self) -> dict:
+        actions = self.screenshots_taken + self.screenshots_reused
+        return {
+            "screenshots_taken": self.screenshots_taken,
+            "screenshots_reused": self.screenshots_reused,
+            "bytes_sent": self.bytes_sent,
+            "bytes_per_action": self.bytes_sent // actions if actions else 0,
+            "jpeg_quality": self._quality,
+            "text_observations": self.text_observations,
+            "text_cache_hits": self.text_cache_hits,
+            "avg_settle_seconds": (
+                round(self.settle_seconds / self.settles, 3) if self.settles else 0.0
+            ),
+            **(self.request_filter.stats() if self.request_filter else {}),
+        }
+
     async def screen_size(self) -> tuple[int, int]:
         return self._screen_size
 
@@ -345,4 +776,4 @@ class PlaywrightComputer(BaseComputer):
         """
         )
         # Wait a bit for the user to see the cursor.
-        time.sleep(1)
+        await asyncio.sleep(1)
@@ -1,15 +1,48 @@
 import logging
+import math
 import os
 import re
 from enum import Enum
-from typing import Optional, Type
+from types import SimpleNamespace
+from typing import Any, Optional, Type
 
 from langchain_core.tools import BaseTool
 from pydantic.v1 import BaseModel, Field
 from xdk import Client
 
+from pydiscogs.cogs.ai.tools.result_cache import ToolResultCache
+
 logger = logging.getLogger(__name__)
 
+# The posts lookup endpoint accepts at most this many IDs per request
+MAX_IDS_PER_REQUEST = 100
+# Rough size of a token, as in langchain_core's count_tokens_approximately
+CHARS_PER_TOKEN = 4
+# Sections of a formatted post, most relevant first. The first three are
+# always kept; the rest are left out from the end when a post is too big.
+SECTION_RANKING = [
+    "post",
+    "article",
+    "author",
+    "referenced tweets",
+    "links",
+    "poll",
+    "media",
+    "mentions",
+    "hashtags",
+    "bio",
+    "metrics",
+    "location",
+    "metadata",
+]
+ESSENTIAL_SECTIONS = 3
+# Upper bound on what an article extract adds besides the text itself
+EXTRACT_NOTES_CHARS = 200
+
+
+def approx_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
 
 class TweetField(str, Enum):
     """Available tweet fields from X API v2."""
@@ -221,7 +254,19 @@ DEFAULT_PLACE_FIELDS = [
 
 
 class ReadXPostInput(BaseModel):
-    url_or_id: str = Field(description="The URL or ID of the X (Twitter) post to read.")
+    url_or_id: str = Field(
+        description=(
+            "The URL or ID of the X (Twitter) post to read. Several posts can be"
+            " read at once by separating their URLs or IDs with spaces or commas."
+        )
+    )
+    article_offset: int = Field(
+        0,
+        description=(
+            "Where to continue a long article from, as given in an earlier result"
+            " that was cut short."
+        ),
+    )
 
 
 class ReadXPostTool(BaseTool):
@@ -229,8 +274,19 @@ class ReadXPostTool(BaseTool):
     cannot be read by normal web or url reading tools."""
 
     name: str = "read_x_post"
-    description: str = "Reads the content of an X (Twitter) post given its URL or ID."
+    description: str = (
+        "Reads the content of one or more X (Twitter) posts given their URLs or IDs."
+    )
     args_schema: Type[BaseModel] = ReadXPostInput
+    # Built from X_BEARER_TOKEN on the first read and kept for later ones
+    x_client: Optional[Any] = None
+    # Posts by ID, so a post read again within cache_ttl costs no API call
+    post_cache: Optional[Any] = None
+    cache_ttl: float = 300.0
+    max_cached_posts: int = 500
+    # Approximate token limits for one formatted post and for a whole result
+    max_post_tokens: int = 1500
+    max_result_tokens: int = 6000
 
     # Configurable fields and expansions
     tweet_fields: list[TweetField] = DEFAULT_TWEET_FIELDS
@@ -240,22 +296,72 @@ class ReadXPostTool(BaseTool):
     user_fields: list[UserField] = DEFAULT_USER_FIELDS
     place_fields: list[PlaceField] = DEFAULT_PLACE_FIELDS
 
-    def _run(self, url_or_id: str) -> str:
+    def _get_client(self):
+        if self.x_client is None:
+            self.x_client = Client(
+                bearer_token=os.getenv("X_BEARER_TOKEN"),
+            )
+        return self.x_client
+
+    def _get_cache(self) -> ToolResultCache:
+        if self.post_cache is None:
+            self.post_cache = ToolResultCache(max_entries=self.max_cached_posts)
+        return self.post_cache
+
+    def _run(self, url_or_id: str, article_offset: int = 0) -> str:
         """Use the tool."""
-        post_id = self._extract_post_id(url_or_id)
-        if not post_id:
+        post_ids = self._extract_post_ids(url_or_id)
+        if not post_ids:
             return "Error: Could not extract a valid post ID from the input."
 
         logger.info("'Lay off me, daddy.' - Sean Michaels")
 
         try:
-            client = Client(
-                bearer_token=os.getenv("X_BEARER_TOKEN"),
-            )
+            posts = self._fetch_posts(post_ids)
+        except Exception as e:
+            logger.error(f"Error reading X post: {e}", exc_info=True)
+            return f"Error reading X post: {str(e)}"
 
+        # Posts are joined by blank lines, which cost under a token each
+        max_tokens = min(
+            self.max_post_tokens,
+            (self.max_result_tokens - len(post_ids)) // len(post_ids),
+        )
+        results = []
+        for post_id in post_ids:
+            if post_id in posts:
+                post, response = posts[post_id]
+                results.append(
+                    self._format_post_data(post, response, max_tokens, article_offset)
+                )
+            else:
+                results.append(f"Error: No post found with ID {post_id}.")
+        return "\n\n".join(results)
+
+    def _fetch_posts(self, post_ids: list[str]) -> dict:
+        """
+        Maps each post ID that exists to (post, response) for _format_post_data,
+        from the cache where possible and otherwise in batches of
+        MAX_IDS_PER_REQUEST.
+        """
+        cache = self._get_cache()
+        found = {}
+        missing = []
+        for post_id in post_ids:
+            cached = cache.get(self._cache_key(post_id))
+            if cached is not None:
+                found[post_id] = cached
+            else:
+                missing.append(post_id)
+
+        while missing:
+            batch, missing = (
+                missing[:MAX_IDS_PER_REQUEST],
+                missing[MAX_IDS_PER_REQUEST:],
+            )
             # Build parameters with configured fields (as lists, not comma-separated strings)
             params = {
-                "ids": [post_id],
+                "ids": batch,
                 "tweet_fields": [field.value for field in self.tweet_fields],
                 "expansions": [exp.value for exp in self.expansions],
                 "media_fields": [field.value for field in self.media_fields],
@@ -264,66 +370,129 @@ class ReadXPostTool(BaseTool):
                 "place_fields": [field.value for field in self.place_fields],
             }
 
-            response = client.posts.get_by_ids(**params)
-
+            response = self._get_client().posts.get_by_ids(**params)
             if not response or not response.data:
-                return f"Error: No post found with ID {post_id}."
+                continue
 
             logger.debug(f"Full X Post Data: {response.data}")
-
-            # Format comprehensive response
-            post = response.data[0]
-            result = self._format_post_data(post, response)
-
-            return result
-
-        except Exception as e:
-            logger.error(f"Error reading X post: {e}", exc_info=True)
-            return f"Error reading X post: {str(e)}"
-
-    def _format_post_data(self, post: dict, response) -> str:
-        """Format the post data into a readable string with all available information."""
-        lines = ["=== X Post ===\n"]
+            for post in response.data:
+                # A lone post keeps the whole response; in a batch each post
+                # only gets the includes it links to
+                entry = (
+                    (post, response)
+                    if len(batch) == 1
+                    else (post, self._response_for(post, response))
+                )
+                post_id = str(post.get("id", batch[0]))
+                found[post_id] = entry
+                cache.put(self._cache_key(post_id), entry, ttl=self.cache_ttl)
+        return found
+
+    def _cache_key(self, post_id: str) -> str:
+        return ToolResultCache.make_key(self.name, "", post_id)
+
+    @staticmethod
+    def _response_for(post: dict, response):
+        """A response holding only the includes that one post of a batch links to."""
+        includes = getattr(response, "includes", None)
+        attachments = post.get("attachments") or {}
+        links = {
+            "users": ("id", {post.get("author_id")}),
+            "media": ("media_key", set(attachments.get("media_keys") or [])),
+            "polls": ("id", set(attachments.get("poll_ids") or [])),
+            "places": ("id", {(post.get("geo") or {}).get("place_id")}),
+        }
+        return SimpleNamespace(
+            includes=SimpleNamespace(
+                **{
+                    name: [
+                        item
+                        for item in getattr(includes, name, None) or []
+                        if item.get(key) in ids
+                    ]
+                    for name, (key, ids) in links.items()
+                }
+            )
+        )
+
+    def _format_post_data(
+        self,
+        post: dict,
+        response,
+        max_tokens: Optional[int] = None,
+        article_offset: int = 0,
+    ) -> str:
+        """
+        Format the post data into a readable string of about max_tokens at most
+        (max_post_tokens by default). A long article is cut to a head and tail
+        extract that says how to read on, then sections are left out, least
+        relevant first, until the post fits.
+        """
+        max_tokens = max_tokens or self.max_post_tokens
+        sections = self._post_sections(post, response, article_offset)
+
+        def render():
+            return "\n".join(line for lines in sections.values() for line in lines)
+
+        text = render()
+        body = ((post.get("article") or {}).get("plain_text") or "")[article_offset:]
+        if body and approx_tokens(text) > max_tokens:
+            other_tokens = approx_tokens(text) - approx_tokens(body)
+            # Leaves room for the extract's notes on what was cut and how to read on
+            max_chars = max(
+                0,
+                max(max_tokens - other_tokens, max_tokens // 2) * CHARS_PER_TOKEN
+                - EXTRACT_NOTES_CHARS,
+            )
+            sections["article"] = self._article_lines(post, article_offset, max_chars)
+            text = render()
+
+        omitted = []
+        for name in reversed(SECTION_RANKING[ESSENTIAL_SECTIONS:]):
+            if approx_tokens(text) <= max_tokens:
+                break
+            if sections.pop(name, None):
+                omitted.append(name)
+                text = render()
+
+        note = f"\n\n[Left out to save space: {', '.join(omitted)}]" if omitted else ""
+        limit = max_tokens * CHARS_PER_TOKEN - len(note)
+        if len(text) > limit:
+            marker = "\n[... post cut short ...]"
+            text = text[: max(0, limit - len(marker))] + marker
+        text += note
+        logger.info(f"X post {post.get('id', 'N/A')}: ~{approx_tokens(text)} tokens")
+        return text
+
+    def _post_sections(self, post: dict, response, article_offset: int = 0) -> dict:
+        """The post's sections by name (see SECTION_RANKING) in display order."""
+        sections = {}
 
         # Basic info
+        lines = ["=== X Post ===\n"]
         lines.append(f"Text: {post.get('text', 'N/A')}")
         lines.append(f"ID: {post.get('id', 'N/A')}")
 
         if "created_at" in post:
             lines.append(f"Created: {post['created_at']}")
+        sections["post"] = lines
 
         # Article content (expanded content from X articles)
         if "article" in post:
-            article = post["article"]
-            lines.append("\n=== Article Content ===")
-
-            if "title" in article:
-                lines.append(f"\nTitle: {article['title']}")
-
-            # if 'preview_text' in article:
-            #     lines.append(f"\nPreview: {article['preview_text']}")
-
-            if "plain_text" in article:
-                lines.append("\n--- Full Article Text ---")
-                lines.append(article["plain_text"])
-                lines.append("--- End Article Text ---")
-
-            if "cover_media" in article:
-                lines.append(f"\nCover Media ID: {article['cover_media']}")
-
-            if "media_entities" in article and article["media_entities"]:
-                lines.append(f"Article Media: {', '.join(article['media_entities'])}")
+            sections["article"] = self._article_lines(post, article_offset)
 
         # Metrics
         if "public_metrics" in post:
             metrics = post["public_metrics"]
-            lines.append("\nEngagement Metrics:")
-            lines.append(f"  - Retweets: {metrics.get('retweet_count', 0)}")
-            lines.append(f"  - Replies: {metrics.get('reply_count', 0)}")
-            lines.append(f"  - Likes: {metrics.get('like_count', 0)}")
-            lines.append(f"  - Quotes: {metrics.get('quote_count', 0)}")
-            lines.append(f"  - Bookmarks: {metrics.get('bookmark_count', 0)}")
-            lines.append(f"  - Impressions: {metrics.get('impression_count', 0)}")
+            sections["metrics"] = [
+                "\nEngagement Metrics:",
+                f"  - Retweets: {metrics.get('retweet_count', 0)}",
+                f"  - Replies: {metrics.get('reply_count', 0)}",
+                f"  - Likes: {metrics.get('like_count', 0)}",
+                f"  - Quotes: {metrics.get('quote_count', 0)}",
+                f"  - Bookmarks: {metrics.get('bookmark_count', 0)}",
+                f"  - Impressions: {metrics.get('impression_count', 0)}",
+            ]
 
         # Author info (from includes)
         if hasattr(response, "includes") and response.includes:
@@ -331,9 +500,10 @@ class ReadXPostTool(BaseTool):
 
             if hasattr(includes, "users") and includes.users:
                 user = includes.users[0]
-                lines.append(
+                sections["author"] = [
                     f"\nAuthor: @{user.get('username', 'N/A')} ({user.get('name', 'N/A')})"
-                )
+                ]
+                lines = []
                 if "description" in user:
                     lines.append(f"Bio: {user['description']}")
                 if "public_metrics" in user:
@@ -341,10 +511,12 @@ class ReadXPostTool(BaseTool):
                     lines.append(
                         f"Followers: {um.get('followers_count', 0)} | Following: {um.get('following_count', 0)}"
                     )
+                if lines:
+                    sections["bio"] = lines
 
             # Media info
             if hasattr(includes, "media") and includes.media:
-                lines.append(f"\nMedia: {len(includes.media)} item(s)")
+                lines = [f"\nMedia: {len(includes.media)} item(s)"]
                 for i, media in enumerate(includes.media, 1):
                     media_type = media.get("type", "unknown")
                     lines.append(f"  {i}. Type: {media_type}")
@@ -352,49 +524,54 @@ class ReadXPostTool(BaseTool):
                         lines.append(f"     URL: {media['url']}")
                     if "alt_text" in media:
                         lines.append(f"     Alt: {media['alt_text']}")
+                sections["media"] = lines
 
             # Poll info
             if hasattr(includes, "polls") and includes.polls:
                 poll = includes.polls[0]
-                lines.append(f"\nPoll: {poll.get('voting_status', 'unknown')}")
+                lines = [f"\nPoll: {poll.get('voting_status', 'unknown')}"]
                 if "options" in poll:
                     for opt in poll["options"]:
                         lines.append(
                             f"  - {opt.get('label', 'N/A')}: {opt.get('votes', 0)} votes"
                         )
+                sections["poll"] = lines
 
             # Place info
             if hasattr(includes, "places") and includes.places:
                 place = includes.places[0]
-                lines.append(f"\nLocation: {place.get('full_name', 'N/A')}")
+                sections["location"] = [f"\nLocation: {place.get('full_name', 'N/A')}"]
 
         # Entities (URLs, mentions, hashtags)
         if "entities" in post:
             entities = post["entities"]
             if "urls" in entities and entities["urls"]:
-                lines.append(f"\nURLs: {len(entities['urls'])} link(s)")
+                lines = [f"\nURLs: {len(entities['urls'])} link(s)"]
                 for url in entities["urls"]:
                     lines.append(
                         f"  - {url.get('expanded_url', url.get('url', 'N/A'))}"
                     )
+                sections["links"] = lines
 
             if "mentions" in entities and entities["mentions"]:
                 mentions = [f"@{m['username']}" for m in entities["mentions"]]
-                lines.append(f"\nMentions: {', '.join(mentions)}")
+                sections["mentions"] = [f"\nMentions: {', '.join(mentions)}"]
 
             if "hashtags" in entities and entities["hashtags"]:
                 hashtags = [f"#{h['tag']}" for h in entities["hashtags"]]
-                lines.append(f"\nHashtags: {', '.join(hashtags)}")
+                sections["hashtags"] = [f"\nHashtags: {', '.join(hashtags)}"]
 
         # Referenced tweets (replies, quotes, retweets)
         if "referenced_tweets" in post:
-            lines.append("\nReferenced Tweets:")
+            lines = ["\nReferenced Tweets:"]
             for ref in post["referenced_tweets"]:
                 lines.append(
                     f"  - {ref.get('type', 'unknown')}: {ref.get('id', 'N/A')}"
                 )
+            sections["referenced tweets"] = lines
 
         # Additional metadata
+        lines = []
         if "lang" in post:
             lines.append(f"\nLanguage: {post['lang']}")
 
@@ -403,8 +580,67 @@ class ReadXPostTool(BaseTool):
 
         if "conversation_id" in post:
             lines.append(f"Conversation ID: {post['conversation_id']}")
+        if lines:
+            sections["metadata"] = lines
+
+        return sections
+
+    def _article_lines(
+        self, post: dict, offset: int = 0, max_chars: Optional[int] = None
+    ) -> list[str]:
+        """
+        The article section, with its text from offset on. Text longer than
+        max_chars is cut to a head and tail extract, or to a window when
+        continuing from an offset, followed by where to read on from.
+        """
+        article = post["article"]
+        lines = ["\n=== Article Content ==="]
+
+        if "title" in article:
+            lines.append(f"\nTitle: {article['title']}")
+
+        # if 'preview_text' in article:
+        #     lines.append(f"\nPreview: {article['preview_text']}")
+
+        if "plain_text" in article:
+            body = article["plain_text"][offset:]
+            if max_chars is None or len(body) <= max_chars:
+                heading = "Full Article Text" if not offset else "Article Text"
+                lines.append(f"\n--- {heading} ---")
+                lines.append(body or "(No more article text.)")
+                lines.append("--- End Article Text ---")
+            else:
+                head_chars = max_chars if offset else max_chars * 3 // 4
+                head = body[:head_chars]
+                lines.append("\n--- Article Text (extract) ---")
+                lines.append(head)
+                tail_chars = max_chars - head_chars
+                if tail_chars:
+                    lines.append(
+                        f"[... {len(body) - head_chars - tail_chars} characters left out ...]"
+                    )
+                    lines.append(body[-tail_chars:])
+                lines.append("--- End Article Extract ---")
+                lines.append(
+                    f"(To read on, call read_x_post with url_or_id={post.get('id')}"
+                    f" and article_offset={offset + head_chars}.)"
+                )
 
-        return "\n".join(lines)
+        if "cover_media" in article:
+            lines.append(f"\nCover Media ID: {article['cover_media']}")
+
+        if "media_entities" in article and article["media_entities"]:
+            lines.append(f"Article Media: {', '.join(article['media_entities'])}")
+        return lines
+
+    def _extract_post_ids(self, urls_or_ids: str) -> list[str]:
+        """The post IDs in a string of URLs or IDs, in order and without repeats."""
+        post_ids = []
+        for part in re.split(r"[\s,]+", urls_or_ids.strip()):
+            post_id = self._extract_post_id(part)
+            if post_id and post_id not in post_ids:
+                post_ids.append(post_id)
+        return post_ids
 
     def _extract_post_id(self, url_or_id: str) -> Optional[str]:
         # Check if it's already just digits
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Stands for a missing or expired entry, so None can be cached like any value
+_MISSING = object()
+
+
+class ToolResultCache:
+    """
+    Size-bounded TTL cache for tool results, shared between tools. Concurrent
+    requests for the same key wait for the first caller instead of each making
+    their own upstream call.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._ainflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        tool_name: str, model: str, query: str, urls: list[str] = None, date: str = None
+    ) -> str:
+        """Builds a key that ignores case, extra whitespace and URL ordering."""
+        normalized_query = " ".join(query.lower().split())
+        normalized_urls = sorted(url.strip().rstrip("/") for url in urls or [])
+        payload = json.dumps(
+            [tool_name, model, normalized_query, normalized_urls, date]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_or_compute(self, key: str, compute, ttl: float):
+        """Returns the cached value for key, calling compute() at most once."""
+        with self._lock:
+            cached = self._get(key)
+            if cached is not _MISSING:
+                self.hits += 1
+                return cached
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not owner:
+            logger.debug(f"Tool cache: waiting on in-flight request {key[:12]}")
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._put(key, value, ttl)
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    async def aget_or_compute(self, key: str, compute, ttl: float):
+        """
+        Async version of get_or_compute; compute() must return an awaitable. If the
+        caller running compute() is cancelled, one of the waiters takes over.
+        """
+        while True:
+            with self._lock:
+                cached = self._get(key)
+                if cached is not _MISSING:
+                    self.hits += 1
+                    return cached
+                future = self._ainflight.get(key)
+                owner = future is None
+                if owner:
+                    future = asyncio.get_running_loop().create_future()
+                    self._ainflight[key] = future
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+            if owner:
+                break
+            logger.debug(f"Tool cache: waiting on in-flight request {key[:12]}")
+            # Shielded so a cancelled waiter does not cancel the shared request
+            value = await asyncio.shield(future)
+            if value is not _MISSING:
+                return value
+            logger.debug(f"Tool cache: owner of {key[:12]} was cancelled, retrying")
+
+        try:
+            value = await compute()
+        except BaseException as e:
+            with self._lock:
+                del self._ainflight[key]
+            if isinstance(e, asyncio.CancelledError):
+                # Wakes the waiters so one of them retries as the new owner
+                future.set_result(_MISSING)
+            else:
+                future.set_exception(e)
+                # Marks the exception as retrieved when nobody else was waiting
+                future.exception()
+            raise
+
+        with self._lock:
+            self._put(key, value, ttl)
+            del self._ainflight[key]
+        future.set_result(value)
+        return value
+
+    def get(self, key: str, default=None):
+        """Returns the cached value for key, or default if it's missing or expired."""
+        with self._lock:
+            value = self._get(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value, ttl: float):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key: str, value, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
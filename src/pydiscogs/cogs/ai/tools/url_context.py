@@ -1,10 +1,10 @@
 import logging
-from typing import List, Type
+from typing import Any, List, Optional, Type
 
-from google.genai import Client
-from langchain_core.tools import BaseTool
 from pydantic.v1 import BaseModel, Field
 
+from pydiscogs.cogs.ai.tools.gemini_tool import GeminiTool
+from pydiscogs.cogs.ai.tools.result_cache import ToolResultCache
 from pydiscogs.utils.prompts import get_current_date, url_context_instructions
 
 logger = logging.getLogger(__name__)
@@ -17,7 +17,7 @@ class UrlContextInput(BaseModel):
     query: str = Field(description="The research query or topic.")
 
 
-class UrlContextTool(BaseTool):
+class UrlContextTool(GeminiTool):
     """A tool for performing research using a list of URLs as context."""
 
     name: str = "url_context"
@@ -25,26 +25,59 @@ class UrlContextTool(BaseTool):
         "Performs web research on a given topic using the content of the provided URLs as context."
     )
     args_schema: Type[BaseModel] = UrlContextInput
-    google_api_key: str
-    google_llm_model: str
+    result_cache: Optional[Any] = None
+    cache_ttl: float = 3600.0
 
-    def _run(self, urls: List[str], query: str):
-        """Use the tool."""
+    def _request(self, urls: List[str], query: str) -> dict:
         url_string = " ".join(urls)
         formatted_prompt = url_context_instructions.format(
             current_date=get_current_date(),
             research_topic=f"Compare the information from the following URLs: {url_string} to answer the question: {query}",
         )
-
-        genai_client = Client(api_key=self.google_api_key)
-
-        response = genai_client.models.generate_content(
-            model=self.google_llm_model,
-            contents=formatted_prompt,
-            config={
+        return {
+            "model": self.google_llm_model,
+            "contents": formatted_prompt,
+            "config": {
                 "tools": [{"url_context": {}}],
                 "temperature": 0,
             },
+        }
+
+    def _cache_key(self, urls: List[str], query: str) -> str:
+        return ToolResultCache.make_key(
+            self.name, self.google_llm_model, query, urls, date=get_current_date()
+        )
+
+    def _run(self, urls: List[str], query: str):
+        """Use the tool."""
+        if self.result_cache is None:
+            return self._research(urls, query)
+        return self.result_cache.get_or_compute(
+            self._cache_key(urls, query),
+            lambda: self._research(urls, query),
+            ttl=self.cache_ttl,
+        )
+
+    async def _arun(self, urls: List[str], query: str):
+        """Use the tool asynchronously."""
+        if self.result_cache is None:
+            return await self._aresearch(urls, query)
+        return await self.result_cache.aget_or_compute(
+            self._cache_key(urls, query),
+            lambda: self._aresearch(urls, query),
+            ttl=self.cache_ttl,
+        )
+
+    def _research(self, urls: List[str], query: str):
+        response = self._get_client().models.generate_content(
+            **self._request(urls, query)
+        )
+        logger.debug(f"url_context tool response: {response}")
+        return response.text
+
+    async def _aresearch(self, urls: List[str], query: str):
+        response = await self._get_client().aio.models.generate_content(
+            **self._request(urls, query)
         )
         logger.debug(f"url_context tool response: {response}")
         return response.text
@@ -1,10 +1,10 @@
-from typing import Type
+from typing import Any, Optional, Type
 
-from google.genai import Client
-from langchain_core.tools import BaseTool
 from pydantic.v1 import BaseModel, Field
 
 # from pydiscogs.utils.gemini import get_citations, insert_citation_markers, resolve_urls
+from pydiscogs.cogs.ai.tools.gemini_tool import GeminiTool
+from pydiscogs.cogs.ai.tools.result_cache import ToolResultCache
 from pydiscogs.utils.prompts import get_current_date, web_searcher_instructions
 
 
@@ -12,7 +12,7 @@ class WebSearchInput(BaseModel):
     query: str = Field(description="The search query for the web research.")
 
 
-class WebResearchTool(BaseTool):
+class WebResearchTool(GeminiTool):
     """A tool for performing web research using Google Search and Gemini."""
 
     name: str = "web_research"
@@ -21,28 +21,48 @@ class WebResearchTool(BaseTool):
         "Executes a web search using the native Google Search API tool in combination with Gemini."
     )
     args_schema: Type[BaseModel] = WebSearchInput
-    google_api_key: str
-    google_llm_model: str
+    result_cache: Optional[Any] = None
+    # Search results go stale quickly, so keep them for minutes rather than hours
+    cache_ttl: float = 600.0
 
-    def _run(self, query: str):
-        """Use the tool."""
-        # Configure
+    def _request(self, query: str) -> dict:
         formatted_prompt = web_searcher_instructions.format(
             current_date=get_current_date(),
             research_topic=query,
         )
-
-        genai_client = Client(api_key=self.google_api_key)
-
-        # Uses the google genai client as the langchain client doesn't return grounding metadata
-        response = genai_client.models.generate_content(
-            model=self.google_llm_model,
-            contents=formatted_prompt,
-            config={
+        return {
+            "model": self.google_llm_model,
+            "contents": formatted_prompt,
+            "config": {
                 "tools": [{"google_search": {}}],
                 "temperature": 0,
             },
+        }
+
+    def _cache_key(self, query: str) -> str:
+        return ToolResultCache.make_key(
+            self.name, self.google_llm_model, query, date=get_current_date()
         )
+
+    def _run(self, query: str):
+        """Use the tool."""
+        if self.result_cache is None:
+            return self._research(query)
+        return self.result_cache.get_or_compute(
+            self._cache_key(query), lambda: self._research(query), ttl=self.cache_ttl
+        )
+
+    async def _arun(self, query: str):
+        """Use the tool asynchronously."""
+        if self.result_cache is None:
+            return await self._aresearch(query)
+        return await self.result_cache.aget_or_compute(
+            self._cache_key(query), lambda: self._aresearch(query), ttl=self.cache_ttl
+        )
+
+    def _research(self, query: str):
+        # Uses the google genai client as the langchain client doesn't return grounding metadata
+        response = self._get_client().models.generate_content(**self._request(query))
         # # resolve the urls to short urls for saving tokens and time
         # resolved_urls = resolve_urls(
         #     response.candidates[0].grounding_metadata.grounding_chunks, 1
@@ -61,3 +81,9 @@ class WebResearchTool(BaseTool):
         # }
 
         return response.text
+
+    async def _aresearch(self, query: str):
+        response = await self._get_client().aio.models.generate_content(
+            **self._request(query)
+        )
+        return response.text
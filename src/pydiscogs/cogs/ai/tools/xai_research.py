@@ -1,7 +1,10 @@
+import asyncio
+import contextlib
 import logging
 import re
-from typing import Any, Type
+from typing import Any, Optional, Type
 
+import grpc
 from langchain_core.tools import BaseTool
 from pydantic.v1 import BaseModel, Field
 from xai_sdk import AsyncClient
@@ -10,6 +13,9 @@ from xai_sdk.tools import web_search, x_search
 
 logger = logging.getLogger(__name__)
 
+# Status codes that mean the channel itself is broken rather than one call failing
+CHANNEL_ERRORS = {grpc.StatusCode.UNAVAILABLE}
+
 
 class XResearchInput(BaseModel):
     query: str = Field(
@@ -29,59 +35,143 @@ class XResearchTool(BaseTool):
     )
     args_schema: Type[BaseModel] = XResearchInput
     xai_api_key: str
+    max_concurrent_samples: int = 4
+    # Created on first use and reused; see _get_client
+    xai_client: Optional[Any] = None
+    sample_semaphore: Optional[Any] = None
+    client_loop: Optional[Any] = None
+    # Calls still running per client, so a replaced client closes once they finish
+    client_calls: Optional[Any] = None
+
+    async def _get_client(self):
+        """
+        Returns the shared client. A client left over from a different event loop is
+        closed and replaced; one retired after a channel error is replaced.
+        """
+        loop = asyncio.get_running_loop()
+        if self.xai_client is not None and self.client_loop is not loop:
+            # gRPC aio channels are bound to the loop that created them
+            await self.aclose()
+        if self.xai_client is None:
+            self.xai_client = AsyncClient(api_key=self.xai_api_key)
+        if self.sample_semaphore is None or self.client_loop is not loop:
+            self.sample_semaphore = asyncio.Semaphore(self.max_concurrent_samples)
+            self.client_calls = {}
+        self.client_loop = loop
+        return self.xai_client
+
+    @contextlib.asynccontextmanager
+    async def _client_in_use(self):
+        """Yields the shared client, closing it after its last call if it was retired."""
+        client = await self._get_client()
+        calls = self.client_calls
+        calls[client] = calls.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            # A client closed by aclose meanwhile is no longer counted
+            if client in calls:
+                calls[client] -= 1
+                if not calls[client]:
+                    del calls[client]
+                    if client is not self.xai_client:
+                        await self._close_client(client)
+
+    def _retire_client(self, client):
+        """Stops handing out client so the next call builds a new one."""
+        if self.xai_client is not client:
+            # Another call already replaced it
+            return
+        logger.warning("XResearchTool: recreating xAI client after a channel error")
+        self.xai_client = None
+
+    async def _close_client(self, client):
+        """Closes client on the event loop that created it."""
+        loop = self.client_loop
+        try:
+            if loop is not None and loop.is_running():
+                if loop is asyncio.get_running_loop():
+                    await client.close()
+                else:
+                    future = asyncio.run_coroutine_threadsafe(client.close(), loop)
+                    await asyncio.wrap_future(future)
+            else:
+                # The creating loop is gone; closing here is best effort
+                await client.close()
+        except Exception as e:
+            logger.warning(f"XResearchTool: failed to close xAI client: {e}")
+
+    async def aclose(self):
+        """Closes the shared client, on the event loop that created it."""
+        client, self.xai_client = self.xai_client, None
+        if client is not None:
+            if self.client_calls:
+                self.client_calls.pop(client, None)
+            await self._close_client(client)
 
     async def _arun(self, query: str) -> str:
         """Use the tool asynchronously."""
         try:
-            client = AsyncClient(api_key=self.xai_api_key)
+            async with self._client_in_use() as client:
+                try:
+                    return await self._research(client, query)
+                except grpc.RpcError as e:
+                    code = e.code() if callable(getattr(e, "code", None)) else None
+                    if code in CHANNEL_ERRORS:
+                        self._retire_client(client)
+                    raise
+        except grpc.RpcError as e:
+            logger.error(f"gRPC error in XResearchTool: {e}", exc_info=True)
+            return f"Error performing X research: {str(e)}"
+        except Exception as e:
+            logger.error(f"Error in XResearchTool: {e}", exc_info=True)
+            return f"Error performing X research: {str(e)}"
 
-            # Create a chat session with search tools enabled
-            chat = client.chat.create(
-                model="grok-4-1-fast", tools=[x_search(), web_search()]
-            )
+    async def _research(self, client, query: str) -> str:
+        # Create a chat session with search tools enabled
+        chat = client.chat.create(
+            model="grok-4-1-fast", tools=[x_search(), web_search()]
+        )
 
-            # Refine query for URLs to ensure research-mode is triggered
-            refined_query = query
-            if re.search(r"(twitter\.com|x\.com)/\w+/status/\d+", query):
-                refined_query = f"Please research and provide a concise summary or TLDR of this X post: {query}"
+        # Refine query for URLs to ensure research-mode is triggered
+        refined_query = query
+        if re.search(r"(twitter\.com|x\.com)/\w+/status/\d+", query):
+            refined_query = f"Please research and provide a concise summary or TLDR of this X post: {query}"
 
-            # Append query to state
-            chat.append(user(refined_query))
+        # Append query to state
+        chat.append(user(refined_query))
 
-            # Sample Grok for a response
+        # Sample Grok for a response
+        async with self.sample_semaphore:
             response = await chat.sample()
-            logger.debug(f"XResearchTool sample response: {response}")
-
-            # Based on logs, the response object HAS 'content' attribute directly exposed.
-            # It seems the SDK flattens the final result into response.content for easy access.
-            if hasattr(response, "content") and response.content:
-                logger.debug(f"XResearchTool found direct content: {response.content}")
-                if isinstance(response.content, str):
-                    return response.content
-                # If it's a list or object, try to stringify or join it
-                if hasattr(response.content, "__iter__"):
-                    return "\n".join([str(c) for c in response.content])
-                return str(response.content)
-
-            # Fallback: check if we can access the raw proto or hidden fields if specific attributes are missing
-            # The dir() showed _proto, maybe we need that if content is empty?
-            # But normally .content should be populated if the status is completed.
-
-            # Fallback to scanning chat history just in case
-            logger.debug(f"XResearchTool chat history length: {len(chat.messages)}")
-            if chat.messages:
-                for i, msg in enumerate(reversed(chat.messages)):
-                    logger.debug(f"XResearchTool msg {i} (reversed): {msg}")
-                    if hasattr(msg, "role") and msg.role == 2:
-                        text = self._extract_text_from_msg(msg)
-                        if text:
-                            return text
-
-            return "Error: Could not extract assistant response from Xai."
-
-        except Exception as e:
-            logger.error(f"Error in XResearchTool: {e}", exc_info=True)
-            return f"Error performing X research: {str(e)}"
+        logger.debug(f"XResearchTool sample response: {response}")
+
+        # Based on logs, the response object HAS 'content' attribute directly exposed.
+        # It seems the SDK flattens the final result into response.content for easy access.
+        if hasattr(response, "content") and response.content:
+            logger.debug(f"XResearchTool found direct content: {response.content}")
+            if isinstance(response.content, str):
+                return response.content
+            # If it's a list or object, try to stringify or join it
+            if hasattr(response.content, "__iter__"):
+                return "\n".join([str(c) for c in response.content])
+            return str(response.content)
+
+        # Fallback: check if we can access the raw proto or hidden fields if specific attributes are missing
+        # The dir() showed _proto, maybe we need that if content is empty?
+        # But normally .content should be populated if the status is completed.
+
+        # Fallback to scanning chat history just in case
+        logger.debug(f"XResearchTool chat history length: {len(chat.messages)}")
+        if chat.messages:
+            for i, msg in enumerate(reversed(chat.messages)):
+                logger.debug(f"XResearchTool msg {i} (reversed): {msg}")
+                if hasattr(msg, "role") and msg.role == 2:
+                    text = self._extract_text_from_msg(msg)
+                    if text:
+                        return text
+
+        return "Error: Could not extract assistant response from Xai."
 
     def _extract_text_from_msg(self, msg: Any) -> str:
         """Helper to extract text from a Message object or similar."""
@@ -5,16 +5,57 @@ isort:skip_file
 """
 
 import asyncio
+import functools
+import io
 import os
+import time
 import unittest
-from unittest.mock import MagicMock, patch, AsyncMock
+from unittest.mock import ANY, MagicMock, patch, AsyncMock
 
 import discord
 from dotenv import load_dotenv
-from pydiscogs.cogs.ai.cog import AI, AIHandler, AIReplyModal
+from pydiscogs.cogs.ai.cog import (
+    AI,
+    BUSY_MESSAGE,
+    AIHandler,
+    AIReplyModal,
+    GoogleGenerativeAIEmbeddingsWithDims,
+    StreamingReply,
+)
+from pydiscogs.cogs.ai.agent import (
+    build_agent_graph,
+    build_system_prompt,
+    retrieve_memories,
+    count_message_tokens,
+    needs_summary,
+    summarize_messages,
+)
+from pydiscogs.cogs.ai.answer_cache import AnswerCache
+from pydiscogs.cogs.ai.circuit_breaker import (
+    CircuitBreaker,
+    ProviderError,
+    rank_providers,
+)
+from pydiscogs.cogs.ai.embedding_cache import EmbeddingCache
+from pydiscogs.cogs.ai.hedging import RequestHedger
+from pydiscogs.cogs.ai.images import ImagePipeline
+from pydiscogs.cogs.ai.prompt_cache import GeminiPromptCache
+from pydiscogs.cogs.ai.reply_index import ReplyRootIndex
+from pydiscogs.cogs.ai.scheduler import AIQueueFullError, AIRequestScheduler
 from discord.ext import commands
+from google.genai import errors
 from httpx import ConnectError
-from langchain_core.messages import AIMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+from PIL import Image
 
 load_dotenv(override=True)
 events = []
@@ -109,35 +150,72 @@ class TestAIHandler(unittest.IsolatedAsyncioTestCase):
 
     @patch("os.getenv")
     @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    async def test_ai_handler_call_stream(self, mock_build_agent_graph, mock_getenv):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "GROQ_LLM_MODEL": None,
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        agent_meta = {"langgraph_node": "agent"}
+
+        async def mock_astream():
+            yield ("messages", (AIMessageChunk("Hel", id="run-1"), agent_meta))
+            yield (
+                "messages",
+                (AIMessageChunk("ignored", id="run-2"), {"langgraph_node": "other"}),
+            )
+            yield ("messages", (AIMessageChunk("lo", id="run-1"), agent_meta))
+            yield ("values", {"messages": [AIMessage("Hello")]})
+
+        mock_build_agent_graph.return_value.astream.return_value = mock_astream()
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+        )
+        ai_handler.current_agent = mock_build_agent_graph.return_value
+        snapshots = [
+            text async for text in ai_handler.call_stream("test input", thread_id="t")
+        ]
+        self.assertEqual(snapshots, ["Hel", "Hello", "Hello"])
+        call_kwargs = mock_build_agent_graph.return_value.astream.call_args[1]
+        self.assertEqual(call_kwargs["stream_mode"], ["messages", "values"])
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGroq")
     @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
     async def test_ai_handler_call_fallback(
-        self, MockChatGoogleGenerativeAI, mock_build_agent_graph, mock_getenv
+        self,
+        MockChatGoogleGenerativeAI,
+        MockChatGroq,
+        mock_build_agent_graph,
+        mock_getenv,
     ):
 
         mock_getenv.side_effect = lambda key, default=None: {
-            "GROQ_LLM_MODEL": None,
             "OLLAMA_ENDPOINT": None,
         }.get(key, default)
 
         # Test AIHandler.call method with fallback
-        mock_llm = MockChatGoogleGenerativeAI.return_value
-
         async def mock_astream():
             yield {"messages": [AIMessage("test response")]}
 
-        mock_build_agent_graph.return_value.astream.side_effect = [
-            ConnectError("initial call failed"),
-            mock_astream(),
-        ]
+        google_agent, groq_agent = MagicMock(), MagicMock()
+        google_agent.astream.side_effect = ConnectError("initial call failed")
+        groq_agent.astream.return_value = mock_astream()
+        mock_build_agent_graph.side_effect = [google_agent, groq_agent]
 
         ai_handler = AIHandler(
             google_api_key="test_google_api_key",
             google_llm_model="test_model",
+            groq_api_key="test_groq_api_key",
+            groq_llm_model="test_model",
         )
-        ai_handler.current_agent = mock_build_agent_graph.return_value
-        ai_handler.fallback_llms = [mock_llm]  # Set up a fallback LLM
         response = await ai_handler.call("test input", thread_id="default")
         self.assertEqual(response, "test response")
+        self.assertIs(ai_handler.current_llm, MockChatGroq.return_value)
+        self.assertIs(ai_handler.current_agent, groq_agent)
 
     @patch("os.getenv")
     @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
@@ -159,11 +237,330 @@ class TestAIHandler(unittest.IsolatedAsyncioTestCase):
         )
         ai_handler.current_agent = mock_build_agent_graph.return_value
         ai_handler.fallback_llms = []  # No fallback LLMs to trigger unexpected error
+        ai_handler.checkpointer = MagicMock()
+        response = await ai_handler.call("test input", thread_id="default")
+        self.assertEqual(response, "AI Error")
+        # Failed runs are not summarized
+        self.assertEqual(ai_handler.summary_tasks, {})
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGroq")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    def test_ai_handler_fallback_uses_cached_agent(
+        self,
+        MockChatGoogleGenerativeAI,
+        MockChatGroq,
+        mock_build_agent_graph,
+        mock_getenv,
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+        google_agent, groq_agent = MagicMock(), MagicMock()
+        mock_build_agent_graph.side_effect = [google_agent, groq_agent]
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            groq_api_key="test_groq_api_key",
+            groq_llm_model="test_model",
+        )
+        self.assertEqual(mock_build_agent_graph.call_count, 2)
+        self.assertIs(ai_handler.current_agent, google_agent)
+
+        # Failing over switches to the precompiled graph without rebuilding
+        ai_handler._AIHandler__use_provider("groq")
+        self.assertEqual(mock_build_agent_graph.call_count, 2)
+        self.assertIs(ai_handler.current_llm, MockChatGroq.return_value)
+        self.assertIs(ai_handler.current_agent, groq_agent)
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGroq")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    def test_ai_handler_prompt_cache_only_for_google(
+        self,
+        MockChatGoogleGenerativeAI,
+        MockChatGroq,
+        mock_build_agent_graph,
+        mock_getenv,
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            groq_api_key="test_groq_api_key",
+            groq_llm_model="test_model",
+            ai_system_prompt="Be helpful.",
+        )
+
+        google_call, groq_call = mock_build_agent_graph.call_args_list
+        self.assertIs(google_call[1]["prompt_cache"], ai_handler.prompt_cache)
+        self.assertIsNone(groq_call[1]["prompt_cache"])
+        for call in (google_call, groq_call):
+            self.assertEqual(call[1]["system_prompt"], ai_handler.system_prompt)
+        self.assertEqual(
+            ai_handler.prompt_cache.system_prompt, build_system_prompt("Be helpful.")
+        )
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    async def test_ai_handler_background_summary(
+        self, MockChatGoogleGenerativeAI, mock_build_agent_graph, mock_getenv
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "GROQ_LLM_MODEL": None,
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        def mock_astream(*args, **kwargs):
+            async def stream():
+                yield {"messages": [AIMessage("test response")]}
+
+            return stream()
+
+        agent = mock_build_agent_graph.return_value
+        agent.astream.side_effect = mock_astream
+        history = [HumanMessage(f"m{i}", id=str(i)) for i in range(8)]
+        agent.aget_state = AsyncMock(
+            return_value=MagicMock(values={"messages": history, "summary": ""})
+        )
+        agent.aupdate_state = AsyncMock()
+        MockChatGoogleGenerativeAI.return_value.ainvoke = AsyncMock(
+            return_value=AIMessage("summary")
+        )
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key", google_llm_model="test_model"
+        )
+        ai_handler.checkpointer = MagicMock()
+        ai_handler.summary_delay = 0.05
+        ai_handler.summary_token_budget = 20
+        ai_handler.summary_keep_tokens = 5
+
+        # A burst of turns on one thread is summarized once, after the replies
+        for _ in range(3):
+            response = await ai_handler.call("test input", thread_id="t")
+            self.assertEqual(response, "test response")
+            # Let the summary task start waiting out the delay
+            await asyncio.sleep(0)
+        agent.aupdate_state.assert_not_called()
+
+        await ai_handler.summary_tasks["t"]
+
+        agent.aget_state.assert_awaited_once()
+        agent.aupdate_state.assert_awaited_once()
+        args, kwargs = agent.aupdate_state.call_args
+        self.assertEqual(args[1]["summary"], "summary")
+        self.assertEqual(len(args[1]["messages"]), 7)
+        self.assertEqual(kwargs["as_node"], "summarize_conversation")
+        self.assertEqual(ai_handler.summary_tasks, {})
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGroq")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    async def test_ai_handler_failover_resumes_from_checkpoint(
+        self,
+        MockChatGoogleGenerativeAI,
+        MockChatGroq,
+        mock_build_agent_graph,
+        mock_getenv,
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        def mock_astream(*args, **kwargs):
+            async def stream():
+                yield {"messages": [AIMessage("test response")]}
+
+            return stream()
+
+        google_agent, groq_agent = MagicMock(), MagicMock()
+        google_agent.astream.side_effect = ProviderError("503 Service Unavailable")
+        groq_agent.astream.side_effect = mock_astream
+        mock_build_agent_graph.side_effect = [google_agent, groq_agent]
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            groq_api_key="test_groq_api_key",
+            groq_llm_model="test_model",
+        )
+        ai_handler.checkpointer = MagicMock()
+
+        # The failed run saved the input and stopped at the model call
+        google_agent.aget_state = AsyncMock(return_value=MagicMock(next=("agent",)))
+        response = await ai_handler.call("test input", thread_id="t")
+        self.assertEqual(response, "test response")
+        self.assertIsNone(groq_agent.astream.call_args.args[0])
+
+        # Nothing was saved, so the input is sent again
+        google_agent.aget_state = AsyncMock(return_value=MagicMock(next=()))
+        ai_handler.breakers = {name: CircuitBreaker(name) for name in ai_handler.llms}
+        await ai_handler.call("test input", thread_id="t")
+        self.assertEqual(google_agent.astream.call_count, 2)
+        (resent,) = groq_agent.astream.call_args.args[0]["messages"]
+        self.assertEqual(resent.content[0]["text"], "test input")
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGroq")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    async def test_ai_handler_does_not_fail_over_on_other_errors(
+        self,
+        MockChatGoogleGenerativeAI,
+        MockChatGroq,
+        mock_build_agent_graph,
+        mock_getenv,
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        google_agent, groq_agent = MagicMock(), MagicMock()
+        google_agent.astream.side_effect = KeyError("messages")
+        mock_build_agent_graph.side_effect = [google_agent, groq_agent]
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            groq_api_key="test_groq_api_key",
+            groq_llm_model="test_model",
+        )
         response = await ai_handler.call("test input", thread_id="default")
+
         self.assertEqual(response, "AI Error")
+        groq_agent.astream.assert_not_called()
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGroq")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    async def test_ai_handler_routes_around_open_circuit(
+        self,
+        MockChatGoogleGenerativeAI,
+        MockChatGroq,
+        mock_build_agent_graph,
+        mock_getenv,
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        def mock_astream(text):
+            async def stream(*args, **kwargs):
+                yield {"messages": [AIMessage(text)]}
+
+            return stream
+
+        google_agent, groq_agent = MagicMock(), MagicMock()
+        google_agent.astream.side_effect = mock_astream("from google")
+        groq_agent.astream.side_effect = mock_astream("from groq")
+        mock_build_agent_graph.side_effect = [google_agent, groq_agent]
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            groq_api_key="test_groq_api_key",
+            groq_llm_model="test_model",
+        )
+        self.assertEqual(mock_build_agent_graph.call_count, 2)
+        self.assertIs(
+            mock_build_agent_graph.call_args_list[0][1]["health"],
+            ai_handler.breakers["google"],
+        )
+
+        # Once Google's circuit opens, requests skip it without trying it first
+        for _ in range(4):
+            ai_handler.breakers["google"].record_failure(Exception("503"))
+        self.assertEqual(ai_handler.breakers["google"].state, "open")
+
+        response = await ai_handler.call("test input", thread_id="default")
+        self.assertEqual(response, "from groq")
+        google_agent.astream.assert_not_called()
+        self.assertEqual(mock_build_agent_graph.call_count, 2)
+
+        # After the cool-down a probe goes back to the preferred provider
+        ai_handler.breakers["google"]._opened_at -= 31
+        response = await ai_handler.call("test input", thread_id="default")
+        self.assertEqual(response, "from google")
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.GoogleGenerativeAIEmbeddingsWithDims")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    async def test_ai_handler_answer_cache(
+        self,
+        MockChatGoogleGenerativeAI,
+        mock_build_agent_graph,
+        MockEmbeddings,
+        mock_getenv,
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "GROQ_LLM_MODEL": None,
+            "OLLAMA_ENDPOINT": None,
+            "AI_ANSWER_CACHE": "true",
+        }.get(key, default)
+        MockEmbeddings.return_value.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+
+        async def final_state(*messages):
+            yield {"messages": [HumanMessage("q"), *messages]}
+
+        tool_call = {"name": "web_research", "args": {}, "id": "call_1"}
+        agent = mock_build_agent_graph.return_value
+        agent.astream.side_effect = [
+            final_state(AIMessage("", tool_calls=[tool_call]), AIMessage("live")),
+            final_state(AIMessage("fresh")),
+            final_state(AIMessage("about this image")),
+        ]
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key", google_llm_model="test_model"
+        )
+        kwargs = dict(guild_id="guild", channel_id="channel")
+
+        # Answers that needed tools are never cached
+        self.assertEqual(await ai_handler.call("what's SPY at", **kwargs), "live")
+        self.assertEqual(await ai_handler.call("what's SPY at", **kwargs), "fresh")
+        self.assertEqual(await ai_handler.call("what is SPY at", **kwargs), "fresh")
+        # Image questions bypass the cache
+        self.assertEqual(
+            await ai_handler.call(
+                "what is SPY at", images=[(b"", "image/png")], **kwargs
+            ),
+            "about this image",
+        )
+        self.assertEqual(agent.astream.call_count, 3)
+        self.assertEqual(ai_handler.answer_cache.stats()["hits"], 1)
+
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.build_agent_graph")
+    async def test_ai_handler_call_queue_full(
+        self, mock_build_agent_graph, mock_getenv
+    ):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "GROQ_LLM_MODEL": None,
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            max_queue_depth=1,
+        )
+        ai_handler.scheduler.waiting = 1  # Simulate a request already in line
+        response = await ai_handler.call("test input", thread_id="default")
+        self.assertEqual(response, BUSY_MESSAGE)
+        mock_build_agent_graph.return_value.astream.assert_not_called()
 
     @patch("os.getenv")
-    @patch("pydiscogs.cogs.ai.tools.web_research.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     def test_web_research_tool(self, MockClient, mock_getenv):
 
         mock_getenv.side_effect = lambda key, default=None: {
@@ -188,6 +585,35 @@ class TestAIHandler(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(result, "test response")
 
+    @patch("os.getenv")
+    @patch("pydiscogs.cogs.ai.cog.ChatGoogleGenerativeAI")
+    async def test_ai_handler_close(self, MockChatGoogleGenerativeAI, mock_getenv):
+        mock_getenv.side_effect = lambda key, default=None: {
+            "GROQ_LLM_MODEL": None,
+            "OLLAMA_ENDPOINT": None,
+        }.get(key, default)
+
+        ai_handler = AIHandler(
+            google_api_key="test_google_api_key",
+            google_llm_model="test_model",
+            xai_api_key="test_xai_key",
+        )
+        closers = []
+        for ai_tool in ai_handler.tools:
+            closer = AsyncMock()
+            object.__setattr__(ai_tool, "aclose", closer)
+            closers.append(closer)
+        ai_handler.pool = AsyncMock()
+        pool = ai_handler.pool
+
+        await ai_handler.close()
+
+        self.assertEqual(len(closers), 3)
+        for closer in closers:
+            closer.assert_awaited_once()
+        pool.close.assert_awaited_once()
+        self.assertIsNone(ai_handler.pool)
+
 
 class TestAI(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
@@ -274,6 +700,7 @@ class TestAI(unittest.IsolatedAsyncioTestCase):
         # Test _get_images_from_message helper
         mock_attachment = MagicMock(spec=discord.Attachment)
         mock_attachment.content_type = "image/jpeg"
+        mock_attachment.size = 15
         mock_attachment.read = AsyncMock(return_value=b"fake_image_data")
 
         mock_non_image_attachment = MagicMock(spec=discord.Attachment)
@@ -297,6 +724,7 @@ class TestAI(unittest.IsolatedAsyncioTestCase):
 
         mock_attachment = MagicMock(spec=discord.Attachment)
         mock_attachment.content_type = "image/jpeg"
+        mock_attachment.size = 15
         mock_attachment.read = AsyncMock(return_value=b"fake_image_data")
 
         mock_message = MagicMock(spec=discord.Message)
@@ -324,6 +752,7 @@ class TestAI(unittest.IsolatedAsyncioTestCase):
             user_id="123",
             guild_id="456",
             channel_id="789",
+            on_queued=ANY,
         )
         mock_send_response.assert_called_with(mock_message, "test response")
 
@@ -356,6 +785,54 @@ class TestAI(unittest.IsolatedAsyncioTestCase):
 
         mock_send_response.assert_called_with(mock_message, "test response")
 
+    async def test_send_streaming_response(self):
+        # Placeholder is posted first, then edited and rolled over past 2000 chars
+        placeholder = MagicMock()
+        placeholder.edit = AsyncMock()
+        overflow = MagicMock()
+        mock_message = MagicMock(spec=discord.Message)
+        mock_message.reply = AsyncMock(return_value=placeholder)
+        mock_message.channel.send = AsyncMock(return_value=overflow)
+
+        long_text = ("word " * 500).strip()
+
+        async def stream():
+            yield "Hi"
+            yield long_text
+
+        result = await AI.send_streaming_response(
+            mock_message, stream(), edit_interval=0
+        )
+
+        self.assertEqual(result, long_text)
+        mock_message.reply.assert_called_once_with(StreamingReply.PLACEHOLDER)
+        first_chunk, second_chunk = AI.chunk_response(long_text)
+        placeholder.edit.assert_called_with(content=first_chunk)
+        mock_message.channel.send.assert_called_once_with(second_chunk)
+
+    @patch("pydiscogs.cogs.ai.cog.AI.send_streaming_response", new_callable=AsyncMock)
+    @patch("pydiscogs.cogs.ai.cog.AIHandler")
+    async def test_ai_command_streaming(
+        self, MockAIHandler, mock_send_streaming_response
+    ):
+        # Streaming mode hands the call_stream generator to the renderer
+        mock_context = MagicMock(spec=commands.Context)
+        mock_context.message = MagicMock()
+        mock_context.message.id = 12345
+        mock_context.message.attachments = []
+        mock_context.message.reference = None
+        mock_ai_handler = MockAIHandler.return_value
+
+        ai_cog = AI(bot=MagicMock(), stream_responses=True)
+        ai_cog.ai_handler = mock_ai_handler
+        await ai_cog.ai(ai_cog, mock_context, input="test input")
+
+        mock_ai_handler.call.assert_not_called()
+        mock_ai_handler.call_stream.assert_called_once()
+        mock_send_streaming_response.assert_called_with(
+            mock_context, mock_ai_handler.call_stream.return_value
+        )
+
     async def test_get_root_message(self):
         # Case 1: No reference
         msg1 = MagicMock(spec=discord.Message)
@@ -392,6 +869,1004 @@ class TestAI(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(root3, "100")
 
 
+class TestAgentGraph(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_run_resumes_from_checkpoint(self):
+        calls = []
+
+        @tool
+        async def side_effect_tool(query: str) -> str:
+            """Records each call."""
+            calls.append(query)
+            return f"done {query}"
+
+        def failing_messages():
+            yield AIMessage(
+                "",
+                tool_calls=[
+                    {"name": "side_effect_tool", "args": {"query": "a"}, "id": "c1"}
+                ],
+            )
+            raise ConnectionError("provider went away")
+
+        saver = InMemorySaver()
+        config = {"configurable": {"thread_id": "t"}}
+        failing = build_agent_graph(
+            GenericFakeChatModel(messages=failing_messages()),
+            [side_effect_tool],
+            system_prompt="test",
+            checkpointer=saver,
+        )
+        with self.assertRaises(ProviderError):
+            await failing.ainvoke({"messages": [HumanMessage("hi")]}, config)
+        self.assertEqual((await failing.aget_state(config)).next, ("agent",))
+
+        healthy = build_agent_graph(
+            GenericFakeChatModel(messages=iter([AIMessage("done")])),
+            [side_effect_tool],
+            system_prompt="test",
+            checkpointer=saver,
+        )
+        result = await healthy.ainvoke(None, config)
+
+        self.assertEqual(calls, ["a"])
+        humans = [m for m in result["messages"] if isinstance(m, HumanMessage)]
+        self.assertEqual(len(humans), 1)
+        self.assertEqual(result["messages"][-1].content, "done")
+
+    async def test_tool_calls_run_concurrently_with_timeouts(self):
+        released = asyncio.Event()
+
+        @tool
+        async def waiting_tool(query: str) -> str:
+            """Waits until a later tool call releases it."""
+            await released.wait()
+            return f"waited {query}"
+
+        @tool
+        async def releasing_tool(query: str) -> str:
+            """Releases the waiting tool."""
+            released.set()
+            return f"released {query}"
+
+        @tool
+        async def hanging_tool(query: str) -> str:
+            """Never finishes in time."""
+            await asyncio.sleep(10)
+            return "unreachable"
+
+        tool_calls = [
+            {"name": "waiting_tool", "args": {"query": "a"}, "id": "call_1"},
+            {"name": "hanging_tool", "args": {"query": "b"}, "id": "call_2"},
+            {"name": "releasing_tool", "args": {"query": "c"}, "id": "call_3"},
+        ]
+        llm = GenericFakeChatModel(
+            messages=iter([AIMessage("", tool_calls=tool_calls), AIMessage("done")])
+        )
+        # If the calls ran one by one, waiting_tool would time out first
+        graph = build_agent_graph(
+            llm,
+            [waiting_tool, releasing_tool, hanging_tool],
+            system_prompt="test",
+            tool_timeouts={"waiting_tool": 5, "hanging_tool": 0.1},
+        )
+
+        result = await graph.ainvoke({"messages": [HumanMessage("hi")]})
+
+        tool_messages = [m for m in result["messages"] if isinstance(m, ToolMessage)]
+        self.assertEqual(
+            [m.tool_call_id for m in tool_messages], ["call_1", "call_2", "call_3"]
+        )
+        self.assertEqual(tool_messages[0].content, "waited a")
+        self.assertEqual(tool_messages[1].status, "error")
+        self.assertIn("timeout", tool_messages[1].content)
+        self.assertEqual(tool_messages[2].content, "released c")
+        self.assertEqual(result["messages"][-1].content, "done")
+
+    async def test_summarization_runs_outside_the_graph(self):
+        llm = GenericFakeChatModel(
+            messages=iter([AIMessage(f"reply {i}") for i in range(4)])
+        )
+        graph = build_agent_graph(
+            llm, [], system_prompt="test", checkpointer=InMemorySaver()
+        )
+        config = {"configurable": {"thread_id": "t"}}
+
+        for i in range(4):
+            result = await graph.ainvoke(
+                {"messages": [HumanMessage(f"message {i}")]}, config
+            )
+
+        # No summarization round trip is spent before the reply
+        self.assertEqual(len(result["messages"]), 8)
+        self.assertEqual(result["messages"][-1].content, "reply 3")
+
+        summary_llm = GenericFakeChatModel(messages=iter([AIMessage("summary")]))
+        snapshot = await graph.aget_state(config)
+        update = await summarize_messages(
+            summary_llm, snapshot.values, token_budget=20, keep_tokens=10
+        )
+        await graph.aupdate_state(config, update, as_node="summarize_conversation")
+
+        snapshot = await graph.aget_state(config)
+        self.assertEqual(snapshot.values["summary"], "summary")
+        self.assertEqual(
+            [m.content for m in snapshot.values["messages"]], ["message 3", "reply 3"]
+        )
+        self.assertEqual(snapshot.next, ())
+
+    async def test_cached_prompt_replaces_system_messages(self):
+        prompt_cache = MagicMock()
+        prompt_cache.get = AsyncMock(return_value="cachedContents/abc")
+        llm = MagicMock()
+        llm.bind.return_value.ainvoke = AsyncMock(return_value=AIMessage("cached"))
+        graph = build_agent_graph(
+            llm, [], system_prompt="static prompt", prompt_cache=prompt_cache
+        )
+
+        result = await graph.ainvoke(
+            {"messages": [HumanMessage("hi")], "summary": "earlier"}
+        )
+
+        self.assertEqual(result["messages"][-1].content, "cached")
+        llm.bind.assert_called_once_with(cached_content="cachedContents/abc")
+        llm.bind_tools.assert_not_called()
+        sent = llm.bind.return_value.ainvoke.call_args[0][0]
+        self.assertFalse(any(isinstance(m, SystemMessage) for m in sent))
+        self.assertIn("earlier", sent[0].content)
+        self.assertEqual(sent[1].content, "hi")
+
+    async def test_cached_prompt_failure_falls_back_inline(self):
+        prompt_cache = MagicMock()
+        prompt_cache.get = AsyncMock(return_value="cachedContents/gone")
+        llm = MagicMock()
+        llm.bind.return_value.ainvoke = AsyncMock(side_effect=Exception("expired"))
+        llm.bind_tools.return_value.ainvoke = AsyncMock(
+            return_value=AIMessage("inline")
+        )
+        graph = build_agent_graph(
+            llm, [], system_prompt="static prompt", prompt_cache=prompt_cache
+        )
+
+        result = await graph.ainvoke({"messages": [HumanMessage("hi")]})
+
+        self.assertEqual(result["messages"][-1].content, "inline")
+        prompt_cache.invalidate.assert_called_once_with("cachedContents/gone")
+        sent = llm.bind_tools.return_value.ainvoke.call_args[0][0]
+        self.assertEqual(sent[0], SystemMessage(content="static prompt"))
+
+    async def test_hedged_call_uses_fallback_provider(self):
+        hedger = RequestHedger(MagicMock(), default_delay=0.01)
+        fallback_llm = MagicMock()
+        fallback_bound = fallback_llm.bind_tools.return_value.with_config.return_value
+        fallback_bound.ainvoke = AsyncMock(return_value=AIMessage("from groq"))
+        hedger.pick_fallback.return_value = ("groq", fallback_llm, None)
+
+        async def slow_ainvoke(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        llm = MagicMock()
+        llm.bind_tools.return_value.with_config.return_value.ainvoke = slow_ainvoke
+        graph = build_agent_graph(
+            llm,
+            [],
+            system_prompt="test",
+            hedge=functools.partial(hedger.race, "google"),
+        )
+
+        result = await graph.ainvoke({"messages": [HumanMessage("hi")]})
+
+        self.assertEqual(result["messages"][-1].content, "from groq")
+        fallback_llm.bind_tools.return_value.with_config.assert_called_once_with(
+            tags=["nostream"]
+        )
+        sent = fallback_bound.ainvoke.call_args[0][0]
+        self.assertEqual(sent[0], SystemMessage(content="test"))
+
+    async def test_calls_after_tool_results_are_not_hedged(self):
+        @tool
+        async def lookup(query: str) -> str:
+            """Looks something up."""
+            return f"found {query}"
+
+        hedged = []
+
+        async def hedge(call, fallback_call):
+            hedged.append(call)
+            return await call(lambda: None)
+
+        llm = MagicMock()
+        tool_call = {"name": "lookup", "args": {"query": "a"}, "id": "call_1"}
+        llm.bind_tools.return_value.with_config.return_value.ainvoke = AsyncMock(
+            return_value=AIMessage("", tool_calls=[tool_call])
+        )
+        llm.bind_tools.return_value.ainvoke = AsyncMock(return_value=AIMessage("done"))
+        graph = build_agent_graph(llm, [lookup], system_prompt="test", hedge=hedge)
+
+        result = await graph.ainvoke({"messages": [HumanMessage("hi")]})
+
+        self.assertEqual(result["messages"][-1].content, "done")
+        self.assertEqual(len(hedged), 1)
+        sent = llm.bind_tools.return_value.ainvoke.call_args[0][0]
+        self.assertIsInstance(sent[-1], ToolMessage)
+
+    async def test_model_calls_report_provider_health(self):
+        health = MagicMock()
+        llm = MagicMock()
+        llm.bind_tools.return_value.ainvoke = AsyncMock(
+            side_effect=[AIMessage("ok"), Exception("503")]
+        )
+        graph = build_agent_graph(llm, [], system_prompt="test", health=health)
+
+        await graph.ainvoke({"messages": [HumanMessage("hi")]})
+        health.record_success.assert_called_once()
+        health.record_failure.assert_not_called()
+
+        with self.assertRaises(Exception):
+            await graph.ainvoke({"messages": [HumanMessage("hi")]})
+        health.record_failure.assert_called_once()
+
+
+class TestPromptCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("pydiscogs.cogs.ai.prompt_cache.Client")
+        self.MockClient = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.caches = self.MockClient.return_value.aio.caches
+        self.caches.create = AsyncMock(return_value=MagicMock())
+        self.caches.create.return_value.name = "cachedContents/abc"
+        self.caches.update = AsyncMock()
+        self.caches.delete = AsyncMock()
+        self.MockClient.return_value.aio.aclose = AsyncMock()
+
+        @tool
+        def lookup(query: str) -> str:
+            """Looks something up."""
+            return query
+
+        self.tools = [lookup]
+        self.cache = GeminiPromptCache(
+            api_key="key", model="gemini-test", system_prompt="static", ttl=600
+        )
+
+    async def test_creates_once_with_prompt_and_tools(self):
+        self.assertEqual(await self.cache.get(self.tools), "cachedContents/abc")
+        self.assertEqual(await self.cache.get(self.tools), "cachedContents/abc")
+
+        self.caches.create.assert_awaited_once()
+        kwargs = self.caches.create.call_args[1]
+        self.assertEqual(kwargs["model"], "gemini-test")
+        self.assertEqual(kwargs["config"].system_instruction, "static")
+        self.assertEqual(kwargs["config"].ttl, "600s")
+        declarations = kwargs["config"].tools[0].function_declarations
+        self.assertEqual([d.name for d in declarations], ["lookup"])
+
+    async def test_extends_cache_before_it_expires(self):
+        with patch("pydiscogs.cogs.ai.prompt_cache.time.monotonic") as clock:
+            clock.return_value = 0
+            await self.cache.get(self.tools)
+            clock.return_value = 400  # Inside the refresh margin
+            self.assertEqual(await self.cache.get(self.tools), "cachedContents/abc")
+
+        self.caches.create.assert_awaited_once()
+        self.caches.update.assert_awaited_once()
+        self.assertEqual(self.caches.update.call_args[1]["name"], "cachedContents/abc")
+
+    async def test_failure_falls_back_and_backs_off(self):
+        self.caches.create.side_effect = Exception("too few tokens")
+
+        self.assertIsNone(await self.cache.get(self.tools))
+        self.assertIsNone(await self.cache.get(self.tools))
+
+        self.caches.create.assert_awaited_once()
+
+    async def test_prompt_below_minimum_size_is_not_retried(self):
+        self.caches.create.side_effect = errors.ClientError(
+            400,
+            {
+                "error": {
+                    "code": 400,
+                    "message": "Cached content is too small. "
+                    "total_token_count=900, min_total_token_count=1024",
+                    "status": "INVALID_ARGUMENT",
+                }
+            },
+        )
+
+        with patch("pydiscogs.cogs.ai.prompt_cache.time.monotonic") as clock:
+            clock.return_value = 0
+            self.assertIsNone(await self.cache.get(self.tools))
+            clock.return_value = self.cache.retry_after * 10
+            self.assertIsNone(await self.cache.get(self.tools))
+
+        self.caches.create.assert_awaited_once()
+
+    async def test_aclose_deletes_caches(self):
+        await self.cache.get(self.tools)
+        await self.cache.aclose()
+
+        self.caches.delete.assert_awaited_once_with(name="cachedContents/abc")
+        self.MockClient.return_value.aio.aclose.assert_awaited_once()
+
+    def test_system_prompt_includes_memory_instructions(self):
+        prompt = build_system_prompt("Be helpful.")
+        self.assertTrue(prompt.startswith("Be helpful.\n\n"))
+        self.assertIn("MEMORY CAPABILITIES", prompt)
+
+
+class TestSummarization(unittest.IsolatedAsyncioTestCase):
+    def test_images_are_counted_at_a_flat_rate(self):
+        image = {
+            "type": "image_url",
+            "image_url": "data:image/png;base64," + "A" * 100000,
+        }
+        with_image = HumanMessage(content=[{"type": "text", "text": "hi"}, image])
+        text_only = HumanMessage(content=[{"type": "text", "text": "hi"}])
+
+        self.assertEqual(
+            count_message_tokens([with_image]) - count_message_tokens([text_only]), 258
+        )
+
+    def test_budget_is_measured_in_tokens(self):
+        chatter = [HumanMessage("hi"), AIMessage("hey")] * 10
+        self.assertFalse(needs_summary(chatter, token_budget=1000))
+
+        big_tool_output = [
+            HumanMessage("look this up"),
+            AIMessage("", tool_calls=[{"name": "t", "args": {}, "id": "1"}]),
+            ToolMessage("x" * 20000, tool_call_id="1"),
+            AIMessage("done"),
+        ]
+        self.assertTrue(needs_summary(big_tool_output, token_budget=1000))
+
+    async def test_incremental_summary_keeps_whole_turns(self):
+        messages = [
+            HumanMessage("old question", id="1"),
+            AIMessage("old answer", id="2"),
+            HumanMessage("look this up", id="3"),
+            AIMessage("", id="4", tool_calls=[{"name": "t", "args": {}, "id": "c"}]),
+            ToolMessage("y" * 20000, id="5", tool_call_id="c"),
+            AIMessage("found it", id="6"),
+            HumanMessage("thanks", id="7"),
+            AIMessage("welcome", id="8"),
+        ]
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(return_value=AIMessage("new summary"))
+        update = await summarize_messages(
+            llm,
+            {"messages": messages, "summary": "earlier facts"},
+            token_budget=1000,
+            keep_tokens=2000,
+        )
+
+        # The split lands on a human turn, so the tool result goes with its call
+        self.assertEqual(
+            [m.id for m in update["messages"]], ["1", "2", "3", "4", "5", "6"]
+        )
+        self.assertEqual(update["summary"], "new summary")
+        prompt = llm.ainvoke.call_args[0][0][0].content
+        self.assertIn("earlier facts", prompt)
+        self.assertIn("old question", prompt)
+        self.assertNotIn("welcome", prompt)
+        self.assertIn("[truncated]", prompt)
+        self.assertLess(len(prompt), 20000)
+
+    async def test_within_budget_is_a_no_op(self):
+        llm = GenericFakeChatModel(messages=iter([]))
+        update = await summarize_messages(
+            llm, {"messages": [HumanMessage("hi"), AIMessage("hey")]}
+        )
+        self.assertEqual(update, {})
+
+
+class TestImagePipeline(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def attachment(data, content_type="image/png", attachment_id=None):
+        mock_attachment = MagicMock(spec=discord.Attachment)
+        mock_attachment.id = attachment_id or id(mock_attachment)
+        mock_attachment.filename = "image"
+        mock_attachment.content_type = content_type
+        mock_attachment.size = len(data)
+        mock_attachment.read = AsyncMock(return_value=data)
+        return mock_attachment
+
+    @staticmethod
+    def png(width, height):
+        output = io.BytesIO()
+        Image.effect_noise((width, height), 64).convert("RGB").save(output, "PNG")
+        return output.getvalue()
+
+    async def test_large_images_are_downscaled(self):
+        pipeline = ImagePipeline()
+        original = self.png(3000, 2000)
+        images = await pipeline.read([self.attachment(original)])
+
+        data, content_type = images[0]
+        self.assertEqual(content_type, "image/jpeg")
+        self.assertLess(len(data), len(original))
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.size, (1536, 1024))
+
+    async def test_exif_orientation_is_applied(self):
+        pipeline = ImagePipeline()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        output = io.BytesIO()
+        Image.effect_noise((4000, 3000), 64).convert("RGB").save(
+            output, "JPEG", exif=exif
+        )
+        images = await pipeline.read([self.attachment(output.getvalue(), "image/jpeg")])
+
+        data, content_type = images[0]
+        self.assertEqual(content_type, "image/jpeg")
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.size, (1152, 1536))
+            self.assertNotIn(0x0112, image.getexif())
+
+    async def test_duplicates_and_oversized_images_are_dropped(self):
+        pipeline = ImagePipeline(max_bytes=100)
+        same = b"same image bytes"
+        duplicate_upload = self.attachment(same)
+        oversized = self.attachment(b"x" * 101)
+        text = self.attachment(b"notes", content_type="text/plain")
+        reposted = self.attachment(same, content_type="image/jpeg")
+
+        images = await pipeline.read([duplicate_upload, oversized, text, reposted])
+
+        self.assertEqual(images, [(same, "image/png")])
+        oversized.read.assert_not_called()
+        text.read.assert_not_called()
+
+    async def test_same_attachment_is_downloaded_once(self):
+        pipeline = ImagePipeline()
+        attachment = self.attachment(b"bytes", attachment_id=42)
+
+        images = await pipeline.read([attachment, attachment])
+
+        self.assertEqual(len(images), 1)
+        attachment.read.assert_awaited_once()
+
+    async def test_processed_images_are_reused(self):
+        pipeline = ImagePipeline()
+        original = b"large image bytes"
+        with patch(
+            "pydiscogs.cogs.ai.images.prepare_image", return_value=(b"small", "x")
+        ) as prepare:
+            await pipeline.read([self.attachment(original)])
+            images = await pipeline.read([self.attachment(original)])
+
+        prepare.assert_called_once()
+        self.assertEqual(images, [(b"small", "x")])
+
+
+class TestMemoryRetrieval(unittest.IsolatedAsyncioTestCase):
+    async def test_retrieve_memories_single_batch_ranked(self):
+        def item(key, data, score):
+            mock_item = MagicMock()
+            mock_item.key = key
+            mock_item.value = {"data": data}
+            mock_item.score = score
+            return mock_item
+
+        store = MagicMock()
+        store.abatch = AsyncMock(
+            return_value=[
+                [item("lang", "Python", 0.5)],
+                [item("server_ip", "10.0.0.50", 0.9)],
+                [item("topic", "gaming", 0.7)],
+            ]
+        )
+
+        memories = await retrieve_memories(store, "query", "u1", "g1", "c1")
+
+        store.abatch.assert_awaited_once()
+        ops = store.abatch.call_args[0][0]
+        self.assertEqual(
+            [op.namespace_prefix for op in ops],
+            [("u1", "memories"), ("g1", "memories"), ("c1", "memories")],
+        )
+        self.assertTrue(all(op.query == "query" for op in ops))
+        self.assertEqual(
+            memories,
+            [
+                "[Guild] server_ip: 10.0.0.50",
+                "[Channel] topic: gaming",
+                "[User] lang: Python",
+            ],
+        )
+
+    async def test_retrieve_memories_skips_missing_scopes(self):
+        store = MagicMock()
+        store.abatch = AsyncMock(return_value=[[]])
+
+        memories = await retrieve_memories(store, "query", "u1")
+
+        ops = store.abatch.call_args[0][0]
+        self.assertEqual(len(ops), 1)
+        self.assertEqual(memories, [])
+
+    @patch(
+        "pydiscogs.cogs.ai.cog.GoogleGenerativeAIEmbeddings.aembed_documents",
+        new_callable=AsyncMock,
+    )
+    async def test_embeddings_dedupe_identical_texts(self, mock_aembed_documents):
+        mock_aembed_documents.return_value = [[0.1], [0.2]]
+        embeddings = GoogleGenerativeAIEmbeddingsWithDims(
+            model="models/gemini-embedding-001", google_api_key="test_key"
+        )
+
+        vectors = await embeddings.aembed_documents(["a", "b", "a"])
+
+        mock_aembed_documents.assert_awaited_once_with(
+            ["a", "b"], output_dimensionality=768
+        )
+        self.assertEqual(vectors, [[0.1], [0.2], [0.1]])
+
+
+class TestEmbeddingCache(unittest.IsolatedAsyncioTestCase):
+    def test_lru_eviction_and_stats(self):
+        cache = EmbeddingCache(max_entries=2)
+        cache.put_many({"a": [1.0], "b": [2.0]})
+        cache.get_many(["a"])  # a is now most recently used
+        cache.put_many({"c": [3.0]})
+
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": [1.0], "c": [3.0]})
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.stats()["hit_rate"], 0.75)
+
+    def test_key_depends_on_model_dims_and_task(self):
+        key = EmbeddingCache.make_key("model", 768, "query", "text")
+        self.assertEqual(key, EmbeddingCache.make_key("model", 768, "query", "text"))
+        self.assertNotEqual(key, EmbeddingCache.make_key("other", 768, "query", "text"))
+        self.assertNotEqual(key, EmbeddingCache.make_key("model", 256, "query", "text"))
+        self.assertNotEqual(
+            key, EmbeddingCache.make_key("model", 768, "document", "text")
+        )
+
+    @patch(
+        "pydiscogs.cogs.ai.cog.GoogleGenerativeAIEmbeddings.aembed_query",
+        new_callable=AsyncMock,
+    )
+    async def test_cached_embeddings_skip_api(self, mock_aembed_query):
+        mock_aembed_query.return_value = [0.5]
+        cache = EmbeddingCache()
+        embeddings = GoogleGenerativeAIEmbeddingsWithDims(
+            model="models/gemini-embedding-001", google_api_key="test_key", cache=cache
+        )
+
+        first = await embeddings.aembed_query("what is SPY at")
+        second = await embeddings.aembed_query("what is SPY at")
+
+        self.assertEqual(first, [0.5])
+        self.assertEqual(second, [0.5])
+        mock_aembed_query.assert_awaited_once_with(
+            "what is SPY at", output_dimensionality=768
+        )
+        self.assertEqual(cache.hits, 1)
+
+    async def test_unused_rows_are_pruned_periodically(self):
+        conn = MagicMock()
+        conn.execute = AsyncMock(return_value=MagicMock(rowcount=3))
+        cursor = MagicMock()
+        cursor.executemany = AsyncMock()
+        conn.cursor.return_value.__aenter__.return_value = cursor
+        pool = MagicMock()
+        pool.connection.return_value.__aenter__.return_value = conn
+        cache = EmbeddingCache(pool=pool, max_age_days=7, prune_interval=3600)
+
+        await cache.setup()
+        prunes = [c for c in conn.execute.call_args_list if "DELETE" in c.args[0]]
+        self.assertEqual(len(prunes), 1)
+        self.assertEqual(prunes[0].args[1], (7,))
+        self.assertEqual(cache.stats()["pruned"], 3)
+
+        # Writes touch last_used_at and do not prune again within the interval
+        await cache.aput_many({"a": [1.0]})
+        self.assertIn("last_used_at = NOW()", cursor.executemany.call_args.args[0])
+        prunes = [c for c in conn.execute.call_args_list if "DELETE" in c.args[0]]
+        self.assertEqual(len(prunes), 1)
+
+        later = time.monotonic() + 3601
+        with patch("pydiscogs.cogs.ai.embedding_cache.time.monotonic") as monotonic:
+            monotonic.return_value = later
+            await cache.aput_many({"b": [2.0]})
+        prunes = [c for c in conn.execute.call_args_list if "DELETE" in c.args[0]]
+        self.assertEqual(len(prunes), 2)
+
+
+class TestAnswerCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        vectors = {
+            "what's spy at": [1.0, 0.0],
+            "what is spy at": [0.99, 0.1],
+            "what is qqq at": [0.6, 0.8],
+        }
+        self.embeddings = MagicMock()
+        self.embeddings.aembed_query = AsyncMock(side_effect=vectors.get)
+
+    async def test_similar_question_in_scope_hits(self):
+        cache = AnswerCache(self.embeddings, threshold=0.95)
+        answer, vector = await cache.lookup("What's SPY at", ("guild", "channel"))
+        self.assertIsNone(answer)
+        cache.put(("guild", "channel"), "What's SPY at", vector, "About 500")
+
+        answer, _ = await cache.lookup("what is  SPY at", ("guild", "channel"))
+        self.assertEqual(answer, "About 500")
+        answer, _ = await cache.lookup("what is QQQ at", ("guild", "channel"))
+        self.assertIsNone(answer)
+        answer, _ = await cache.lookup("what is SPY at", ("guild", "other"))
+        self.assertIsNone(answer)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    async def test_expiry_eviction_and_embedding_errors(self):
+        cache = AnswerCache(self.embeddings, ttl=60, max_entries=1)
+        scope = ("guild", "channel")
+        _, vector = await cache.lookup("what's SPY at", scope)
+        cache.put(scope, "what's SPY at", vector, "About 500")
+
+        later = time.monotonic() + 61
+        with patch("pydiscogs.cogs.ai.answer_cache.time.monotonic") as clock:
+            clock.return_value = later
+            answer, _ = await cache.lookup("what's SPY at", scope)
+        self.assertIsNone(answer)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+        cache.put(scope, "what's SPY at", vector, "About 500")
+        cache.put(scope, "what is QQQ at", vector, "About 400")
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.evict(scope), 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+        self.embeddings.aembed_query.side_effect = Exception("quota")
+        self.assertEqual(await cache.lookup("anything", scope), (None, None))
+        self.assertEqual(cache.stats()["errors"], 1)
+
+    async def test_stats_are_logged_periodically(self):
+        cache = AnswerCache(self.embeddings, stats_interval=2)
+        with patch("pydiscogs.cogs.ai.answer_cache.logger") as logger:
+            for _ in range(4):
+                await cache.lookup("what is QQQ at", ("guild", "channel"))
+        stats = [c.args[0] for c in logger.info.call_args_list]
+        self.assertEqual(len(stats), 2)
+        self.assertIn("'misses': 4", stats[-1])
+
+    async def test_ai_answer_cache_command(self):
+        ai_cog = AI(bot=MagicMock())
+        cache = AnswerCache(self.embeddings)
+        ai_cog.ai_handler.answer_cache = cache
+        _, vector = await cache.lookup("what's SPY at", ("1", "2"))
+        cache.put(("1", "2"), "what's SPY at", vector, "About 500")
+        cache.put(("1", "3"), "what's SPY at", vector, "About 500")
+        ctx = MagicMock(spec=discord.ApplicationContext)
+        ctx.respond = AsyncMock()
+        ctx.guild_id = 1
+        ctx.channel_id = 2
+
+        await ai_cog.ai_answer_cache(ai_cog, ctx)
+        self.assertIn("2 answers cached", ctx.respond.call_args.args[0])
+
+        await ai_cog.ai_answer_cache(ai_cog, ctx, clear=True)
+        response = ctx.respond.call_args.args[0]
+        self.assertIn("Cleared 1 cached answers", response)
+        self.assertIn("1 answers cached", response)
+        self.assertEqual(ctx.respond.call_args.kwargs, {"ephemeral": True})
+
+        ai_cog.ai_handler.answer_cache = None
+        await ai_cog.ai_answer_cache(ai_cog, ctx, clear=True)
+        self.assertEqual(ctx.respond.call_args.args[0], "The answer cache is off.")
+
+
+class TestReplyRootIndex(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def mock_pool(rows=()):
+        conn = MagicMock()
+        cursor = MagicMock()
+        cursor.fetchall = AsyncMock(return_value=list(rows))
+        conn.execute = AsyncMock(return_value=cursor)
+        conn.cursor.return_value.__aenter__.return_value.executemany = AsyncMock()
+        pool = MagicMock()
+        pool.connection.return_value.__aenter__.return_value = conn
+        return pool, conn
+
+    async def test_lru_eviction(self):
+        index = ReplyRootIndex(max_entries=2)
+        await index.put_many({"a": "root", "b": "root"})
+        index.peek("a")  # a is now most recently used
+        await index.put_many({"c": "root"})
+
+        self.assertEqual(index.peek("a"), "root")
+        self.assertIsNone(index.peek("b"))
+
+    async def test_falls_back_to_postgres(self):
+        pool, conn = self.mock_pool(rows=[("child", "root")])
+        index = ReplyRootIndex(pool=pool)
+
+        self.assertEqual(await index.get("child"), "root")
+        self.assertEqual(await index.get("child"), "root")
+
+        conn.execute.assert_awaited_once()
+        self.assertEqual(index.peek("child"), "root")
+
+    async def test_put_many_writes_through(self):
+        pool, conn = self.mock_pool()
+        index = ReplyRootIndex(pool=pool)
+
+        await index.put_many({"child": "root"})
+
+        executemany = conn.cursor.return_value.__aenter__.return_value.executemany
+        self.assertEqual(executemany.call_args[0][1], [("child", "root")])
+
+    async def test_record_only_indexes_known_chains(self):
+        index = ReplyRootIndex()
+        await index.put_many({"1": "1"})
+
+        known = MagicMock()
+        known.id = 2
+        known.reference.message_id = 1
+        unknown = MagicMock()
+        unknown.id = 3
+        unknown.reference.message_id = 99
+
+        index.record(known)
+        index.record(unknown)
+
+        self.assertEqual(index.peek("2"), "1")
+        self.assertIsNone(index.peek("3"))
+
+    async def test_record_writes_in_the_background(self):
+        pool, conn = self.mock_pool()
+        index = ReplyRootIndex(pool=pool)
+        index._remember({"1": "1"})
+        executemany = conn.cursor.return_value.__aenter__.return_value.executemany
+
+        known = MagicMock()
+        known.id = 2
+        known.reference.message_id = 1
+        index.record(known)
+
+        self.assertEqual(index.peek("2"), "1")
+        executemany.assert_not_called()
+        await asyncio.sleep(0)
+        self.assertEqual(executemany.call_args[0][1], [("2", "1")])
+
+    async def test_indexed_chain_skips_fetches(self):
+        bot = MagicMock()
+        bot.user.id = 456
+        ai_cog = AI(bot=bot)
+
+        root = MagicMock(spec=discord.Message)
+        root.id = 100
+        root.reference = None
+        self.assertEqual(await ai_cog._get_root_message(root), "100")
+
+        # The bot's reply to the root is indexed as it comes through on_message
+        bot_reply = MagicMock(spec=discord.Message)
+        bot_reply.id = 101
+        bot_reply.author.id = 456
+        bot_reply.reference = MagicMock()
+        bot_reply.reference.message_id = 100
+        await ai_cog.on_message(bot_reply)
+
+        follow_up = MagicMock(spec=discord.Message)
+        follow_up.id = 102
+        follow_up.reference = MagicMock()
+        follow_up.reference.message_id = 101
+        follow_up.reference.cached_message = None
+
+        self.assertEqual(await ai_cog._get_root_message(follow_up), "100")
+        bot.get_channel.assert_not_called()
+        self.assertEqual(ai_cog.reply_index.peek("102"), "100")
+
+    async def test_failed_walk_is_not_indexed(self):
+        bot = MagicMock()
+        ai_cog = AI(bot=bot)
+        parent = MagicMock(spec=discord.Message)
+        parent.id = 201
+        parent.reference = MagicMock()
+        parent.reference.message_id = 200
+        parent.reference.cached_message = None
+        reply = MagicMock(spec=discord.Message)
+        reply.id = 202
+        reply.reference = MagicMock()
+        reply.reference.message_id = 201
+        reply.reference.cached_message = parent
+        bot.get_channel.return_value.fetch_message = AsyncMock(
+            side_effect=discord.HTTPException(MagicMock(status=503), "unavailable")
+        )
+
+        # The fallback root is used for this call only
+        self.assertEqual(await ai_cog._get_root_message(reply), "200")
+        self.assertIsNone(ai_cog.reply_index.peek("201"))
+        self.assertIsNone(ai_cog.reply_index.peek("202"))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("pydiscogs.cogs.ai.circuit_breaker.time.monotonic")
+        self.clock = patcher.start()
+        self.clock.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+    def test_opens_on_failure_rate_and_probes_when_half_open(self):
+        breaker = CircuitBreaker("google", min_calls=4, open_seconds=30)
+        breaker.record_success(1.0)
+        breaker.record_success(1.0)
+        breaker.record_failure(Exception("429"))
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure(Exception("500"))
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow_request())
+
+        self.clock.return_value += 30
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())  # One probe at a time
+
+        breaker.record_success(1.0)
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("groq", min_calls=1, open_seconds=30)
+        breaker.record_failure()
+        self.clock.return_value += 30
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker("ollama", min_calls=2, slow_call_seconds=5)
+        breaker.record_success(10.0)
+        breaker.record_success(12.0)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.latency_ewma, 10.4)
+
+    def test_rank_prefers_healthy_providers_in_order(self):
+        breakers = {
+            name: CircuitBreaker(name, min_calls=4, slow_call_seconds=10)
+            for name in ("google", "ollama", "groq")
+        }
+        self.assertEqual(rank_providers(breakers), ["google", "ollama", "groq"])
+
+        breakers["google"].record_success(8.0)  # Degraded but still closed
+        self.assertEqual(rank_providers(breakers), ["ollama", "groq", "google"])
+
+        for _ in range(4):
+            breakers["ollama"].record_failure()
+        self.assertEqual(rank_providers(breakers), ["groq", "google"])
+
+
+class TestRequestHedger(unittest.IsolatedAsyncioTestCase):
+    async def test_fast_call_is_not_hedged(self):
+        pick_fallback = MagicMock()
+        hedger = RequestHedger(pick_fallback, default_delay=1)
+
+        async def call(on_token):
+            return "primary"
+
+        response = await hedger.race("google", call, AsyncMock())
+
+        self.assertEqual(response, "primary")
+        pick_fallback.assert_not_called()
+        self.assertEqual(hedger.stats()["hedged"], 0)
+
+    async def test_slow_call_is_hedged_and_cancelled(self):
+        fallback_health = MagicMock()
+        hedger = RequestHedger(
+            MagicMock(return_value=("groq", "groq_llm", fallback_health)),
+            default_delay=0.01,
+        )
+        cancelled = asyncio.Event()
+
+        async def call(on_token):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        fallback_call = AsyncMock(return_value="hedge")
+        response = await hedger.race("google", call, fallback_call)
+        await asyncio.sleep(0)
+
+        self.assertEqual(response, "hedge")
+        fallback_call.assert_awaited_once_with("groq_llm", fallback_health)
+        self.assertTrue(cancelled.is_set())
+        stats = hedger.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+        self.assertEqual(stats["hedge_win_rate"], 1.0)
+
+    async def test_first_token_within_delay_is_not_hedged(self):
+        pick_fallback = MagicMock()
+        hedger = RequestHedger(pick_fallback, default_delay=0.01)
+
+        async def call(on_token):
+            on_token()
+            await asyncio.sleep(0.05)
+            return "streamed"
+
+        response = await hedger.race("google", call, AsyncMock())
+
+        self.assertEqual(response, "streamed")
+        pick_fallback.assert_not_called()
+
+    async def test_failed_hedge_waits_for_primary(self):
+        hedger = RequestHedger(
+            MagicMock(return_value=("groq", "groq_llm", None)), default_delay=0.01
+        )
+
+        async def call(on_token):
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        fallback_call = AsyncMock(side_effect=Exception("429"))
+        response = await hedger.race("google", call, fallback_call)
+
+        self.assertEqual(response, "primary")
+        self.assertEqual(hedger.stats()["hedge_wins"], 0)
+
+    def test_delay_tracks_percentile_latency(self):
+        hedger = RequestHedger(MagicMock(), default_delay=8, min_samples=20)
+        for seconds in range(1, 20):
+            hedger.record("google", seconds)
+        self.assertEqual(hedger.delay("google"), 8)
+
+        hedger.record("google", 20)
+        self.assertEqual(hedger.delay("google"), 20)
+        for seconds in range(20):
+            hedger.record("google", 2)
+        self.assertEqual(hedger.delay("google"), 19)
+
+
+class TestAIRequestScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_same_thread_runs_in_order(self):
+        scheduler = AIRequestScheduler(max_concurrency=4)
+        order = []
+
+        async def work(name, delay):
+            async with scheduler.slot("thread"):
+                order.append(f"{name}-start")
+                await asyncio.sleep(delay)
+                order.append(f"{name}-end")
+
+        await asyncio.gather(work("a", 0.05), work("b", 0))
+        self.assertEqual(order, ["a-start", "a-end", "b-start", "b-end"])
+        self.assertEqual(scheduler._thread_locks, {})
+
+    async def test_global_concurrency_cap_and_queue_position(self):
+        scheduler = AIRequestScheduler(max_concurrency=1)
+        on_queued = AsyncMock()
+        release = asyncio.Event()
+
+        async def first():
+            async with scheduler.slot("thread-1"):
+                await release.wait()
+
+        async def second():
+            async with scheduler.slot("thread-2", on_queued=on_queued):
+                self.assertEqual(scheduler.running, 1)
+
+        first_task = asyncio.create_task(first())
+        await asyncio.sleep(0)
+        second_task = asyncio.create_task(second())
+        await asyncio.sleep(0)
+
+        on_queued.assert_awaited_once_with(1)
+        self.assertEqual(scheduler.waiting, 1)
+        release.set()
+        await asyncio.gather(first_task, second_task)
+        self.assertEqual(scheduler.waiting, 0)
+        self.assertEqual(scheduler.running, 0)
+
+    async def test_queue_full(self):
+        scheduler = AIRequestScheduler(max_concurrency=1, max_queue_depth=0)
+        with self.assertRaises(AIQueueFullError):
+            async with scheduler.slot("thread"):
+                pass
+
+
 class TestAIReplyModal(unittest.IsolatedAsyncioTestCase):
     @patch("pydiscogs.cogs.ai.cog.AIReplyModal.add_item")
     @patch("discord.ui.Modal.__init__")
@@ -439,6 +1914,7 @@ class TestAIReplyModal(unittest.IsolatedAsyncioTestCase):
             user_id="12345",
             guild_id="67890",
             channel_id="98765",
+            on_queued=ANY,
         )
 
 
@@ -2,16 +2,42 @@
 Testing AI tools: web_research, url_context, and read_x_post
 """
 
+import asyncio
+import base64
+import contextlib
 import os
+import re
+import threading
+import time
 import unittest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
 
+import grpc
+from google.genai import types
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from pydiscogs.cogs.ai.tools.browser_pool import BrowserPool
+from pydiscogs.cogs.ai.tools.computer_control import (
+    BROWSER_RESET_NOTE,
+    ComputerControlTool,
+)
+from pydiscogs.cogs.ai.tools.playwright_computer import (
+    DOM_HASH_SCRIPT,
+    DOM_QUIET_MS,
+    DOM_SETTLE_SCRIPT,
+    FRAME_FINGERPRINT_SCRIPT,
+    PAGE_TEXT_SCRIPT,
+    PlaywrightComputer,
+)
 from pydiscogs.cogs.ai.tools.read_x_post import (
     Expansion,
     ReadXPostInput,
     ReadXPostTool,
     TweetField,
+    approx_tokens,
 )
+from pydiscogs.cogs.ai.tools.request_filter import RequestFilter
+from pydiscogs.cogs.ai.tools.result_cache import ToolResultCache
 from pydiscogs.cogs.ai.tools.url_context import UrlContextInput, UrlContextTool
 from pydiscogs.cogs.ai.tools.web_research import WebResearchTool, WebSearchInput
 from pydiscogs.cogs.ai.tools.xai_research import XResearchTool
@@ -34,7 +60,7 @@ class TestWebResearchTool(unittest.TestCase):
         self.assertEqual(tool.google_api_key, "test_api_key")
         self.assertEqual(tool.google_llm_model, "test_model")
 
-    @patch("pydiscogs.cogs.ai.tools.web_research.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
     def test_run_with_valid_query(self, mock_get_current_date, MockClient):
         """Test _run method with valid query and mocked Google client"""
@@ -62,7 +88,7 @@ class TestWebResearchTool(unittest.TestCase):
         self.assertEqual(call_args[1]["config"]["tools"], [{"google_search": {}}])
         self.assertEqual(call_args[1]["config"]["temperature"], 0)
 
-    @patch("pydiscogs.cogs.ai.tools.web_research.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
     def test_run_returns_response_text(self, mock_get_current_date, MockClient):
         """Test that _run returns the text property from the response"""
@@ -78,7 +104,7 @@ class TestWebResearchTool(unittest.TestCase):
 
         self.assertEqual(result, "Expected response text")
 
-    @patch("pydiscogs.cogs.ai.tools.web_research.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
     def test_run_with_api_error(self, mock_get_current_date, MockClient):
         """Test error handling when Google client raises an exception"""
@@ -96,6 +122,108 @@ class TestWebResearchTool(unittest.TestCase):
             tool._run(query="test query")
         self.assertIn("API Error", str(context.exception))
 
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
+    def test_run_uses_result_cache(self, mock_get_current_date, MockClient):
+        """Test that equivalent queries are served from the shared cache"""
+        mock_get_current_date.return_value = "2024-01-01"
+        mock_response = MagicMock()
+        mock_response.text = "Cached research"
+        MockClient.return_value.models.generate_content.return_value = mock_response
+
+        tool = WebResearchTool(
+            google_api_key="test_api_key",
+            google_llm_model="test_model",
+            result_cache=ToolResultCache(),
+        )
+        self.assertEqual(tool._run(query="Breaking News"), "Cached research")
+        self.assertEqual(tool._run(query="  breaking   news "), "Cached research")
+
+        MockClient.return_value.models.generate_content.assert_called_once()
+
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
+    def test_run_reuses_client(self, mock_get_current_date, MockClient):
+        """Test that the genai client is created once and reused"""
+        mock_get_current_date.return_value = "2024-01-01"
+        tool = WebResearchTool(
+            google_api_key="test_api_key", google_llm_model="test_model"
+        )
+        tool._run(query="first")
+        tool._run(query="second")
+
+        MockClient.assert_called_once_with(api_key="test_api_key")
+        self.assertEqual(MockClient.return_value.models.generate_content.call_count, 2)
+
+
+class TestWebResearchToolAsync(unittest.IsolatedAsyncioTestCase):
+    """Test cases for WebResearchTool's native async path"""
+
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
+    async def test_arun_uses_async_client(self, mock_get_current_date, MockClient):
+        mock_get_current_date.return_value = "2024-01-01"
+        mock_response = MagicMock()
+        mock_response.text = "Async research"
+        generate = AsyncMock(return_value=mock_response)
+        MockClient.return_value.aio.models.generate_content = generate
+
+        tool = WebResearchTool(
+            google_api_key="test_api_key", google_llm_model="test_model"
+        )
+        result = await tool._arun(query="test query")
+
+        self.assertEqual(result, "Async research")
+        MockClient.return_value.models.generate_content.assert_not_called()
+        self.assertEqual(generate.call_args[1]["model"], "test_model")
+        self.assertIn("test query", generate.call_args[1]["contents"])
+        self.assertEqual(
+            generate.call_args[1]["config"]["tools"], [{"google_search": {}}]
+        )
+
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    @patch("pydiscogs.cogs.ai.tools.web_research.get_current_date")
+    async def test_arun_shares_concurrent_requests(
+        self, mock_get_current_date, MockClient
+    ):
+        mock_get_current_date.return_value = "2024-01-01"
+        release = asyncio.Event()
+        mock_response = MagicMock()
+        mock_response.text = "Shared research"
+
+        async def generate_content(**kwargs):
+            await release.wait()
+            return mock_response
+
+        generate = AsyncMock(side_effect=generate_content)
+        MockClient.return_value.aio.models.generate_content = generate
+
+        tool = WebResearchTool(
+            google_api_key="test_api_key",
+            google_llm_model="test_model",
+            result_cache=ToolResultCache(),
+        )
+        tasks = [asyncio.create_task(tool._arun(query="hot topic")) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual(results, ["Shared research"] * 3)
+        generate.assert_called_once()
+
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    async def test_aclose_closes_client(self, MockClient):
+        MockClient.return_value.aio.aclose = AsyncMock()
+        tool = WebResearchTool(
+            google_api_key="test_api_key", google_llm_model="test_model"
+        )
+        tool._get_client()
+        await tool.aclose()
+
+        MockClient.return_value.aio.aclose.assert_awaited_once()
+        MockClient.return_value.close.assert_called_once()
+        self.assertIsNone(tool.genai_client)
+
 
 class TestUrlContextTool(unittest.TestCase):
     """Test cases for UrlContextTool"""
@@ -111,7 +239,7 @@ class TestUrlContextTool(unittest.TestCase):
         self.assertEqual(tool.google_api_key, "test_api_key")
         self.assertEqual(tool.google_llm_model, "test_model")
 
-    @patch("pydiscogs.cogs.ai.tools.url_context.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.url_context.get_current_date")
     def test_run_with_single_url(self, mock_get_current_date, MockClient):
         """Test _run with a single URL"""
@@ -129,7 +257,7 @@ class TestUrlContextTool(unittest.TestCase):
         call_args = MockClient.return_value.models.generate_content.call_args
         self.assertIn("https://example.com", call_args[1]["contents"])
 
-    @patch("pydiscogs.cogs.ai.tools.url_context.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.url_context.get_current_date")
     def test_run_with_multiple_urls(self, mock_get_current_date, MockClient):
         """Test _run with multiple URLs, verify they're joined correctly"""
@@ -150,7 +278,7 @@ class TestUrlContextTool(unittest.TestCase):
         for url in urls:
             self.assertIn(url, call_args[1]["contents"])
 
-    @patch("pydiscogs.cogs.ai.tools.url_context.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.url_context.get_current_date")
     def test_run_returns_response_text(self, mock_get_current_date, MockClient):
         """Test that _run returns the text property from the response"""
@@ -166,7 +294,7 @@ class TestUrlContextTool(unittest.TestCase):
 
         self.assertEqual(result, "Expected URL context response")
 
-    @patch("pydiscogs.cogs.ai.tools.url_context.Client")
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
     @patch("pydiscogs.cogs.ai.tools.url_context.get_current_date")
     def test_run_with_api_error(self, mock_get_current_date, MockClient):
         """Test error handling when Google client raises an exception"""
@@ -184,6 +312,662 @@ class TestUrlContextTool(unittest.TestCase):
             tool._run(urls=["https://example.com"], query="test query")
         self.assertIn("URL Context API Error", str(context.exception))
 
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    @patch("pydiscogs.cogs.ai.tools.url_context.get_current_date")
+    def test_run_uses_result_cache(self, mock_get_current_date, MockClient):
+        """Test that URL order does not defeat the cache"""
+        mock_get_current_date.return_value = "2024-01-01"
+        mock_response = MagicMock()
+        mock_response.text = "Cached comparison"
+        MockClient.return_value.models.generate_content.return_value = mock_response
+
+        tool = UrlContextTool(
+            google_api_key="test_api_key",
+            google_llm_model="test_model",
+            result_cache=ToolResultCache(),
+        )
+        urls = ["https://a.example.com", "https://b.example.com/"]
+        tool._run(urls=urls, query="compare")
+        result = tool._run(urls=list(reversed(urls)), query="compare")
+
+        self.assertEqual(result, "Cached comparison")
+        MockClient.return_value.models.generate_content.assert_called_once()
+
+
+class TestUrlContextToolAsync(unittest.IsolatedAsyncioTestCase):
+    """Test cases for UrlContextTool's native async path"""
+
+    @patch("pydiscogs.cogs.ai.tools.gemini_tool.Client")
+    @patch("pydiscogs.cogs.ai.tools.url_context.get_current_date")
+    async def test_arun_uses_async_client(self, mock_get_current_date, MockClient):
+        mock_get_current_date.return_value = "2024-01-01"
+        mock_response = MagicMock()
+        mock_response.text = "Async comparison"
+        generate = AsyncMock(return_value=mock_response)
+        MockClient.return_value.aio.models.generate_content = generate
+
+        tool = UrlContextTool(
+            google_api_key="test_api_key", google_llm_model="test_model"
+        )
+        result = await tool._arun(urls=["https://example.com"], query="summarize")
+
+        self.assertEqual(result, "Async comparison")
+        MockClient.assert_called_once_with(api_key="test_api_key")
+        self.assertIn("https://example.com", generate.call_args[1]["contents"])
+        self.assertEqual(
+            generate.call_args[1]["config"]["tools"], [{"url_context": {}}]
+        )
+
+
+class TestToolResultCache(unittest.TestCase):
+    """Test cases for ToolResultCache"""
+
+    def test_key_includes_tool_model_and_date(self):
+        key = ToolResultCache.make_key("web_research", "model", "q", date="d1")
+        self.assertNotEqual(
+            key, ToolResultCache.make_key("url_context", "model", "q", date="d1")
+        )
+        self.assertNotEqual(
+            key, ToolResultCache.make_key("web_research", "other", "q", date="d1")
+        )
+        self.assertNotEqual(
+            key, ToolResultCache.make_key("web_research", "model", "q", date="d2")
+        )
+
+    def test_entries_expire_after_ttl(self):
+        cache = ToolResultCache()
+        compute = MagicMock(side_effect=["first", "second"])
+
+        with patch("pydiscogs.cogs.ai.tools.result_cache.time.monotonic") as clock:
+            clock.return_value = 100.0
+            self.assertEqual(cache.get_or_compute("k", compute, ttl=10), "first")
+            clock.return_value = 105.0
+            self.assertEqual(cache.get_or_compute("k", compute, ttl=10), "first")
+            clock.return_value = 111.0
+            self.assertEqual(cache.get_or_compute("k", compute, ttl=10), "second")
+
+        self.assertEqual(compute.call_count, 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = ToolResultCache(max_entries=2)
+        cache.get_or_compute("a", lambda: "A", ttl=60)
+        cache.get_or_compute("b", lambda: "B", ttl=60)
+        cache.get_or_compute("a", lambda: "unused", ttl=60)
+        cache.get_or_compute("c", lambda: "C", ttl=60)
+
+        self.assertEqual(cache.get_or_compute("a", lambda: "new A", ttl=60), "A")
+        self.assertEqual(cache.get_or_compute("b", lambda: "new B", ttl=60), "new B")
+
+    def test_none_results_are_cached(self):
+        cache = ToolResultCache()
+        compute = MagicMock(return_value=None)
+
+        self.assertIsNone(cache.get_or_compute("k", compute, ttl=60))
+        self.assertIsNone(cache.get_or_compute("k", compute, ttl=60))
+        self.assertEqual(compute.call_count, 1)
+        missing = object()
+        self.assertIsNone(cache.get("k", missing))
+        self.assertIs(cache.get("other", missing), missing)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_errors_are_not_cached(self):
+        cache = ToolResultCache()
+        compute = MagicMock(side_effect=[Exception("API Error"), "ok"])
+
+        with self.assertRaises(Exception):
+            cache.get_or_compute("k", compute, ttl=60)
+        self.assertEqual(cache.get_or_compute("k", compute, ttl=60), "ok")
+
+    def test_concurrent_requests_share_one_call(self):
+        cache = ToolResultCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "shared"
+
+        results = []
+        owner = threading.Thread(
+            target=lambda: results.append(cache.get_or_compute("k", compute, ttl=60))
+        )
+        owner.start()
+        started.wait(5)
+        waiters = [
+            threading.Thread(
+                target=lambda: results.append(
+                    cache.get_or_compute("k", compute, ttl=60)
+                )
+            )
+            for _ in range(3)
+        ]
+        for waiter in waiters:
+            waiter.start()
+        release.set()
+        for thread in [owner, *waiters]:
+            thread.join(5)
+
+        self.assertEqual(results, ["shared"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class TestToolResultCacheAsync(unittest.IsolatedAsyncioTestCase):
+    """Test cases for ToolResultCache.aget_or_compute"""
+
+    async def test_waiter_takes_over_when_owner_is_cancelled(self):
+        cache = ToolResultCache()
+        started = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                await asyncio.sleep(60)
+            return "retried"
+
+        owner = asyncio.create_task(cache.aget_or_compute("k", compute, ttl=60))
+        await started.wait()
+        waiter = asyncio.create_task(cache.aget_or_compute("k", compute, ttl=60))
+        await asyncio.sleep(0)
+        owner.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await owner
+        self.assertEqual(await waiter, "retried")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(await cache.aget_or_compute("k", compute, ttl=60), "retried")
+
+
+class TestBrowserPool(unittest.IsolatedAsyncioTestCase):
+    """Test cases for BrowserPool"""
+
+    def setUp(self):
+        xvfb = patch("pydiscogs.cogs.ai.tools.browser_pool.Xvfb")
+        self.MockXvfb = xvfb.start()
+        self.addCleanup(xvfb.stop)
+        playwright = patch("pydiscogs.cogs.ai.tools.browser_pool.async_playwright")
+        mock_async_playwright = playwright.start()
+        self.addCleanup(playwright.stop)
+
+        self.playwright = MagicMock()
+        self.playwright.stop = AsyncMock()
+        mock_async_playwright.return_value.start = AsyncMock(
+            return_value=self.playwright
+        )
+        self.browser = MagicMock()
+        self.browser.is_connected.return_value = True
+        self.browser.close = AsyncMock()
+        self.browser.new_context = AsyncMock(side_effect=self._new_context)
+        self.playwright.chromium.launch = AsyncMock(return_value=self.browser)
+        self.contexts = []
+
+    def _new_context(self, **kwargs):
+        context = MagicMock()
+        page = MagicMock()
+        page.goto = AsyncMock()
+        context.pages = [page]
+        context.new_page = AsyncMock(return_value=page)
+        context.clear_cookies = AsyncMock()
+        context.clear_permissions = AsyncMock()
+        context.close = AsyncMock()
+        self.contexts.append(context)
+        return context
+
+    async def test_contexts_are_reset_and_reused(self):
+        pool = BrowserPool(max_size=2, warm_size=1)
+        async with pool.lease() as first:
+            pass
+        async with pool.lease() as second:
+            pass
+        await pool.close()
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.contexts), 1)
+        first.clear_cookies.assert_awaited()
+        first.pages[0].goto.assert_awaited_with("about:blank")
+        self.playwright.chromium.launch.assert_awaited_once()
+        self.MockXvfb.return_value.start.assert_called_once()
+        self.MockXvfb.return_value.stop.assert_called_once()
+        self.assertEqual(pool.stats()["reuses"], 2)
+
+    async def test_leases_queue_when_pool_is_exhausted(self):
+        pool = BrowserPool(max_size=1, warm_size=0)
+        released = asyncio.Event()
+        order = []
+
+        async def task(name):
+            async with pool.lease():
+                order.append(name)
+                await released.wait()
+
+        first = asyncio.create_task(task("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(task("second"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(order, ["first"])
+
+        released.set()
+        await asyncio.gather(first, second)
+        await pool.close()
+
+        self.assertEqual(order, ["first", "second"])
+        self.assertEqual(len(self.contexts), 1)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    async def test_idle_contexts_are_evicted(self):
+        on_close = MagicMock()
+        pool = BrowserPool(max_size=1, warm_size=1, idle_seconds=60, on_close=on_close)
+        await pool.start()
+        idle = self.contexts[0]
+
+        later = time.monotonic() + 61
+        with patch("pydiscogs.cogs.ai.tools.browser_pool.time.monotonic") as clock:
+            clock.return_value = later
+            async with pool.lease() as context:
+                pass
+        await pool.close()
+
+        idle.close.assert_awaited_once()
+        on_close.assert_any_call(idle)
+        self.assertIsNot(context, idle)
+
+    async def test_async_on_close_is_awaited(self):
+        on_close = AsyncMock()
+        pool = BrowserPool(max_size=1, warm_size=1, on_close=on_close)
+        await pool.start()
+        await pool.close()
+
+        on_close.assert_awaited_once_with(self.contexts[0])
+
+    async def test_context_that_fails_to_reset_is_discarded(self):
+        pool = BrowserPool(max_size=1, warm_size=0)
+        async with pool.lease() as context:
+            context.clear_cookies.side_effect = Exception("target closed")
+        async with pool.lease() as replacement:
+            pass
+        await pool.close()
+
+        context.close.assert_awaited_once()
+        self.assertIsNot(replacement, context)
+        self.assertEqual(pool.stats()["size"], 0)
+
+
+class TestPlaywrightComputer(unittest.IsolatedAsyncioTestCase):
+    """Test cases for PlaywrightComputer page settling and screenshots"""
+
+    def setUp(self):
+        self.page = MagicMock()
+        self.page.url = "https://example.com"
+        self.page.wait_for_load_state = AsyncMock()
+        self.page.screenshot = AsyncMock(side_effect=[b"first", b"second"])
+        self.page.mouse.click = AsyncMock()
+        self.page.keyboard.press = AsyncMock()
+        self.fingerprint = "100:1"
+        self.dom_hash = "100:1"
+        self.page_text = {"title": "Example", "lines": ["Hello (500, 40)"]}
+
+        async def evaluate(script, *args):
+            if script == FRAME_FINGERPRINT_SCRIPT:
+                return self.fingerprint
+            if script == DOM_HASH_SCRIPT:
+                return self.dom_hash
+            if script == PAGE_TEXT_SCRIPT:
+                return self.page_text
+            if "visualViewport" in script:
+                return [0, 300]
+            return None
+
+        self.page.evaluate = AsyncMock(side_effect=evaluate)
+        self.computer = PlaywrightComputer(screen_size=(1280, 936))
+        self.computer._page = self.page
+        PlaywrightComputer._text_cache.clear()
+
+    async def test_unchanged_frame_reuses_screenshot(self):
+        first = await self.computer.current_state()
+        second = await self.computer.current_state()
+        self.assertEqual(first.screenshot, b"first")
+        self.assertEqual(second.screenshot, b"first")
+
+        # Hover effects can change pixels without touching the DOM
+        third = await self.computer.click_at(10, 20)
+        self.assertEqual(third.screenshot, b"second")
+        self.assertEqual(self.computer.stats()["screenshots_reused"], 1)
+
+    async def test_unfingerprintable_frames_are_always_captured(self):
+        self.fingerprint = None
+        await self.computer.current_state()
+        await self.computer.current_state()
+        self.assertEqual(self.page.screenshot.await_count, 2)
+
+    async def test_settle_tolerates_busy_network(self):
+        self.page.wait_for_load_state.side_effect = [
+            PlaywrightTimeoutError("networkidle"),
+            None,
+        ]
+        state = await self.computer.current_state()
+        self.assertEqual(state.screenshot, b"first")
+        self.page.evaluate.assert_any_await(DOM_SETTLE_SCRIPT, [DOM_QUIET_MS, ANY])
+
+    async def test_quality_steps_down_to_fit_target(self):
+        computer = PlaywrightComputer(
+            screen_size=(1280, 936), target_screenshot_bytes=100
+        )
+        computer._page = self.page
+        self.page.screenshot.side_effect = lambda **kwargs: b"x" * (
+            kwargs["quality"] * 3
+        )
+
+        state = await computer.current_state()
+
+        self.assertEqual(len(state.screenshot), 90)
+        self.assertEqual(
+            [c.kwargs["quality"] for c in self.page.screenshot.await_args_list],
+            [50, 40, 30],
+        )
+        stats = computer.stats()
+        self.assertEqual(stats["jpeg_quality"], 30)
+        self.assertEqual(stats["bytes_per_action"], 90)
+
+    async def test_roi_crop_maps_coordinates_back_to_page(self):
+        computer = PlaywrightComputer(screen_size=(1280, 936), roi_size=(400, 300))
+        computer._page = self.page
+        self.page.screenshot.side_effect = None
+        self.page.screenshot.return_value = b"frame"
+
+        await computer.click_at(640, 468)
+        self.assertEqual(
+            self.page.screenshot.await_args.kwargs["clip"],
+            {"x": 440, "y": 318, "width": 400, "height": 300},
+        )
+
+        # The model picks the crop's top-left corner in full screen coordinates
+        await computer.click_at(0, 0)
+        self.page.mouse.click.assert_awaited_with(440, 318)
+
+        await computer.key_combination(["Enter"])
+        self.assertIsNone(self.page.screenshot.await_args.kwargs["clip"])
+
+    async def test_downscaled_capture_uses_devtools(self):
+        computer = PlaywrightComputer(screen_size=(1280, 936), screenshot_scale=0.5)
+        computer._page = self.page
+        computer._context = MagicMock()
+        cdp = computer._context.new_cdp_session = AsyncMock()
+        cdp.return_value.send = AsyncMock(
+            return_value={"data": base64.b64encode(b"small").decode()}
+        )
+
+        state = await computer.current_state()
+
+        self.assertEqual(state.screenshot, b"small")
+        self.page.screenshot.assert_not_awaited()
+        params = cdp.return_value.send.await_args.args[1]
+        self.assertEqual(
+            params["clip"],
+            {"x": 0, "y": 300, "width": 1280, "height": 936, "scale": 0.5},
+        )
+
+    async def test_page_text_is_cached_per_url_and_dom(self):
+        def extractions():
+            return [
+                c
+                for c in self.page.evaluate.await_args_list
+                if c.args[0] == PAGE_TEXT_SCRIPT
+            ]
+
+        text = await self.computer.page_text()
+        self.assertIn("Title: Example", text)
+        self.assertIn("Hello (500, 40)", text)
+
+        # Another computer on the same page reuses the observation
+        other = PlaywrightComputer(screen_size=(1280, 936))
+        other._page = self.page
+        self.assertEqual(await other.page_text(), text)
+        self.assertEqual(len(extractions()), 1)
+        self.assertEqual(other.stats()["text_cache_hits"], 1)
+
+        self.dom_hash = "100:2"
+        await self.computer.page_text()
+        self.assertEqual(len(extractions()), 2)
+        self.page.screenshot.assert_not_awaited()
+
+    async def test_page_text_is_size_bounded(self):
+        self.page_text["lines"] = ["word " * 100] * 10
+        text = await self.computer.page_text(max_chars=300)
+        self.assertTrue(text.startswith("URL: https://example.com"))
+        self.assertIn("[truncated", text)
+        self.assertLess(len(text), 350)
+
+    async def test_text_observations_count_towards_settle_average(self):
+        await self.computer.page_text()
+        await self.computer.current_state()
+        self.computer.settle_seconds = 1.0
+
+        stats = self.computer.stats()
+        self.assertEqual(stats["text_observations"], 1)
+        self.assertEqual(stats["screenshots_taken"], 1)
+        self.assertEqual(stats["avg_settle_seconds"], 0.5)
+
+    async def test_leased_context_is_filtered_once(self):
+        context = MagicMock()
+        context.pages = [self.page]
+        context.route = AsyncMock()
+        self.page.set_viewport_size = AsyncMock()
+        computer = PlaywrightComputer(screen_size=(1280, 936), context=context)
+
+        await computer.attach()
+        await computer.attach()
+
+        # One route for tracker hosts and one for media and font files
+        self.assertEqual(context.route.await_count, 2)
+        self.assertEqual(computer.stats()["blocked"], 0)
+
+    async def test_attach_forgets_the_previous_task(self):
+        context = MagicMock()
+        context.pages = [self.page]
+        context.route = AsyncMock()
+        cdp = MagicMock(detach=AsyncMock())
+        self.page.set_viewport_size = AsyncMock()
+        computer = PlaywrightComputer(
+            screen_size=(1280, 936), context=context, roi_size=(400, 300)
+        )
+        computer._page = self.page
+        await computer.click_at(640, 468)
+        computer._cdp = cdp
+
+        await computer.attach()
+
+        cdp.detach.assert_awaited_once()
+        for name in (
+            "_cdp",
+            "_mouse",
+            "_roi_url",
+            "_last_clip",
+            "_last_fingerprint",
+            "_last_screenshot",
+        ):
+            self.assertIsNone(getattr(computer, name), name)
+        # The first frame of the new task is captured, not reused
+        state = await computer.current_state()
+        self.assertEqual(state.screenshot, b"second")
+        self.assertIsNone(self.page.screenshot.await_args.kwargs["clip"])
+
+
+class TestRequestFilter(unittest.IsolatedAsyncioTestCase):
+    """Test cases for RequestFilter"""
+
+    def _route(self, url, resource_type="script", navigation=False):
+        route = MagicMock()
+        route.request.url = url
+        route.request.resource_type = resource_type
+        route.request.is_navigation_request.return_value = navigation
+        route.request.frame.parent_frame = None
+        route.abort = AsyncMock()
+        route.continue_ = AsyncMock()
+        return route
+
+    async def test_blocks_trackers_and_heavy_resources(self):
+        request_filter = RequestFilter(allowed_domains=["fonts.example.com"])
+        blocked = [
+            self._route("https://securepubads.g.doubleclick.net/tag/js/gpt.js"),
+            self._route("https://cdn.example.com/intro.mp4", "media"),
+            self._route("https://cdn.example.com/font.woff2", "font"),
+        ]
+        allowed = [
+            self._route("https://example.com/", "document", navigation=True),
+            self._route("https://cdn.example.com/app.js"),
+            self._route("https://fonts.example.com/font.woff2", "font"),
+            # Opening a tracker's own page is the task's choice
+            self._route("https://www.taboola.com/", "document", navigation=True),
+        ]
+
+        for route in blocked + allowed:
+            await request_filter._handle(route)
+
+        for route in blocked:
+            route.abort.assert_awaited_once_with("blockedbyclient")
+        for route in allowed:
+            route.continue_.assert_awaited_once()
+            route.abort.assert_not_awaited()
+        self.assertEqual(
+            request_filter.stats(),
+            {
+                "requests": 7,
+                "blocked": 3,
+                "blocked_by": {"tracker": 1, "media": 1, "font": 1},
+            },
+        )
+
+        request_filter.reset()
+        self.assertEqual(request_filter.stats()["requests"], 0)
+
+    async def test_only_candidate_requests_are_routed(self):
+        context = MagicMock(route=AsyncMock())
+        await RequestFilter().install(context)
+        patterns = [c.args[0] for c in context.route.await_args_list]
+
+        def routed(url):
+            return any(pattern.search(url) for pattern in patterns)
+
+        self.assertTrue(routed("https://securepubads.g.doubleclick.net/tag/js/gpt.js"))
+        self.assertTrue(routed("https://www.google-analytics.com:443/g/collect"))
+        self.assertTrue(routed("https://cdn.example.com/intro.MP4?start=0"))
+        self.assertTrue(routed("https://cdn.example.com/font.woff2#v2"))
+        self.assertFalse(routed("https://example.com/"))
+        self.assertFalse(routed("https://cdn.example.com/app.js"))
+        self.assertFalse(routed("https://notdoubleclick.net/"))
+        self.assertFalse(routed("https://example.com/?next=doubleclick.net/"))
+        self.assertFalse(routed("https://example.com/intro.mp4.html"))
+
+    async def test_ad_frames_are_blocked(self):
+        route = self._route("https://ads.adnxs.com/frame", "document", navigation=True)
+        route.request.frame.parent_frame = MagicMock()
+        await RequestFilter()._handle(route)
+        route.abort.assert_awaited_once()
+
+
+class TestComputerControlTool(unittest.IsolatedAsyncioTestCase):
+    """Test cases for ComputerControlTool observation modes"""
+
+    def test_read_only_tasks_use_text(self):
+        tool = ComputerControlTool()
+        url = ["https://x.com/user/status/1"]
+        self.assertFalse(
+            tool._needs_vision("Summarize https://x.com/user/status/1", url)
+        )
+        self.assertTrue(tool._needs_vision("Click the login button on " + url[0], url))
+        self.assertTrue(tool._needs_vision("What's new on the front page?", []))
+        tool.observation = "vision"
+        self.assertTrue(tool._needs_vision("Summarize " + url[0], url))
+
+    def _tool(self, contexts):
+        """A tool whose pool leases the given contexts in turn."""
+        pool = MagicMock()
+        leases = iter(contexts)
+
+        @contextlib.asynccontextmanager
+        async def lease():
+            yield next(leases)
+
+        pool.lease = lease
+        return ComputerControlTool(browser_pool=pool)
+
+    @patch("pydiscogs.cogs.ai.tools.computer_control.Runner")
+    @patch("pydiscogs.cogs.ai.tools.computer_control.PlaywrightComputer")
+    async def test_text_mode_reads_pages_without_the_model(
+        self, MockComputer, MockRunner
+    ):
+        computer = MockComputer.return_value
+        computer.attach = AsyncMock()
+        computer.read_url = AsyncMock(return_value="URL: https://example.com/a")
+        tool = self._tool([MagicMock()])
+
+        result = await tool.ainvoke({"query": "Summarize https://example.com/a."})
+
+        self.assertEqual(result, "URL: https://example.com/a")
+        computer.attach.assert_awaited_once()
+        computer.read_url.assert_awaited_once_with("https://example.com/a", ANY)
+        MockRunner.return_value.run_async.assert_not_called()
+
+    @patch("pydiscogs.cogs.ai.tools.computer_control.Runner")
+    @patch("pydiscogs.cogs.ai.tools.computer_control.PlaywrightComputer")
+    async def test_runners_and_thread_sessions_are_reused(
+        self, MockComputer, MockRunner
+    ):
+        MockComputer.return_value.initialize = AsyncMock()
+        sessions = []
+        queries = []
+
+        async def run_async(new_message, session_id, user_id):
+            sessions.append(session_id)
+            queries.append(new_message.parts[0].text)
+            yield MagicMock(content=types.Content(parts=[types.Part(text="done")]))
+
+        MockRunner.return_value.run_async = run_async
+        context = MagicMock()
+        tool = self._tool([context, context, context, MagicMock()])
+        thread = {"configurable": {"thread_id": "thread-1"}}
+
+        first = await tool.ainvoke({"query": "Log in to the site"}, thread)
+        await tool.ainvoke({"query": "Now open settings"}, thread)
+        await tool.ainvoke({"query": "Open the news site"})
+        MockRunner.return_value.close = AsyncMock()
+        await tool._forget_context(context)
+        MockRunner.return_value.close.assert_awaited_once()
+        await tool.ainvoke({"query": "Open the menu"}, thread)
+
+        self.assertEqual(first, "done")
+        self.assertEqual(sessions[:2], ["thread-1", "thread-1"])
+        self.assertNotEqual(sessions[2], "thread-1")
+        self.assertEqual(sessions[3], "thread-1")
+        # Follow-ups are told the browser they left behind is gone
+        self.assertEqual(queries[0], "Log in to the site")
+        self.assertEqual(queries[1], f"{BROWSER_RESET_NOTE}\n\nNow open settings")
+        self.assertEqual(queries[2], "Open the news site")
+        self.assertTrue(queries[3].startswith(BROWSER_RESET_NOTE))
+        # One runner for the first context and one for its replacement
+        self.assertEqual(MockRunner.call_count, 2)
+        service = tool.session_service
+        self.assertIsNotNone(
+            await service.get_session(
+                app_name="agents", user_id="pydiscogs", session_id="thread-1"
+            )
+        )
+        # The untracked task's session is dropped when it ends
+        self.assertIsNone(
+            await service.get_session(
+                app_name="agents", user_id="pydiscogs", session_id=sessions[2]
+            )
+        )
+
+    def test_sync_calls_are_not_supported(self):
+        with self.assertRaises(NotImplementedError):
+            ComputerControlTool()._run("Summarize https://example.com")
+
 
 class TestReadXPostTool(unittest.TestCase):
     """Test cases for ReadXPostTool"""
@@ -323,6 +1107,123 @@ class TestReadXPostTool(unittest.TestCase):
         self.assertIn("Error reading X post", result)
         self.assertIn("X API Error", result)
 
+    @patch.dict(os.environ, {"X_BEARER_TOKEN": "test_bearer_token"})
+    @patch("pydiscogs.cogs.ai.tools.read_x_post.Client")
+    def test_run_batches_and_caches_posts(self, MockClient):
+        """Test several posts are read in one request and then served from cache"""
+        get_by_ids = MockClient.return_value.posts.get_by_ids
+
+        def respond(ids, **kwargs):
+            response = MagicMock()
+            response.data = [
+                {"id": post_id, "text": f"post {post_id}", "author_id": f"u{post_id}"}
+                for post_id in ids
+                if post_id != "404"
+            ]
+            response.includes.users = [
+                {"id": f"u{post_id}", "username": f"user{post_id}"} for post_id in ids
+            ]
+            response.includes.media = None
+            response.includes.polls = None
+            response.includes.places = None
+            return response
+
+        get_by_ids.side_effect = respond
+        tool = ReadXPostTool()
+
+        result = tool._run(
+            url_or_id="https://x.com/a/status/1, 2 https://x.com/b/status/1"
+        )
+
+        self.assertEqual(get_by_ids.call_args.kwargs["ids"], ["1", "2"])
+        first, second = result.split("\n\n=== X Post ===")
+        # Each post only gets its own author from the batch's includes
+        self.assertIn("@user1", first)
+        self.assertNotIn("@user2", first)
+        self.assertIn("@user2", second)
+
+        result = tool._run(url_or_id="2 404")
+        self.assertEqual(get_by_ids.call_args.kwargs["ids"], ["404"])
+        self.assertIn("post 2", result)
+        self.assertIn("No post found with ID 404", result)
+
+        tool._run(url_or_id="1 2")
+        self.assertEqual(get_by_ids.call_count, 2)
+        MockClient.assert_called_once()
+
+    @patch.dict(os.environ, {"X_BEARER_TOKEN": "test_bearer_token"})
+    @patch("pydiscogs.cogs.ai.tools.read_x_post.Client")
+    def test_run_splits_batches_at_request_limit(self, MockClient):
+        """Test more IDs than one request allows are fetched in several requests"""
+        get_by_ids = MockClient.return_value.posts.get_by_ids
+        get_by_ids.return_value.data = None
+        tool = ReadXPostTool()
+
+        tool._run(url_or_id=" ".join(str(i) for i in range(1, 151)))
+
+        self.assertEqual(
+            [len(c.kwargs["ids"]) for c in get_by_ids.call_args_list], [100, 50]
+        )
+
+    def test_format_post_data_cuts_long_articles(self):
+        """Test a long article is cut to head and tail extracts with a way to read on"""
+        tool = ReadXPostTool(max_post_tokens=300)
+        body = "".join(f"Sentence {i}. " for i in range(1000))
+        post = {"id": "1", "text": "Read this", "article": {"plain_text": body}}
+        mock_response = MagicMock()
+        mock_response.includes = None
+
+        result = tool._format_post_data(post, mock_response)
+
+        self.assertLessEqual(approx_tokens(result), 300)
+        self.assertIn("Sentence 0.", result)
+        self.assertIn("Sentence 999.", result)
+        self.assertIn("characters left out", result)
+        offset = int(re.search(r"article_offset=(\d+)", result).group(1))
+
+        more = tool._format_post_data(post, mock_response, article_offset=offset)
+        self.assertTrue(body[offset:].startswith(more.split("(extract) ---\n")[1][:50]))
+        self.assertNotIn("Sentence 999.", more)
+
+    def test_format_post_data_leaves_out_least_relevant_sections(self):
+        """Test sections are dropped from the least relevant end to fit the budget"""
+        tool = ReadXPostTool()
+        post = {
+            "id": "1",
+            "text": "Big news",
+            "public_metrics": {"like_count": 5},
+            "lang": "en",
+            "source": "Twitter Web App",
+            "entities": {"urls": [{"expanded_url": "https://example.com/story"}]},
+        }
+        mock_response = MagicMock()
+        mock_response.includes = None
+
+        result = tool._format_post_data(post, mock_response, max_tokens=40)
+
+        self.assertIn("Big news", result)
+        self.assertIn("https://example.com/story", result)
+        self.assertNotIn("Engagement Metrics", result)
+        self.assertNotIn("Language", result)
+        self.assertIn("Left out to save space: metadata, metrics", result)
+
+    @patch.dict(os.environ, {"X_BEARER_TOKEN": "test_bearer_token"})
+    @patch("pydiscogs.cogs.ai.tools.read_x_post.Client")
+    def test_run_shares_result_budget_between_posts(self, MockClient):
+        """Test several posts together stay within max_result_tokens"""
+        response = MagicMock()
+        response.data = [
+            {"id": str(i), "text": "x" * 2000, "lang": "en"} for i in range(1, 4)
+        ]
+        response.includes = None
+        MockClient.return_value.posts.get_by_ids.return_value = response
+        tool = ReadXPostTool(max_result_tokens=600)
+
+        result = tool._run(url_or_id="1 2 3")
+
+        self.assertLessEqual(approx_tokens(result), 600)
+        self.assertEqual(result.count("=== X Post ==="), 3)
+
     def test_format_post_data_basic(self):
         """Test _format_post_data with basic post data (text, ID, created_at)"""
         tool = ReadXPostTool()
@@ -592,6 +1493,146 @@ class TestXResearchTool(unittest.IsolatedAsyncioTestCase):
             result = await tool._arun("test query")
             self.assertEqual(result, "Grok Result")
 
+    def _mock_chat(self, MockClient, sample):
+        mock_chat = MagicMock()
+        mock_chat.sample = sample
+        MockClient.return_value.chat.create.return_value = mock_chat
+        MockClient.return_value.close = AsyncMock()
+        return mock_chat
+
+    async def test_arun_reuses_client(self):
+        """Test that one client is created and shared across calls"""
+        tool = XResearchTool(xai_api_key="test_key")
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            response = MagicMock()
+            response.content = "Grok Result"
+            self._mock_chat(MockClient, AsyncMock(return_value=response))
+
+            await tool._arun("first")
+            await tool._arun("second")
+
+            MockClient.assert_called_once_with(api_key="test_key")
+
+    @staticmethod
+    def _rpc_error(code):
+        error = grpc.RpcError(code.name)
+        error.code = MagicMock(return_value=code)
+        return error
+
+    async def test_arun_recreates_client_after_channel_error(self):
+        """Test that an UNAVAILABLE error closes the client and the next call replaces it"""
+        tool = XResearchTool(xai_api_key="test_key")
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            response = MagicMock()
+            response.content = "Grok Result"
+            error = self._rpc_error(grpc.StatusCode.UNAVAILABLE)
+            self._mock_chat(MockClient, AsyncMock(side_effect=[error, response]))
+
+            result = await tool._arun("first")
+            self.assertIn("Error performing X research", result)
+            MockClient.return_value.close.assert_awaited_once()
+            self.assertIsNone(tool.xai_client)
+
+            self.assertEqual(await tool._arun("second"), "Grok Result")
+            self.assertEqual(MockClient.call_count, 2)
+
+    async def test_arun_keeps_client_after_call_error(self):
+        """Test that an error about one call leaves the shared client in place"""
+        tool = XResearchTool(xai_api_key="test_key")
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            error = self._rpc_error(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            self._mock_chat(MockClient, AsyncMock(side_effect=error))
+
+            result = await tool._arun("first")
+            self.assertIn("Error performing X research", result)
+            MockClient.return_value.close.assert_not_awaited()
+            self.assertIs(tool.xai_client, MockClient.return_value)
+
+    async def test_retired_client_closes_after_in_flight_calls(self):
+        """Test that a client retired mid-call is closed only once its calls finish"""
+        tool = XResearchTool(xai_api_key="test_key")
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = 0
+
+        async def sample():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                started.set()
+                await release.wait()
+                response = MagicMock()
+                response.content = "Grok Result"
+                return response
+            raise self._rpc_error(grpc.StatusCode.UNAVAILABLE)
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            self._mock_chat(MockClient, AsyncMock(side_effect=sample))
+            slow = asyncio.create_task(tool._arun("slow"))
+            await started.wait()
+
+            self.assertIn("Error performing X research", await tool._arun("fails"))
+            self.assertIsNone(tool.xai_client)
+            MockClient.return_value.close.assert_not_awaited()
+
+            release.set()
+            self.assertEqual(await slow, "Grok Result")
+            MockClient.return_value.close.assert_awaited_once()
+
+    async def test_client_from_another_loop_is_closed(self):
+        """Test that a client created on a finished event loop is closed and replaced"""
+        tool = XResearchTool(xai_api_key="test_key")
+        old_client = MagicMock()
+        old_client.close = AsyncMock()
+        tool.xai_client = old_client
+        tool.client_loop = MagicMock(is_running=MagicMock(return_value=False))
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            self._mock_chat(MockClient, AsyncMock())
+            client = await tool._get_client()
+
+        old_client.close.assert_awaited_once()
+        self.assertIs(client, MockClient.return_value)
+        self.assertIs(tool.client_loop, asyncio.get_running_loop())
+
+    async def test_arun_limits_concurrent_samples(self):
+        """Test that in-flight samples never exceed max_concurrent_samples"""
+        tool = XResearchTool(xai_api_key="test_key", max_concurrent_samples=2)
+        in_flight = 0
+        peak = 0
+
+        async def sample():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            response = MagicMock()
+            response.content = "Grok Result"
+            return response
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            self._mock_chat(MockClient, AsyncMock(side_effect=sample))
+            results = await asyncio.gather(*[tool._arun(f"q{i}") for i in range(5)])
+
+        self.assertEqual(results, ["Grok Result"] * 5)
+        self.assertEqual(peak, 2)
+
+    async def test_aclose_closes_client(self):
+        """Test that aclose closes the shared client"""
+        tool = XResearchTool(xai_api_key="test_key")
+
+        with patch("pydiscogs.cogs.ai.tools.xai_research.AsyncClient") as MockClient:
+            self._mock_chat(MockClient, AsyncMock())
+            await tool._get_client()
+            await tool.aclose()
+
+            MockClient.return_value.close.assert_awaited_once()
+            self.assertIsNone(tool.xai_client)
+
 
 if __name__ == "__main__":
     unittest.main()
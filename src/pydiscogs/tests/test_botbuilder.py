@@ -8,6 +8,7 @@ import logging
 import unittest
 import warnings
 from unittest import IsolatedAsyncioTestCase
+from unittest.mock import MagicMock, patch
 
 from dotenv import load_dotenv
 from pydiscogs import botbuilder
@@ -51,6 +52,31 @@ class TestBotBuilder(IsolatedAsyncioTestCase):
         cog = self.bot.cogs.get("AI")
         self.assertTrue(isinstance(cog, AI))
 
+    def test_AI_stream_responses_property(self):
+        properties = {
+            "ollamaEndpoint": "x",
+            "ollamaLLMModel": "x",
+            "googleAPIKey": "x",
+            "googleLLMModel": "x",
+            "groqAPIKey": "x",
+            "groqLLMModel": "x",
+            "xaiAPIKey": "x",
+            "systemPrompt": "x",
+        }
+        cases = [(None, None), ("false", False), ("True", True), (True, True)]
+        for value, expected in cases:
+            with self.subTest(value=value), patch.object(botbuilder, "AI") as ai:
+                cog_properties = dict(properties)
+                if value is not None:
+                    cog_properties["streamResponses"] = value
+                botbuilder.add_ai_cog(MagicMock(), cog_properties)
+                kwargs = ai.call_args.kwargs
+                if expected is None:
+                    # Left to AI_STREAM_RESPONSES
+                    self.assertNotIn("stream_responses", kwargs)
+                else:
+                    self.assertEqual(kwargs["stream_responses"], expected)
+
 
 if __name__ == "__main__":
     unittest.main()